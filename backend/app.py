@@ -1,54 +1,296 @@
-from flask import Flask, request, render_template, jsonify
-from scripts.classifier import classify_with_retry, classify
-from scripts.resolver import resolve_issue
-from scripts.extractor import extract_ids, validate_ids
+from flask import Flask, Response, request, render_template, jsonify, g, has_request_context
+from scripts.classifier import classify_with_retry, classify, classify_extract_acknowledge
+from scripts.resolver import resolve_issue, resolve_issues_bulk
+from scripts.extractor import extract_ids, extract_all_ids, validate_ids
+from scripts.session_store import get_session_store, new_session_id, headless_session_id
+from scripts.chat_history import get_chat_history
+from scripts.canned_responses import get_canned_response, start_background_refresh
+from scripts.lookup_context import prefetch_lookups
+from scripts.id_index import start_id_index
+from scripts.warmup import warmup
+from scripts.llm_client import achat_completion, chat_completion, start_deadline, end_deadline
+from scripts.model_router import build_payload
+from scripts.metrics import CHAT_REQUEST_SECONDS, CHAT_REQUESTS, CHAT_STAGE_SECONDS, render_metrics, start_metrics_snapshots
+from scripts.usage_tracker import (
+    get_usage_tracker, start_usage_context, end_usage_context, update_usage_context, current_usage_context
+)
+from scripts.async_io import run_blocking
+from scripts.chat_interface import NeedInput, parse_user_input
+from scripts.screenshot_store import ScreenshotTooLarge, SCREENSHOT_MAX_UPLOAD_BYTES, screenshot_exists, store_screenshot
 import requests
+import hmac
 import re
+import sys
 import json
+import time
 import os # <-- Import os to get API key from environment variable
 
 app = Flask(__name__, static_folder='../static', template_folder='../templates')
 
-# AI assistant using LLaMA model
-API_URL = "https://api.groq.com/openai/v1/chat/completions"
-# Secure your API key by using an environment variable
-GROQ_API_KEY = ""
-HEADERS = {
-    "Authorization": f"Bearer {GROQ_API_KEY}",
-    "Content-Type": "application/json"
-}
-MODEL = "llama3-8b-8192"
+# AI assistant using LLaMA models: endpoint and GROQ_API_KEY live in scripts/llm_client.py,
+# the model per task (chat, acknowledge, user_email, ...) in scripts/model_router.py
+# One structured LLM call for label + IDs + acknowledgement instead of three
+STRUCTURED_OUTPUT = os.getenv("STRUCTURED_OUTPUT", "1") == "1"
+# Every LLM call made for one /chat request shares this budget; past it, replies come from templates.
+# Time spent waiting on SAP (scripts/email_handler.py wait_for_*) does not count.
+CHAT_DEADLINE_SECONDS = float(os.getenv("CHAT_DEADLINE_SECONDS", "60"))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")  # required as X-Admin-Token on /admin/*, which is closed while unset
+SESSION_COOKIE = "session_id"
+# A workflow paused for user input waits this long for the answer, and
+# re-asks at most this many times before the message is taken as a new issue.
+PENDING_INPUT_TTL_SECONDS = int(os.getenv("PENDING_INPUT_TTL_SECONDS", "900"))
+PENDING_INPUT_MAX_ATTEMPTS = int(os.getenv("PENDING_INPUT_MAX_ATTEMPTS", "3"))
+
+# scripts/resolver.py imports chat_with_ai and broadcast_print_output from
+# "app". Under `python app.py` this module is __main__, so register it by
+# name; otherwise the first workflow would import and start a second copy.
+sys.modules.setdefault("app", sys.modules[__name__])
+
+# Per-user state (conversation, print outputs) lives in the session store,
+# not in module globals, so several worker processes can serve the same
+# user. Chat turns go to the persistent, write-behind chat history.
+session_store = get_session_store()
+chat_history = get_chat_history()
+
+def start_worker_threads():
+    """
+    Start this worker's background threads (canned-response refresh, ID
+    index refresher, metrics snapshots). Called once per process after any fork: wsgi.py's
+    post_worker_init, asgi.py's lifespan startup and __main__ below. A
+    thread started at import would only run in the gunicorn master.
+    """
+    start_background_refresh()
+    start_id_index()
+    start_metrics_snapshots()
+
+def current_session_id() -> str:
+    """Session ID for the active request: cookie, then JSON body, else a fresh one."""
+    if not has_request_context():
+        return headless_session_id()
+    sid = getattr(g, "session_id", None)
+    if sid:
+        return sid
+    sid = request.cookies.get(SESSION_COOKIE)
+    if not sid and request.is_json:
+        sid = (request.get_json(silent=True) or {}).get("session_id")
+    g.session_id = sid or new_session_id()
+    return g.session_id
+
+def chat_with_ai(user_message: str, session_id: str = None, purpose: str = "chat", fallback: str = None) -> str:
+    """
+    Send a user turn with the session's conversation and record the reply.
+    `purpose` is the model router task (chat, acknowledge, user_email, sap_email).
 
-conversation = []
-chat_log = []
+    If the LLM cannot be used (over budget, past the request deadline,
+    provider failing or circuit open), `fallback` is used as the reply
+    instead; without a fallback the error is raised.
+    """
+    session_id = session_id or current_session_id()
+    conversation = session_store.load(session_id)["conversation"]
+    conversation.append({"role": "user", "content": user_message})
+    payload = build_payload(purpose, conversation)
+    try:
+        ai_message = chat_completion(payload, timeout=None, purpose=purpose)["choices"][0]["message"]["content"]
+    except requests.exceptions.RequestException as e:
+        if fallback is None:
+            raise
+        print(f"⚠️ LLM unavailable ({e}); replying from template")
+        ai_message = fallback
+    record_assistant_turn(user_message, ai_message, session_id)
+    return ai_message
 
-def chat_with_ai(user_message: str) -> str:
+async def achat_with_ai(user_message: str, session_id: str, purpose: str = "chat", fallback: str = None) -> str:
+    """chat_with_ai() for the asyncio core in asgi.py: the LLM wait is awaited, store writes run on the I/O pool."""
+    conversation = (await run_blocking(session_store.load, session_id))["conversation"]
     conversation.append({"role": "user", "content": user_message})
-    payload = {"model": MODEL, "messages": conversation, "temperature": 0.2}
-    response = requests.post(API_URL, headers=HEADERS, json=payload)
-    response.raise_for_status()
-    ai_message = response.json()["choices"][0]["message"]["content"]
-    conversation.append({"role": "assistant", "content": ai_message})
-    chat_log.append({"user": user_message, "bot": ai_message})
+    payload = build_payload(purpose, conversation)
+    try:
+        ai_message = (await achat_completion(payload, timeout=None, purpose=purpose))["choices"][0]["message"]["content"]
+    except requests.exceptions.RequestException as e:
+        if fallback is None:
+            raise
+        print(f"⚠️ LLM unavailable ({e}); replying from template")
+        ai_message = fallback
+    await run_blocking(record_assistant_turn, user_message, ai_message, session_id)
+    return ai_message
+
+def current_user_email():
+    """User email of the active Flask request, else of the usage context (asgi.py, headless work)."""
+    if has_request_context():
+        return getattr(g, "user_email", None)
+    return current_usage_context().get("user_email")
+
+def record_assistant_turn(user_message: str, ai_message: str, session_id: str = None):
+    """Add a turn produced outside chat_with_ai to the conversation and chat history."""
+    session_id = session_id or current_session_id()
+    def append_turn(state):
+        state["conversation"].append({"role": "user", "content": user_message})
+        state["conversation"].append({"role": "assistant", "content": ai_message})
+    session_store.update(session_id, append_turn)
+    chat_history.record(session_id, current_user_email(), user_message, ai_message)
+
+def canned_reply(state: str, session_id: str = None, **fields) -> str:
+    """Serve a fixed dialog turn from template variants and keep it in the conversation context."""
+    session_id = session_id or current_session_id()
+    ai_message = get_canned_response(state, **fields)
+    session_store.update(session_id, lambda s: s["conversation"].append({"role": "assistant", "content": ai_message}))
+    chat_history.record(session_id, current_user_email(), f"[{state}]", ai_message)
     return ai_message
 
+def broadcast_print_output(output: str, session_id: str = None):
+    """Hook picked up by resolver.resolve_issue to surface progress lines to the chat client."""
+    session_id = session_id or current_session_id()
+    session_store.update(session_id, lambda state: state["print_outputs"].append(output))
+
+def pop_print_outputs(session_id: str) -> list:
+    outputs = []
+    def drain(state):
+        outputs.extend(state["print_outputs"])
+        state["print_outputs"] = []
+    session_store.update(session_id, drain)
+    return outputs
+
+def park_workflow(session_id: str, scenario: str, all_ids: dict, user_email: str, need: NeedInput,
+                  attempts: int = 0, screenshot_ref: str = None) -> dict:
+    """Store a workflow paused by NeedInput in the session; it resumes on the user's next message."""
+    pending = {
+        "scenario": scenario,
+        "all_ids": all_ids,
+        "user_email": user_email,
+        "screenshot_ref": screenshot_ref,
+        "prompt": need.prompt,
+        "fields": list(need.fields),
+        "attempts": attempts,
+        "parked_at": time.time(),
+    }
+    session_store.update(session_id, lambda state: state.__setitem__("pending_input", pending))
+    return pending
+
+def take_pending_reply(session_id: str, user_message: str):
+    """
+    Match the user's message against the workflow parked in this session.
+
+    The workflow is removed from the session in the same update, so two
+    workers can never resume it twice.
+
+    Returns:
+        (pending, all_ids) to resume with; (pending, None) when the message
+        held none of the requested IDs and the workflow was parked again;
+        (None, None) when nothing is parked, it expired or ran out of attempts
+    """
+    taken = []
+    session_store.update(session_id, lambda state: taken.append(state.pop("pending_input", None)))
+    pending = taken[0]
+    if not pending or time.time() - pending["parked_at"] > PENDING_INPUT_TTL_SECONDS:
+        return None, None
+
+    found = parse_user_input(user_message, pending["fields"])
+    if found:
+        all_ids = pending["all_ids"]
+        for field, value in found.items():
+            all_ids[field] = [value] + [v for v in all_ids[field] if v != value]
+        return pending, all_ids
+
+    attempts = pending["attempts"] + 1
+    if attempts >= PENDING_INPUT_MAX_ATTEMPTS:
+        return None, None
+    need = NeedInput(pending["prompt"], pending["fields"])
+    return park_workflow(session_id, pending["scenario"], pending["all_ids"], pending["user_email"], need,
+                         attempts, pending.get("screenshot_ref")), None
+
+def need_input_response(pending: dict, message: str, session_id: str, print_outputs=()) -> dict:
+    return {
+        'response': message,
+        'need_input': {'prompt': pending["prompt"], 'fields': pending["fields"]},
+        'print_outputs': list(print_outputs),
+        'session_id': session_id,
+    }
+
+def resolve_and_reply(issue_type: str, all_ids: dict, user_email: str, session_id: str, lookups=None,
+                      screenshot_ref: str = None) -> dict:
+    """
+    Run the resolver for a classified issue and write the final reply.
+
+    If the workflow needs details from the user, it is parked in the
+    session and the reply carries a need_input event instead.
+    """
+    need = None
+    with CHAT_STAGE_SECONDS.time(stage="resolve", scenario=issue_type) as labels:
+        try:
+            confirmation = resolve_issues_bulk(issue_type, all_ids, user_email, screenshot_ref, lookups=lookups)
+        except NeedInput as e:
+            need = e
+            labels["outcome"] = "need_input"
+        finally:
+            if lookups is not None:
+                lookups.cancel()
+
+    # Get the print outputs captured for this session
+    print_outputs = pop_print_outputs(session_id)
+
+    if need is not None:
+        pending = park_workflow(session_id, issue_type, all_ids, user_email, need, screenshot_ref=screenshot_ref)
+        record_assistant_turn("[need_input]", need.prompt, session_id)
+        return need_input_response(pending, need.prompt, session_id, print_outputs)
+
+    with CHAT_STAGE_SECONDS.time(stage="reply", scenario=issue_type):
+        final_response = chat_with_ai(confirmation, session_id, fallback=confirmation)
+    final_response += "\n" + get_canned_response("followup")
+
+    # Include print outputs in the response
+    return {
+        'response': final_response,
+        'print_outputs': print_outputs,
+        'session_id': session_id
+    }
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.usage_token = start_usage_context()
+    g.deadline_token = start_deadline(CHAT_DEADLINE_SECONDS)
+
+@app.teardown_request
+def record_chat_metrics(exc):
+    if "usage_token" in g:
+        end_usage_context(g.pop("usage_token"))
+    if "deadline_token" in g:
+        end_deadline(g.pop("deadline_token"))
+    if request.endpoint != 'chat' or "request_started" not in g:
+        return
+    labels = {
+        "phase": g.get("chat_phase", "unknown"),
+        "scenario": g.get("scenario", "none"),
+        "outcome": "error" if exc is not None else "ok",
+    }
+    CHAT_REQUEST_SECONDS.observe(time.perf_counter() - g.request_started, **labels)
+    CHAT_REQUESTS.inc(**labels)
+
+@app.after_request
+def attach_session_cookie(response):
+    sid = getattr(g, "session_id", None)
+    if sid and request.cookies.get(SESSION_COOKIE) != sid:
+        response.set_cookie(SESSION_COOKIE, sid, httponly=True, samesite="Lax")
+    return response
+
+def acknowledgement_prompt(issue_type: str, ids: dict) -> str:
+    return f" I'VE identified this as :{issue_type}.  working on it. Extracted details: {json.dumps(ids)} crisp and sharp straight to the point like these are the parameters do not ask for any other parameters or questions ok"
+
+def prefer_llm_ids(all_ids: dict, ids: dict):
+    """The LLM's pick comes first; every other ID in the message follows it."""
+    for key, value in ids.items():
+        if value:
+            all_ids[key] = [value] + [v for v in all_ids[key] if v != value]
+
 def is_valid_email(email):
     return re.fullmatch(r"[\w\.-]+@[\w\.-]+\.\w{2,}", email) is not None
 
 # The home page route
 @app.route('/')
 def home():
-    # Initialize the conversation with the greeting
-    global conversation
-    conversation = []
-    try:
-        initial_message = chat_with_ai("You are a warehouse assistant. Start the chat with casual greeting and ask for email.no lengthly message just sharp and crisp nut be casual")
-    except Exception as e:
-        print(f"Error calling AI: {e}")
-       # initial_message = "Hello! I'm your warehouse assistant. Please provide your email address to get started."
-    
-    # Debug: Print the template being rendered
-   # print(f"Rendering template with initial_message: {initial_message}")
+    # Initialize the conversation with the greeting in a fresh session
+    g.session_id = new_session_id()
+    initial_message = canned_reply("greeting")
     return render_template('index.html', initial_message=initial_message)
 
 # Debug route to test static files
@@ -322,6 +564,13 @@ def chatbot():
                             }
                         }
 
+                        // A paused workflow asks for details; the next message answers it
+                        if (data.need_input) {
+                            this.messageInput.placeholder = data.need_input.prompt;
+                        } else if (!this.isEmailPhase) {
+                            this.messageInput.placeholder = "Describe your inbound receiving issue...";
+                        }
+
                         this.addBotMessage(data.response);
                     } catch (error) {
                         console.error('Error:', error);
@@ -389,43 +638,146 @@ def chat():
     user_data = request.get_json()
     user_message = user_data.get('message')
     user_email = user_data.get('email')
+    screenshot_ref = user_data.get('screenshot_ref')
+    session_id = current_session_id()
+    g.user_email = user_email
+    if screenshot_ref and not screenshot_exists(screenshot_ref):
+        return jsonify({'error': 'unknown screenshot_ref; upload it to /screenshots first'}), 400
+    update_usage_context(session_id=session_id, user_email=user_email)
 
     if not user_email:
         # This is for the email validation phase
+        g.chat_phase = "email"
         if is_valid_email(user_message):
-            ai_response = chat_with_ai(f"thanks for providing your email: {user_message}.ow ask what inbound receiving issue the user is facing (ASN, PO, Pallet, Quantity Mismatch)")
-            return jsonify({'response': ai_response, 'email_valid': True, 'email': user_message})
+            g.user_email = user_message
+            ai_response = canned_reply("email_accepted", email=user_message)
+            return jsonify({'response': ai_response, 'email_valid': True, 'email': user_message, 'session_id': session_id})
         else:
-            ai_response = chat_with_ai("Please provide a valid email address.")
-            return jsonify({'response': ai_response, 'email_valid': False})
+            ai_response = canned_reply("email_invalid")
+            return jsonify({'response': ai_response, 'email_valid': False, 'session_id': session_id})
+
+    # A workflow paused for details resumes with this message
+    pending, resume_ids = take_pending_reply(session_id, user_message)
+    if resume_ids is not None:
+        g.chat_phase = "resume"
+        g.scenario = pending["scenario"]
+        update_usage_context(scenario=pending["scenario"])
+        return jsonify(resolve_and_reply(pending["scenario"], resume_ids, user_email, session_id,
+                                         screenshot_ref=screenshot_ref or pending.get("screenshot_ref")))
+    if pending is not None:
+        g.chat_phase = "resume"
+        ai_response = f"Invalid format. {pending['prompt']}"
+        record_assistant_turn(user_message, ai_response)
+        return jsonify(need_input_response(pending, ai_response, session_id))
 
     # This is for the issue handling phase
-    issue_type = classify(user_message)
-    ids = extract_ids(user_message)
-    
-    ai_response = chat_with_ai(f" I'VE identified this as :{issue_type}.  working on it. Extracted details: {json.dumps(ids)} crisp and sharp straight to the point like these are the parameters do not ask for any other parameters or questions ok" )
+    g.chat_phase = "issue"
+    # Regex extraction is local, so start the DB checks for any IDs found
+    # now; they run while the LLM classifies the message.
+    with CHAT_STAGE_SECONDS.time(stage="extract"):
+        all_ids = extract_all_ids(user_message)
+    lookups = prefetch_lookups(all_ids)
+    with CHAT_STAGE_SECONDS.time(stage="classify") as labels:
+        structured = classify_extract_acknowledge(user_message) if STRUCTURED_OUTPUT else None
+        if structured:
+            issue_type = structured["label"]
+            ids = structured["ids"]
+            ai_response = structured["acknowledgement"]
+            record_assistant_turn(user_message, ai_response)
+        else:
+            issue_type = classify(user_message)
+            ids = {key: (values[0] if values else None) for key, values in all_ids.items()}
+            ai_response = chat_with_ai(
+                acknowledgement_prompt(issue_type, ids),
+                purpose="acknowledge",
+                fallback=get_canned_response("acknowledgement", issue_type=issue_type.replace("_", " "), ids=json.dumps(ids)),
+            )
+        labels["scenario"] = g.scenario = issue_type
+    update_usage_context(scenario=issue_type)
     print(ai_response)
     
-    # Import the resolver module to access print outputs
-    from scripts.resolver import resolve_issue, get_print_outputs
-    
-    confirmation = resolve_issue(issue_type, ids, user_email)
-    
-    # Get the captured print outputs
-    print_outputs = get_print_outputs()
-    
-    final_response = chat_with_ai(confirmation)
-    final_response += f"\nWould you like to report another issue? Type 'exit' to quit or describe your issue."
-    
-    # Include print outputs in the response
-    return jsonify({
-        'response': final_response,
-        'print_outputs': print_outputs
-    })
-
+    prefer_llm_ids(all_ids, ids)
+    return jsonify(resolve_and_reply(issue_type, all_ids, user_email, session_id, lookups=lookups,
+                                     screenshot_ref=screenshot_ref))
+
+
+# Screenshot upload: multipart field "screenshot", or the raw image as the request body.
+# Returns a screenshot_ref to send along with the /chat message.
+@app.route('/screenshots', methods=['POST'])
+def upload_screenshot():
+    if request.content_length and request.content_length > SCREENSHOT_MAX_UPLOAD_BYTES + 64 * 1024:
+        return jsonify({'error': 'screenshot too large'}), 413
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('screenshot')
+        if upload is None:
+            return jsonify({'error': 'missing "screenshot" file field'}), 400
+        stream = upload.stream
+    else:
+        stream = request.stream
+    try:
+        stored = store_screenshot(stream)
+    except ScreenshotTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'screenshot_ref': stored['ref'], 'bytes': stored['bytes'], 'uploaded_bytes': stored['uploaded_bytes']})
+
+
+def is_admin_request() -> bool:
+    """True when the request carries ADMIN_TOKEN as X-Admin-Token (never when no token is configured)."""
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN)
+
+
+# Paged chat history: the caller's own session, or any session / user email with the admin token
+@app.route('/history', methods=['GET'])
+def history():
+    if is_admin_request():
+        session_id, user_email = request.args.get('session_id'), request.args.get('email')
+    else:
+        session_id, user_email = request.cookies.get(SESSION_COOKIE), None
+        if not session_id:
+            return jsonify({'error': 'no session'}), 401
+    return jsonify(chat_history.get_history(
+        session_id=session_id,
+        user_email=user_email,
+        page=request.args.get('page', 1, type=int),
+        page_size=request.args.get('page_size', 50, type=int),
+    ))
+
+
+# Token and cost accounting, grouped by session_id, user_email, scenario, model, purpose or day
+@app.route('/admin/usage', methods=['GET'])
+def admin_usage():
+    if not ADMIN_TOKEN:
+        return jsonify({'error': 'admin endpoints are disabled (ADMIN_TOKEN is not set)'}), 403
+    if not is_admin_request():
+        return jsonify({'error': 'unauthorized'}), 401
+    try:
+        return jsonify(get_usage_tracker().summary(
+            group_by=request.args.get('group_by', 'session_id'),
+            since=request.args.get('since'),
+            limit=request.args.get('limit', 100, type=int),
+            session_id=request.args.get('session_id'),
+            user_email=request.args.get('email'),
+            scenario=request.args.get('scenario'),
+            model=request.args.get('model'),
+            purpose=request.args.get('purpose'),
+        ))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+
+# Prometheus scrape endpoint: per-stage latency histograms and counters
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
 
 
 if __name__ == '__main__':
     # Add your GROQ_API_KEY as an environment variable before running
     # e.g., export GROQ_API_KEY="your_key_here"
+    # Development server only; use `python wsgi.py` for multi-worker production,
+    # or `python asgi.py` for the asyncio /chat core.
+    warmup()
+    start_worker_threads()
     app.run(debug=True)
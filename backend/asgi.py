@@ -0,0 +1,239 @@
+# asgi.py
+# Asyncio entry point: POST /chat runs on the event loop, so a conversation
+# waiting on the LLM costs a coroutine instead of a worker thread. Every
+# other route is the Flask app from app.py behind asgiref's WSGI adapter.
+#
+#   python asgi.py                      # ASGI_WORKERS processes on WEB_BIND
+#   uvicorn asgi:app --workers 4        # same app through the uvicorn CLI
+#
+# Session store, chat history and usage rows are SQLite and go through the
+# I/O pool in scripts/async_io.py; resolver runs (DB checks, SAP mails and
+# SAP waits) go through the workflow pool.
+import json
+import os
+import time
+from http.cookies import SimpleCookie
+
+from asgiref.wsgi import WsgiToAsgi
+
+from app import (
+    app as flask_app, SESSION_COOKIE, STRUCTURED_OUTPUT, CHAT_DEADLINE_SECONDS,
+    achat_with_ai, acknowledgement_prompt, canned_reply, is_valid_email, need_input_response,
+    park_workflow, pop_print_outputs, prefer_llm_ids, record_assistant_turn, start_worker_threads, take_pending_reply,
+)
+from scripts.async_io import run_blocking, run_workflow
+from scripts.canned_responses import get_canned_response
+from scripts.chat_interface import NeedInput
+from scripts.classifier import aclassify, aclassify_extract_acknowledge
+from scripts.extractor import extract_all_ids
+from scripts.llm_client import close_async_client, deadline_scope
+from scripts.lookup_context import prefetch_lookups
+from scripts.metrics import CHAT_REQUEST_SECONDS, CHAT_REQUESTS, CHAT_STAGE_SECONDS
+from scripts.resolver import resolve_issues_bulk
+from scripts.screenshot_store import screenshot_exists
+from scripts.session_store import new_session_id, session_scope
+from scripts.usage_tracker import update_usage_context, usage_scope
+from scripts.warmup import warmup
+
+# ---------- CONFIGURATION ----------
+bind = os.getenv("WEB_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("ASGI_WORKERS", "1"))  # one event loop per process
+MAX_CHAT_BODY_BYTES = int(os.getenv("MAX_CHAT_BODY_BYTES", str(1024 * 1024)))
+
+wsgi_fallback = WsgiToAsgi(flask_app)
+
+
+# ----------------------------
+# /chat pipeline
+# ----------------------------
+async def chat_pipeline(data: dict, session_id: str, labels: dict) -> dict:
+    """
+    The /chat flow of app.chat(), awaiting the LLM instead of blocking on it.
+
+    Args:
+        data: Request JSON (message, email)
+        session_id: Session the turn belongs to
+        labels: Metric labels; phase and scenario are filled in here
+
+    Returns:
+        Response JSON, same shape as app.chat()
+    """
+    user_message = data.get('message')
+    user_email = data.get('email')
+    screenshot_ref = data.get('screenshot_ref')
+
+    if not user_email:
+        labels["phase"] = "email"
+        if is_valid_email(user_message or ""):
+            update_usage_context(user_email=user_message)
+            ai_response = await run_blocking(canned_reply, "email_accepted", session_id, email=user_message)
+            return {'response': ai_response, 'email_valid': True, 'email': user_message, 'session_id': session_id}
+        ai_response = await run_blocking(canned_reply, "email_invalid", session_id)
+        return {'response': ai_response, 'email_valid': False, 'session_id': session_id}
+
+    pending, resume_ids = await run_blocking(take_pending_reply, session_id, user_message)
+    if resume_ids is not None:
+        labels["phase"], labels["scenario"] = "resume", pending["scenario"]
+        await run_blocking(update_usage_context, scenario=pending["scenario"])
+        return await aresolve_and_reply(pending["scenario"], resume_ids, user_email, session_id,
+                                        screenshot_ref=screenshot_ref or pending.get("screenshot_ref"))
+    if pending is not None:
+        labels["phase"] = "resume"
+        ai_response = f"Invalid format. {pending['prompt']}"
+        await run_blocking(record_assistant_turn, user_message, ai_response, session_id)
+        return need_input_response(pending, ai_response, session_id)
+
+    labels["phase"] = "issue"
+    with CHAT_STAGE_SECONDS.time(stage="extract"):
+        all_ids = extract_all_ids(user_message)
+    lookups = prefetch_lookups(all_ids)
+    with CHAT_STAGE_SECONDS.time(stage="classify") as stage:
+        structured = await aclassify_extract_acknowledge(user_message) if STRUCTURED_OUTPUT else None
+        if structured:
+            issue_type = structured["label"]
+            ids = structured["ids"]
+            ai_response = structured["acknowledgement"]
+            await run_blocking(record_assistant_turn, user_message, ai_response, session_id)
+        else:
+            issue_type = await aclassify(user_message)
+            ids = {key: (values[0] if values else None) for key, values in all_ids.items()}
+            ai_response = await achat_with_ai(
+                acknowledgement_prompt(issue_type, ids), session_id,
+                purpose="acknowledge",
+                fallback=get_canned_response("acknowledgement", issue_type=issue_type.replace("_", " "), ids=json.dumps(ids)),
+            )
+        stage["scenario"] = labels["scenario"] = issue_type
+    await run_blocking(update_usage_context, scenario=issue_type)
+    print(ai_response)
+
+    prefer_llm_ids(all_ids, ids)
+    return await aresolve_and_reply(issue_type, all_ids, user_email, session_id, lookups=lookups,
+                                    screenshot_ref=screenshot_ref)
+
+
+async def aresolve_and_reply(issue_type: str, all_ids: dict, user_email: str, session_id: str, lookups=None,
+                             screenshot_ref: str = None) -> dict:
+    """app.resolve_and_reply() with the resolver on the workflow pool and the reply awaited."""
+    need = None
+    with CHAT_STAGE_SECONDS.time(stage="resolve", scenario=issue_type) as stage:
+        try:
+            confirmation = await run_workflow(resolve_issues_bulk, issue_type, all_ids, user_email, screenshot_ref,
+                                              lookups=lookups)
+        except NeedInput as e:
+            need = e
+            stage["outcome"] = "need_input"
+        finally:
+            if lookups is not None:
+                lookups.cancel()
+
+    print_outputs = await run_blocking(pop_print_outputs, session_id)
+
+    if need is not None:
+        pending = await run_blocking(park_workflow, session_id, issue_type, all_ids, user_email, need,
+                                     screenshot_ref=screenshot_ref)
+        await run_blocking(record_assistant_turn, "[need_input]", need.prompt, session_id)
+        return need_input_response(pending, need.prompt, session_id, print_outputs)
+
+    with CHAT_STAGE_SECONDS.time(stage="reply", scenario=issue_type):
+        final_response = await achat_with_ai(confirmation, session_id, fallback=confirmation)
+    final_response += "\n" + get_canned_response("followup")
+
+    return {
+        'response': final_response,
+        'print_outputs': print_outputs,
+        'session_id': session_id
+    }
+
+
+# ----------------------------
+# ASGI plumbing
+# ----------------------------
+async def _read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if len(body) > MAX_CHAT_BODY_BYTES:
+            raise ValueError("request body too large")
+        if not message.get("more_body"):
+            return body
+
+
+async def _send_json(send, status: int, data: dict, headers=()):
+    body = json.dumps(data).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())] + list(headers),
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def chat(scope, receive, send):
+    started = time.perf_counter()
+    headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope.get("headers", [])}
+    cookie = SimpleCookie(headers.get("cookie", "")).get(SESSION_COOKIE)
+    cookie_sid = cookie.value if cookie else None
+    try:
+        data = json.loads(await _read_body(receive) or b"{}")
+        if not isinstance(data, dict):
+            raise ValueError("body is not a JSON object")
+    except ValueError as e:
+        await _send_json(send, 400, {'error': str(e)})
+        return
+    if data.get('screenshot_ref') and not screenshot_exists(data['screenshot_ref']):
+        await _send_json(send, 400, {'error': 'unknown screenshot_ref; upload it to /screenshots first'})
+        return
+
+    session_id = cookie_sid or data.get('session_id') or new_session_id()
+    labels = {"phase": "unknown", "scenario": "none", "outcome": "ok"}
+    try:
+        with usage_scope(session_id=session_id, user_email=data.get('email')), \
+                deadline_scope(CHAT_DEADLINE_SECONDS), session_scope(session_id):
+            status, result = 200, await chat_pipeline(data, session_id, labels)
+    except Exception as e:
+        print(f"❌ /chat failed: {e}")
+        labels["outcome"] = "error"
+        status, result = 500, {'error': 'internal error', 'session_id': session_id}
+    finally:
+        CHAT_REQUEST_SECONDS.observe(time.perf_counter() - started, **labels)
+        CHAT_REQUESTS.inc(**labels)
+
+    extra = []
+    if cookie_sid != session_id:
+        extra.append((b"set-cookie", f"{SESSION_COOKIE}={session_id}; HttpOnly; Path=/; SameSite=Lax".encode()))
+    await _send_json(send, status, result, extra)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await run_blocking(warmup)
+            start_worker_threads()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await close_async_client()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+    elif scope["type"] == "http" and scope["path"] == "/chat" and scope["method"] == "POST":
+        await chat(scope, receive, send)
+    else:
+        await wsgi_fallback(scope, receive, send)
+
+
+def run():
+    import uvicorn
+
+    host, _, port = bind.rpartition(":")
+    print(f"Starting {workers} asyncio workers on {bind}")
+    uvicorn.run("asgi:app", host=host or "0.0.0.0", port=int(port), workers=workers)
+
+
+if __name__ == '__main__':
+    run()
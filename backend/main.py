@@ -1,46 +1,47 @@
 from scripts.classifier import classify_with_retry, classify
 from scripts.resolver import resolve_issue
 from scripts.extractor import extract_ids, validate_ids
-import requests
+from scripts.canned_responses import get_canned_response
+from scripts.chat_interface import NeedInput, parse_user_input
+from scripts.llm_client import chat_completion
+from scripts.model_router import build_payload
 import re
 import json
 
-# AI assistant using LLaMA model
-API_URL = "https://api.groq.com/openai/v1/chat/completions"
-GROQ_API_KEY = ""  # Secure this!
-HEADERS = {
-    "Authorization": f"Bearer {GROQ_API_KEY}",
-    "Content-Type": "application/json"
-}
-MODEL = "llama3-8b-8192"
+# AI assistant using LLaMA models (endpoint in scripts/llm_client.py, model per task in scripts/model_router.py)
 
 conversation = []
 chat_log = []
 
 def chat_with_ai(user_message: str) -> str:
     conversation.append({"role": "user", "content": user_message})
-    payload = {"model": MODEL, "messages": conversation, "temperature": 0.2}
-    response = requests.post(API_URL, headers=HEADERS, json=payload)
-    response.raise_for_status()
-    ai_message = response.json()["choices"][0]["message"]["content"]
+    payload = build_payload("chat", conversation)
+    ai_message = chat_completion(payload, timeout=None)["choices"][0]["message"]["content"]
     conversation.append({"role": "assistant", "content": ai_message})
     chat_log.append({"user": user_message, "bot": ai_message})
     print(f"🤖 {ai_message}")
     return ai_message
 
+def canned_reply(state: str, **fields) -> str:
+    ai_message = get_canned_response(state, **fields)
+    conversation.append({"role": "assistant", "content": ai_message})
+    chat_log.append({"user": f"[{state}]", "bot": ai_message})
+    print(f"🤖 {ai_message}")
+    return ai_message
+
 def is_valid_email(email):
     return re.fullmatch(r"[\w\.-]+@[\w\.-]+\.\w{2,}", email) is not None
 
 
 # 1. Intro & email
-chat_with_ai("You are a warehouse assistant. Start the chat with casual greeting and ask for email.no lengthly message just sharp and crisp nut be casual")
+canned_reply("greeting")
 while True:
     user_email = input("You: ")
     if is_valid_email(user_email):
-        chat_with_ai(f"thanks for providing your email: {user_email}.ow ask what inbound receiving issue the user is facing (ASN, PO, Pallet, Quantity Mismatch)")
+        canned_reply("email_accepted", email=user_email)
         break
     else:
-        chat_with_ai("Please provide a valid email address.")
+        canned_reply("email_invalid")
 
 # 2. Ask for the issue
 
@@ -64,7 +65,16 @@ while True:
     # chat_with_ai(f"I've identified this as: {issue_type.replace('_', ' ').title()} issue. wait until I extract the details from you and analyze them. crisp and sharp response")
     chat_with_ai(f" I'VE identified this as :{issue_type}.  working on it. Extracted details: {json.dumps(ids)} crisp and sharp straight to the point like these are the parameters do not ask for any other parameters or questions ok" )
 
-    confirmation = resolve_issue(issue_type, ids, user_email)
+    while True:
+        try:
+            confirmation = resolve_issue(issue_type, ids, user_email)
+            break
+        except NeedInput as need:
+            # The workflow paused for details: ask, then run it again with the answer.
+            answer = parse_user_input(input(f"🧑 {need.prompt} "), need.fields)
+            if not answer:
+                print("Invalid format. Please re-enter a valid ID.")
+            ids.update(answer)
     chat_with_ai(confirmation)
 
-    followup = chat_with_ai("just ask Would you like to report another issue? Type 'exit' to quit or describe your issue.")
+    followup = canned_reply("followup")
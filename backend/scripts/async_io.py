@@ -0,0 +1,33 @@
+# scripts/async_io.py
+# Thread pools behind the asyncio core (asgi.py). SQLite, the session store
+# and the resolver workflows are blocking; they run here so the event loop
+# keeps serving other conversations meanwhile. Context variables (session,
+# usage attribution, deadline) are carried into the worker thread.
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# ---------- CONFIGURATION ----------
+ASYNC_IO_THREADS = int(os.getenv("ASYNC_IO_THREADS", "32"))  # short SQLite / session store calls
+WORKFLOW_THREADS = int(os.getenv("WORKFLOW_THREADS", "64"))  # resolver runs, which can wait on SAP for minutes
+
+_io_executor = ThreadPoolExecutor(max_workers=ASYNC_IO_THREADS, thread_name_prefix="async-io")
+_workflow_executor = ThreadPoolExecutor(max_workers=WORKFLOW_THREADS, thread_name_prefix="workflow")
+
+
+def _submit(executor, fn, args, kwargs):
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return loop.run_in_executor(executor, functools.partial(context.run, fn, *args, **kwargs))
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """Await a short blocking call (SQLite, session store) on the I/O pool."""
+    return await _submit(_io_executor, fn, args, kwargs)
+
+
+async def run_workflow(fn, *args, **kwargs):
+    """Await a long blocking workflow on its own pool, so SAP waits cannot starve run_blocking()."""
+    return await _submit(_workflow_executor, fn, args, kwargs)
@@ -0,0 +1,440 @@
+# scripts/benchmark_chat.py
+# Replay-based load benchmark for POST /chat.
+#
+# Each virtual user replays one session (email phase, then issue messages)
+# against the Flask app, in process or over HTTP. The LLM is replaced by a
+# mock with log-normal latency (or served from the LLM cassette), so results
+# measure the app, not Groq.
+#
+#   cd backend
+#   python -m scripts.benchmark_chat --users 20 --sessions 200 --out bench.json
+#   python -m scripts.benchmark_chat --sessions-file recorded.jsonl --compare bench.json
+#   python -m scripts.benchmark_chat --url http://localhost:8000 --users 50
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# ---------- CONFIGURATION ----------
+BENCH_LLM_MEDIAN_MS = float(os.getenv("BENCH_LLM_MEDIAN_MS", "450"))
+BENCH_LLM_SIGMA = float(os.getenv("BENCH_LLM_SIGMA", "0.5"))
+BENCH_RESOLVER_MEDIAN_MS = float(os.getenv("BENCH_RESOLVER_MEDIAN_MS", "150"))
+BENCH_RESOLVER_SIGMA = float(os.getenv("BENCH_RESOLVER_SIGMA", "0.8"))
+
+WAREHOUSE_DB = os.getenv(  # copied into the scratch directory; point it at a scripts/data_generator.py output
+    "BENCH_WAREHOUSE_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "database", "warehouse.db"),
+)
+PERCENTILES = (50, 95, 99)
+
+# One template per scenario; {po}, {asn} and {pallet} are filled with fresh IDs.
+SCENARIO_MESSAGES = {
+    "missing_asn": [
+        "ASN {asn} is not showing up in the system for PO {po}",
+        "Can't find ASN {asn}, please check",
+    ],
+    "missing_po": [
+        "PO {po} is missing, we cannot receive the truck",
+        "Purchase order {po} not found in the system",
+    ],
+    "missing_pallet": [
+        "Pallet {pallet} is not in ASN {asn}",
+        "Scanned pallet {pallet} but it is missing for PO {po}",
+    ],
+    "quantity_mismatch": [
+        "Quantity mismatch between PO {po} and ASN {asn}",
+        "The quantity on ASN {asn} does not match PO {po}",
+    ],
+}
+
+
+# ----------------------------
+# Sessions
+# ----------------------------
+def _random_ids(rng: random.Random) -> dict:
+    return {
+        "po": "2" + "".join(rng.choice("0123456789") for _ in range(9)),
+        "asn": "0" + "".join(rng.choice("0123456789") for _ in range(4)),
+        "pallet": "5" + "".join(rng.choice("0123456789") for _ in range(14)),
+    }
+
+
+def synthetic_sessions(count: int, issues_per_session: int = 2, invalid_email_rate: float = 0.2, seed: int = 42) -> list:
+    """
+    Build sessions that walk the email phase and then report issues from all four scenarios.
+
+    Returns:
+        List of sessions, each a list of message strings in send order
+    """
+    rng = random.Random(seed)
+    scenarios = list(SCENARIO_MESSAGES)
+    sessions = []
+    for n in range(count):
+        messages = []
+        if rng.random() < invalid_email_rate:
+            messages.append("not-an-email")
+        messages.append(f"bench.user{n}@example.com")
+        for i in range(issues_per_session):
+            scenario = scenarios[(n + i) % len(scenarios)]
+            messages.append(rng.choice(SCENARIO_MESSAGES[scenario]).format(**_random_ids(rng)))
+        sessions.append(messages)
+    return sessions
+
+
+def load_sessions(path: str) -> list:
+    """Read recorded sessions: one JSON object per line with a "messages" list."""
+    sessions = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                sessions.append(json.loads(line)["messages"])
+    return sessions
+
+
+# ----------------------------
+# Stage timings
+# ----------------------------
+class StageRecorder:
+    """Collects (stage, seconds, ok) samples from every virtual user."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+
+    def add(self, stage: str, seconds: float, ok: bool = True):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+            if not ok:
+                self.errors[stage] = self.errors.get(stage, 0) + 1
+
+    def timed(self, stage: str, fn):
+        """Wrap fn so every call is recorded under `stage`."""
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            ok = False
+            try:
+                result = fn(*args, **kwargs)
+                ok = True
+                return result
+            finally:
+                self.add(stage, time.perf_counter() - start, ok)
+        return wrapper
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(recorder: StageRecorder) -> dict:
+    stages = {}
+    for stage, values in sorted(recorder.samples.items()):
+        values = sorted(values)
+        stats = {"count": len(values), "errors": recorder.errors.get(stage, 0),
+                 "mean_ms": round(sum(values) / len(values) * 1000, 2)}
+        for pct in PERCENTILES:
+            stats[f"p{pct}_ms"] = round(percentile(values, pct) * 1000, 2)
+        stages[stage] = stats
+    return stages
+
+
+# ----------------------------
+# Mocked LLM and resolver
+# ----------------------------
+class _MockResponse:
+    def __init__(self, content: str, status_code: int = 200):
+        self.status_code = status_code
+        self.headers = {}
+        self._content = content
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            import requests
+            raise requests.exceptions.HTTPError(f"{self.status_code} mock LLM error", response=self)
+
+    def json(self):
+        return {
+            "choices": [{"message": {"role": "assistant", "content": self._content}}],
+            "usage": {"prompt_tokens": 120, "completion_tokens": 30, "total_tokens": 150},
+        }
+
+
+def _label_for(text: str) -> str:
+    text = text.lower()
+    for keyword, label in (("quantity", "quantity_mismatch"), ("pallet", "missing_pallet"),
+                           ("asn", "missing_asn"), ("po", "missing_po"), ("purchase order", "missing_po")):
+        if keyword in text:
+            return label
+    return "unknown"
+
+
+def make_mock_llm(median_ms: float, sigma: float, error_rate: float, seed: int = 7):
+    """Return a requests.post replacement that sleeps a log-normal delay and answers like Groq."""
+    from scripts.extractor import extract_ids
+
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+
+    def post(url, **kwargs):
+        payload = kwargs["json"]
+        with rng_lock:
+            delay = rng.lognormvariate(math.log(median_ms / 1000), sigma)
+            failed = rng.random() < error_rate
+        time.sleep(delay)
+        if failed:
+            return _MockResponse("", status_code=503)
+
+        prompt = payload["messages"][-1]["content"]
+        message = prompt.rsplit("Message:", 1)[-1].rsplit("Email:", 1)[-1]
+        label = _label_for(message)
+        if payload.get("response_format"):
+            ids = extract_ids(message)
+            content = json.dumps({
+                "label": label,
+                "ids": ids,
+                "acknowledgement": f"Identified as {label}, working with {ids}.",
+            })
+        elif "Respond ONLY with the label" in prompt:
+            content = label
+        else:
+            content = "Understood. Here is what I found: " + prompt[:80]
+        return _MockResponse(content)
+
+    return post
+
+
+def make_mock_resolver(median_ms: float, sigma: float, seed: int = 11):
+    """Stand-in for resolve_issues_bulk that only costs time (DB checks, mail round trips)."""
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+
+    def resolve_issues_bulk(scenario, all_ids, user_email, screenshot_data=None, lookups=None):
+        with rng_lock:
+            delay = rng.lognormvariate(math.log(median_ms / 1000), sigma)
+        time.sleep(delay)
+        found = ", ".join(v for values in all_ids.values() for v in values) or "no IDs"
+        return f"{scenario} handled for {found}."
+
+    return resolve_issues_bulk
+
+
+# ----------------------------
+# Clients
+# ----------------------------
+def _isolate_state(workdir: str):
+    """Point every on-disk store at a scratch directory before the app is imported."""
+    os.environ["SESSION_DB_PATH"] = os.path.join(workdir, "sessions.db")
+    os.environ["CHAT_HISTORY_DB_PATH"] = os.path.join(workdir, "chat_history.db")
+    os.environ["SAP_REQUESTS_DB_PATH"] = os.path.join(workdir, "sap_requests.db")
+    warehouse_copy = os.path.join(workdir, "warehouse.db")
+    if os.path.exists(WAREHOUSE_DB):
+        shutil.copyfile(WAREHOUSE_DB, warehouse_copy)
+    os.environ["WAREHOUSE_DB_PATH"] = warehouse_copy
+
+
+def in_process_client_factory(recorder: StageRecorder, args):
+    """Import the app with mocks installed and stage timers wrapped around its pipeline."""
+    if args.llm == "cassette":
+        # Recorded replies from LLM_CASSETTE_PATH; misses surface as request errors.
+        os.environ.setdefault("LLM_CASSETTE_MODE", "replay")
+    else:
+        import requests
+        requests.post = make_mock_llm(args.llm_median_ms, args.llm_sigma, args.llm_error_rate, args.seed)
+
+    import app as app_module
+    if args.resolver == "mock":
+        app_module.resolve_issues_bulk = make_mock_resolver(args.resolver_median_ms, args.resolver_sigma, args.seed)
+    app_module.classify_extract_acknowledge = recorder.timed("classify", app_module.classify_extract_acknowledge)
+    app_module.classify = recorder.timed("classify", app_module.classify)
+    app_module.resolve_issues_bulk = recorder.timed("resolve", app_module.resolve_issues_bulk)
+    app_module.chat_with_ai = recorder.timed("llm_reply", app_module.chat_with_ai)
+
+    def post(client, payload):
+        response = client.post("/chat", json=payload)
+        return response.status_code, response.get_json(silent=True) or {}
+
+    return lambda: (app_module.app.test_client(), post)
+
+
+def http_client_factory(url: str, timeout: float):
+    import requests
+
+    def post(session, payload):
+        response = session.post(url.rstrip("/") + "/chat", json=payload, timeout=timeout)
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        return response.status_code, body
+
+    return lambda: (requests.Session(), post)
+
+
+def replay_session(messages: list, client_factory, recorder: StageRecorder):
+    """Send one session's messages in order, carrying the accepted email like the UI does."""
+    client, post = client_factory()
+    email = None
+    session_id = None
+    for message in messages:
+        payload = {"message": message, "email": email}
+        if session_id:
+            payload["session_id"] = session_id
+        stage = "email" if email is None else "issue"
+        start = time.perf_counter()
+        try:
+            status, body = post(client, payload)
+            ok = status == 200
+        except Exception as e:
+            print(f"❌ Request failed: {e}")
+            status, body, ok = None, {}, False
+        recorder.add(stage, time.perf_counter() - start, ok)
+        recorder.add("request", time.perf_counter() - start, ok)
+        session_id = body.get("session_id", session_id)
+        if body.get("email_valid"):
+            email = body.get("email")
+
+
+# ----------------------------
+# Run and report
+# ----------------------------
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return "unknown"
+
+
+def run_benchmark(sessions: list, client_factory, users: int, recorder: StageRecorder = None) -> dict:
+    """
+    Replay sessions with `users` concurrent virtual users.
+
+    Returns:
+        Result dict with per-stage percentiles, throughput and error rate
+    """
+    recorder = recorder or StageRecorder()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users, thread_name_prefix="bench") as pool:
+        for future in [pool.submit(replay_session, s, client_factory, recorder) for s in sessions]:
+            future.result()
+    elapsed = time.perf_counter() - start
+
+    requests_sent = len(recorder.samples.get("request", []))
+    errors = recorder.errors.get("request", 0)
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "sessions": len(sessions),
+        "requests": requests_sent,
+        "errors": errors,
+        "error_rate": round(errors / requests_sent, 4) if requests_sent else 0.0,
+        "elapsed_seconds": round(elapsed, 2),
+        "throughput_rps": round(requests_sent / elapsed, 2) if elapsed else 0.0,
+        "stages": summarize(recorder),
+    }
+
+
+def compare_results(current: dict, baseline: dict, max_regression: float) -> list:
+    """Print stage deltas against a baseline; returns the stages whose p95 regressed too far."""
+    print(f"\nCompared with {baseline.get('commit', '?')} ({baseline.get('timestamp', '?')}):")
+    regressions = []
+    for stage, stats in current["stages"].items():
+        old = baseline.get("stages", {}).get(stage)
+        if not old or not old.get("p95_ms"):
+            continue
+        change = (stats["p95_ms"] - old["p95_ms"]) / old["p95_ms"]
+        marker = "⚠️" if change > max_regression else "  "
+        print(f"{marker} {stage:<10} p95 {old['p95_ms']:>9.1f} -> {stats['p95_ms']:>9.1f} ms ({change:+.1%})")
+        if change > max_regression:
+            regressions.append(stage)
+    old_rps = baseline.get("throughput_rps") or 0
+    if old_rps:
+        print(f"   throughput {old_rps} -> {current['throughput_rps']} req/s "
+              f"({(current['throughput_rps'] - old_rps) / old_rps:+.1%})")
+    return regressions
+
+
+def print_report(result: dict):
+    print(f"\n📊 {result['requests']} requests from {result['sessions']} sessions in {result['elapsed_seconds']}s "
+          f"-> {result['throughput_rps']} req/s, error rate {result['error_rate']:.2%}")
+    print(f"{'stage':<10} {'count':>7} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for stage, stats in result["stages"].items():
+        print(f"{stage:<10} {stats['count']:>7} {stats['errors']:>7} "
+              f"{stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay chat sessions against /chat and report latency per stage.")
+    parser.add_argument("--users", type=int, default=10, help="concurrent virtual users")
+    parser.add_argument("--sessions", type=int, default=100, help="synthetic sessions to generate")
+    parser.add_argument("--issues-per-session", type=int, default=2)
+    parser.add_argument("--sessions-file", help="JSONL of recorded sessions ({\"messages\": [...]} per line)")
+    parser.add_argument("--url", help="benchmark a running server instead of the in-process app")
+    parser.add_argument("--timeout", type=float, default=120, help="HTTP timeout in --url mode")
+    parser.add_argument("--resolver", choices=["mock", "real"], default="mock",
+                        help="'real' runs the resolver workflows (use with the mail stand-in)")
+    parser.add_argument("--llm", choices=["mock", "cassette"], default="mock",
+                        help="'cassette' replays recorded Groq replies (see scripts/llm_client.py)")
+    parser.add_argument("--llm-median-ms", type=float, default=BENCH_LLM_MEDIAN_MS)
+    parser.add_argument("--llm-sigma", type=float, default=BENCH_LLM_SIGMA)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--resolver-median-ms", type=float, default=BENCH_RESOLVER_MEDIAN_MS)
+    parser.add_argument("--resolver-sigma", type=float, default=BENCH_RESOLVER_SIGMA)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="write the result JSON here")
+    parser.add_argument("--compare", help="baseline result JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="fail when a stage's p95 grows by more than this fraction")
+    args = parser.parse_args()
+
+    if args.sessions_file:
+        sessions = load_sessions(args.sessions_file)
+    else:
+        sessions = synthetic_sessions(args.sessions, args.issues_per_session, seed=args.seed)
+
+    recorder = StageRecorder()
+    workdir = None
+    if args.url:
+        factory = http_client_factory(args.url, args.timeout)
+    else:
+        workdir = tempfile.mkdtemp(prefix="chat-bench-")
+        _isolate_state(workdir)
+        factory = in_process_client_factory(recorder, args)
+
+    result = run_benchmark(sessions, factory, args.users, recorder)
+    result["config"] = {key: value for key, value in vars(args).items() if key not in ("out", "compare")}
+    if args.llm == "cassette" and not args.url:
+        from scripts.llm_client import get_cassette
+        result["cassette"] = get_cassette().stats()
+    print_report(result)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"💾 Results saved to {args.out}")
+
+    regressions = []
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare_results(result, json.load(f), args.max_regression)
+
+    if workdir:
+        from scripts.chat_history import get_chat_history
+        get_chat_history().close()
+        shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,169 @@
+# scripts/canned_responses.py
+# Fixed dialog turns (greeting, email accepted / rejected, follow-up) served
+# from pre-generated template variants instead of a live LLM call.
+import json
+import os
+import re
+import sys
+import threading
+
+from scripts.llm_client import chat_completion
+from scripts.model_router import build_payload
+
+# ---------- CONFIGURATION ----------
+CANNED_RESPONSES_PATH = os.getenv(
+    "CANNED_RESPONSES_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "canned_responses.json"),
+)
+CANNED_REFRESH_SECONDS = int(os.getenv("CANNED_REFRESH_SECONDS", "0"))  # 0 = no background refresh
+VARIANTS_PER_STATE = 5
+
+# Built-in variants; always available even without a generated file.
+DEFAULT_TEMPLATES = {
+    "greeting": [
+        "Hey there! 👋 I'm your warehouse assistant. Drop your email and we'll get started.",
+        "Hi! Warehouse assistant here. What's your email address?",
+        "Hello! 👋 Share your email and I'll help you sort out your receiving issue.",
+    ],
+    "email_accepted": [
+        "Thanks, {email}! What inbound receiving issue are you facing — ASN, PO, Pallet or Quantity Mismatch?",
+        "Got it, {email}. Tell me what's wrong: missing ASN, missing PO, missing pallet or a quantity mismatch?",
+        "Thanks {email}! What's the issue — ASN, PO, Pallet or Quantity Mismatch?",
+    ],
+    "email_invalid": [
+        "Hmm, that doesn't look like a valid email. Could you try again?",
+        "Please provide a valid email address (e.g. name@company.com).",
+        "That email doesn't look right — mind re-entering it?",
+    ],
+    "acknowledgement": [
+        "Got it — identified as {issue_type}. Working with {ids}.",
+        "Identified as {issue_type}. Parameters: {ids}. Checking now.",
+    ],
+    "followup": [
+        "Would you like to report another issue? Type 'exit' to quit or describe your issue.",
+        "Anything else I can help with? Describe another issue or type 'exit' to quit.",
+    ],
+}
+
+# Prompt used to generate fresh variants offline or in the background.
+STATE_PROMPTS = {
+    "greeting": "You are a warehouse assistant. Write a casual one-line greeting that asks for the user's email. Sharp and crisp.",
+    "email_accepted": "You are a warehouse assistant. Write one short line thanking the user for their email, written literally as {email}, and asking what inbound receiving issue they face (ASN, PO, Pallet, Quantity Mismatch).",
+    "email_invalid": "You are a warehouse assistant. Write one short, friendly line asking the user to provide a valid email address.",
+    "acknowledgement": "You are a warehouse assistant. Write one crisp line saying the issue was identified as {issue_type} and you are working with the IDs {ids}; keep both placeholders literally.",
+    "followup": "You are a warehouse assistant. Write one short line asking if the user wants to report another issue, and telling them to type 'exit' to quit.",
+}
+
+# Placeholders each state's variants must contain
+STATE_FIELDS = {"email_accepted": {"email"}, "acknowledgement": {"issue_type", "ids"}}
+
+_templates = {state: list(variants) for state, variants in DEFAULT_TEMPLATES.items()}
+_counters = {state: 0 for state in DEFAULT_TEMPLATES}
+_lock = threading.Lock()
+
+
+def load_templates(path: str = CANNED_RESPONSES_PATH):
+    """Merge generated variants from disk over the built-in defaults."""
+    if not os.path.exists(path):
+        return
+    try:
+        with open(path, encoding="utf-8") as f:
+            generated = json.load(f)
+    except Exception as e:
+        print(f"❌ Could not load canned responses from {path}: {e}")
+        return
+    with _lock:
+        for state, variants in generated.items():
+            if state in _templates and variants:
+                _templates[state] = list(variants)
+
+
+def get_canned_response(state: str, **fields) -> str:
+    """Return the next variant for a dialog state, rotating round-robin."""
+    with _lock:
+        variants = _templates[state]
+        index = _counters[state] % len(variants)
+        _counters[state] += 1
+        template = variants[index]
+    try:
+        return template.format(**fields)
+    except (KeyError, IndexError, ValueError):
+        return DEFAULT_TEMPLATES[state][0].format(**fields)
+
+
+def is_canned(text: str) -> bool:
+    """True if text is a variant of some dialog state (built-in or loaded), whatever its field values."""
+    with _lock:
+        variants = [v for state in _templates for v in _templates[state] + DEFAULT_TEMPLATES[state]]
+    for template in variants:
+        pattern = "(.+?)".join(re.escape(part) for part in re.split(r"\{\w*\}", template))
+        if re.fullmatch(pattern, text, re.DOTALL):
+            return True
+    return False
+
+
+# ----------------------------
+# Variant generation (offline or background)
+# ----------------------------
+def _valid_variant(state: str, text: str) -> bool:
+    if not text or len(text) > 300:
+        return False
+    # The state's placeholders must survive generation, and no other braces may appear.
+    placeholders = set(re.findall(r"\{(\w*)\}", text))
+    expected = STATE_FIELDS.get(state, set())
+    return placeholders == expected and text.count("{") == len(expected)
+
+
+def generate_variants(state: str, count: int = VARIANTS_PER_STATE) -> list:
+    variants = []
+    for _ in range(count):
+        try:
+            response = chat_completion(build_payload(
+                "canned", [{"role": "user", "content": STATE_PROMPTS[state] + " Return only the line."}]
+            ), timeout=30, purpose="canned")
+            text = response["choices"][0]["message"]["content"].strip().strip('"')
+        except Exception as e:
+            print(f"❌ Variant generation failed for {state}: {e}")
+            break
+        if _valid_variant(state, text) and text not in variants:
+            variants.append(text)
+    return variants
+
+
+def refresh_templates(path: str = CANNED_RESPONSES_PATH) -> dict:
+    """Generate new variants for every state, swap them in, and save them to disk."""
+    fresh = {}
+    for state in DEFAULT_TEMPLATES:
+        variants = generate_variants(state)
+        if variants:
+            fresh[state] = variants
+    if fresh:
+        with _lock:
+            _templates.update(fresh)
+            snapshot = {state: list(variants) for state, variants in _templates.items()}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, indent=2, ensure_ascii=False)
+    return fresh
+
+
+def start_background_refresh(interval: int = CANNED_REFRESH_SECONDS):
+    """Refresh variants from the LLM every `interval` seconds without blocking requests."""
+    if interval <= 0:
+        return None
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            refresh_templates()
+
+    threading.Thread(target=run, name="canned-refresh", daemon=True).start()
+    return stop
+
+
+load_templates()
+
+if __name__ == '__main__':
+    # Offline generation: python -m scripts.canned_responses
+    generated = refresh_templates()
+    print(f"Generated variants for: {', '.join(generated) or 'nothing'} -> {CANNED_RESPONSES_PATH}")
+    sys.exit(0 if generated else 1)
@@ -0,0 +1,266 @@
+# scripts/chat_history.py
+import atexit
+import glob
+import os
+import sqlite3
+import threading
+from contextlib import closing
+from datetime import datetime, timedelta
+
+# ---------- CONFIGURATION ----------
+CHAT_HISTORY_DB_PATH = os.getenv(
+    "CHAT_HISTORY_DB_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "database", "chat_history.db"),
+)
+FLUSH_BATCH_SIZE = int(os.getenv("CHAT_HISTORY_FLUSH_BATCH", "50"))
+FLUSH_INTERVAL_SECONDS = float(os.getenv("CHAT_HISTORY_FLUSH_INTERVAL", "2.0"))
+MAX_DB_BYTES = int(os.getenv("CHAT_HISTORY_MAX_BYTES", str(50 * 1024 * 1024)))
+DEFAULT_PAGE_SIZE = 50
+
+
+class ChatHistoryStore:
+    """
+    Append-only chat turn log with a write-behind buffer.
+
+    record() only appends to an in-memory buffer; a background thread writes
+    the buffer to SQLite in one transaction once FLUSH_BATCH_SIZE turns are
+    pending or FLUSH_INTERVAL_SECONDS have passed, whichever comes first.
+    When the stored turns grow past MAX_DB_BYTES they are moved into a
+    segment file with a timestamp suffix; get_history() reads the live
+    file and every segment.
+
+    The flush thread belongs to one process. A store inherited through
+    fork() (gunicorn workers import app in the master) starts its own
+    thread on the first record() in the child, with the parent's buffer
+    dropped so no turn is written twice.
+    """
+
+    def __init__(self, db_path=CHAT_HISTORY_DB_PATH, batch_size=FLUSH_BATCH_SIZE,
+                 flush_interval=FLUSH_INTERVAL_SECONDS, max_bytes=MAX_DB_BYTES):
+        self.db_path = os.path.abspath(db_path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread_pid = None
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._init_db()
+        atexit.register(self.close)
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _connect(self, path=None):
+        conn = sqlite3.connect(path or self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @staticmethod
+    def _create_schema(conn, schema="main"):
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {schema}.chat_turns (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT,
+                user_email TEXT,
+                user_message TEXT,
+                bot_message TEXT,
+                created_at TEXT NOT NULL
+            )
+        """)
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_chat_turns_session ON chat_turns (session_id, id)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_chat_turns_email ON chat_turns (user_email, id)")
+
+    def _init_db(self):
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._create_schema(conn)
+
+    def _after_fork(self):
+        # Only the forking thread survives: locks it did not hold may be
+        # stuck, and the buffer is still the parent's to flush.
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread_pid = None
+
+    def _ensure_thread(self):
+        # Called with self._lock held
+        if self._thread_pid != os.getpid() and not self._stopped:
+            self._thread_pid = os.getpid()
+            threading.Thread(target=self._run, name="chat-history-flush", daemon=True).start()
+
+    # ----------------------------
+    # Write path
+    # ----------------------------
+    def record(self, session_id: str, user_email: str, user_message: str, bot_message: str):
+        """Queue one chat turn; returns immediately."""
+        turn = (session_id, user_email, user_message, bot_message, datetime.now().isoformat())
+        with self._lock:
+            self._ensure_thread()
+            self._buffer.append(turn)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        """Write every buffered turn to disk now."""
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        if not batch:
+            return 0
+        with self._write_lock:
+            try:
+                with self._connect() as conn:
+                    conn.executemany(
+                        "INSERT INTO chat_turns (session_id, user_email, user_message, bot_message, created_at) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        batch,
+                    )
+            except Exception as e:
+                print(f"❌ Chat history flush failed, requeueing {len(batch)} turns: {e}")
+                with self._lock:
+                    self._buffer[:0] = batch
+                return 0
+            self._rotate_if_needed()
+        return len(batch)
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def close(self):
+        self._stopped = True
+        self._wake.set()
+        self.flush()
+
+    # ----------------------------
+    # Rotation and compaction
+    # ----------------------------
+    @staticmethod
+    def _used_bytes(conn) -> int:
+        # Pages holding data; rows moved out leave free pages that are reused
+        page_count, freelist, page_size = (
+            conn.execute(f"PRAGMA {pragma}").fetchone()[0] for pragma in ("page_count", "freelist_count", "page_size")
+        )
+        return (page_count - freelist) * page_size
+
+    def _rotate_if_needed(self):
+        """
+        Move every turn into a timestamped segment once the live data passes
+        max_bytes. The live file is never renamed or deleted, as other
+        workers keep it open: rows are copied into the segment and deleted
+        in one write transaction, whose SQLite lock serialises workers that
+        decide to rotate at the same time.
+        """
+        with closing(self._connect()) as conn:
+            if self._used_bytes(conn) < self.max_bytes:
+                return
+            stamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
+            root, ext = os.path.splitext(self.db_path)
+            segment = f"{root}.{stamp}{ext}"
+            partial = f"{segment}.partial"  # not matched by rotated_files() until complete
+            conn.execute("ATTACH DATABASE ? AS segment", (partial,))
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                moved = 0
+                if self._used_bytes(conn) >= self.max_bytes:  # another worker may have just rotated
+                    self._create_schema(conn, "segment")
+                    moved = conn.execute("INSERT INTO segment.chat_turns SELECT * FROM main.chat_turns").rowcount
+                    conn.execute("DELETE FROM main.chat_turns")
+                conn.execute("COMMIT")
+            except sqlite3.Error as e:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                print(f"⚠️ Chat history rotation failed, retrying after the next flush: {e}")
+                moved = 0
+            finally:
+                conn.execute("DETACH DATABASE segment")
+                if not moved and os.path.exists(partial):
+                    os.remove(partial)
+        if moved:
+            os.replace(partial, segment)
+            print(f"📦 Chat history rotated {moved} turns to {segment}")
+
+    def rotated_files(self) -> list:
+        root, ext = os.path.splitext(self.db_path)
+        return sorted(glob.glob(f"{root}.*{ext}"))
+
+    def compact(self, keep_days: int = 90, keep_rotated: int = 5):
+        """Drop turns older than keep_days, reclaim space, and delete surplus rotated files."""
+        self.flush()
+        cutoff = (datetime.now() - timedelta(days=keep_days)).isoformat()
+        with self._write_lock:
+            with self._connect() as conn:
+                deleted = conn.execute("DELETE FROM chat_turns WHERE created_at < ?", (cutoff,)).rowcount
+            conn = self._connect()
+            conn.execute("VACUUM")
+            conn.close()
+        rotated = self.rotated_files()
+        for path in rotated[:max(0, len(rotated) - keep_rotated)]:
+            os.remove(path)
+        return deleted
+
+    # ----------------------------
+    # Read path
+    # ----------------------------
+    def get_history(self, session_id: str = None, user_email: str = None,
+                    page: int = 1, page_size: int = DEFAULT_PAGE_SIZE) -> dict:
+        """
+        Page through stored turns, newest first, across rotated segments.
+
+        Args:
+            session_id: Only turns from this session (optional)
+            user_email: Only turns from this user (optional)
+            page: 1-based page number
+            page_size: Turns per page
+
+        Returns:
+            Dict with page, page_size, total and the list of turns
+        """
+        self.flush()
+        filters, params = [], []
+        if session_id:
+            filters.append("session_id = ?")
+            params.append(session_id)
+        if user_email:
+            filters.append("user_email = ?")
+            params.append(user_email)
+        where = f"WHERE {' AND '.join(filters)}" if filters else ""
+        page = max(1, int(page))
+        page_size = max(1, min(int(page_size), 500))
+
+        # Live file first, then segments newest to oldest: ids only grow
+        total, offset, turns = 0, (page - 1) * page_size, []
+        for path in [self.db_path] + self.rotated_files()[::-1]:
+            with closing(self._connect(path)) as conn:
+                count = conn.execute(f"SELECT COUNT(*) FROM chat_turns {where}", params).fetchone()[0]
+                if len(turns) < page_size and offset < count:
+                    rows = conn.execute(
+                        f"SELECT * FROM chat_turns {where} ORDER BY id DESC LIMIT ? OFFSET ?",
+                        params + [page_size - len(turns), offset],
+                    ).fetchall()
+                    turns.extend(dict(row) for row in rows)
+            total += count
+            offset = max(0, offset - count)
+        return {
+            "page": page,
+            "page_size": page_size,
+            "total": total,
+            "turns": turns,
+        }
+
+
+_history = None
+_history_lock = threading.Lock()
+
+def get_chat_history() -> ChatHistoryStore:
+    global _history
+    with _history_lock:
+        if _history is None:
+            _history = ChatHistoryStore()
+        return _history
@@ -1,11 +1,45 @@
 # scripts/chat_interface.py
+# How resolver workflows talk to the user. A workflow that needs more
+# details raises NeedInput instead of blocking on input(); the caller (web
+# chat, inbox pipeline, CLI) asks the user and re-runs the workflow with
+# the answer merged into its IDs. Prompts are raised before a workflow
+# contacts SAP, so re-running it from the top resumes where it stopped.
+from scripts.extractor import extract_ids
+
 
 def send_ai_message(message: str):
     """Simulate AI assistant sending a message."""
     print(f"🤖 {message}")  # You can replace this with a real chatbot frontend callback if needed.
 
-# scripts/chat_interface.py
 
-def ask_user_for_input(prompt: str) -> str:
-    """Simulate AI assistant asking user for input."""
-    return input(f"🧑 {prompt}")  # Replace this with a real input capture if you're using a web interface or chat GUI.
+class NeedInput(Exception):
+    """Raised by a workflow that cannot continue without one of `fields` from the user."""
+
+    def __init__(self, prompt: str, fields):
+        super().__init__(prompt)
+        self.prompt = prompt
+        self.fields = tuple(fields)
+
+    def to_event(self) -> dict:
+        """The "need input" event sent to the chat client."""
+        return {"prompt": self.prompt, "fields": list(self.fields)}
+
+
+def ask_user_for_input(prompt: str, fields):
+    """
+    Pause the workflow until the user supplies one of `fields`.
+
+    Args:
+        prompt: Question shown to the user
+        fields: Acceptable answers, any of po_id, asn_id, pallet_id
+
+    Raises:
+        NeedInput, always; the caller resumes the workflow later
+    """
+    raise NeedInput(prompt, fields)
+
+
+def parse_user_input(message: str, fields) -> dict:
+    """IDs of the requested types found in the user's reply (empty if there are none)."""
+    ids = extract_ids(message or "")
+    return {field: ids[field] for field in fields if ids.get(field)}
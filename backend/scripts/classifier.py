@@ -2,50 +2,58 @@ import requests
 import os
 import re
 import time
-
-# Use environment variable or replace directly
-GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
-
-API_URL = "https://api.groq.com/openai/v1/chat/completions"
-HEADERS = {
-    "Authorization": f"Bearer {GROQ_API_KEY}",
-    "Content-Type": "application/json"
-}
+import json
+from scripts.extractor import extract_all_ids
+from scripts.llm_client import achat_completion, backoff_delay, chat_completion, get_circuit_breaker, remaining_time
+from scripts.metrics import CLASSIFY_SECONDS
+from scripts.model_router import build_payload
 
 VALID_LABELS = ["missing_asn", "missing_po", "missing_pallet", "quantity_mismatch", "unknown"]
-MODEL = "llama3-8b-8192"  # Or "llama3-8b-instruct" if preferred
+ID_FIELDS = ("po_id", "asn_id", "pallet_id")
 
 def classify(email_body: str) -> str:
+    with CLASSIFY_SECONDS.time(method="label") as labels:
+        label = _classify(email_body)
+        labels["outcome"] = label
+    return label
+
+async def aclassify(email_body: str) -> str:
+    """classify() for the asyncio core: the LLM wait does not hold a thread."""
+    with CLASSIFY_SECONDS.time(method="label") as labels:
+        try:
+            response = await achat_completion(_label_payload(email_body), timeout=30, purpose="classify")
+            label = _label_from_reply(response)
+        except requests.exceptions.Timeout:
+            print("❌ Classification request timed out.")
+            label = "unknown"
+        except Exception as e:
+            print("❌ Classification error:", e)
+            label = "unknown"
+        labels["outcome"] = label
+    return label
+
+def _label_payload(email_body: str) -> dict:
+    prompt = (
+        "Classify the issue in the following warehouse message as one of:\n"
+        "missing_asn, missing_po, missing_pallet, quantity_mismatch, unknown.\n"
+        "Respond ONLY with the label, no explanation.\n\n"
+        f"Email: {email_body}"
+    )
+    return build_payload("classify", [{"role": "user", "content": prompt}])
+
+def _label_from_reply(response: dict) -> str:
+    result = response["choices"][0]["message"]["content"].strip().lower()
+
+    # Validate output
+    for label in VALID_LABELS:
+        if label == result:
+            return label
+    return "unknown"
+
+def _classify(email_body: str) -> str:
     try:
-        prompt = (
-            "Classify the issue in the following warehouse message as one of:\n"
-            "missing_asn, missing_po, missing_pallet, quantity_mismatch, unknown.\n"
-            "Respond ONLY with the label, no explanation.\n\n"
-            f"Email: {email_body}"
-        )
-
-        payload = {
-            "model": MODEL,
-            "messages": [
-                {"role": "user", "content": prompt}
-            ],
-            "temperature": 0.0
-        }
-
-        response = requests.post(
-            API_URL,
-            headers=HEADERS,
-            json=payload,
-            timeout=30
-        )
-        response.raise_for_status()
-        result = response.json()["choices"][0]["message"]["content"].strip().lower()
-
-        # Validate output
-        for label in VALID_LABELS:
-            if label == result:
-                return label
-        return "unknown"
+        response = chat_completion(_label_payload(email_body), timeout=30, purpose="classify")
+        return _label_from_reply(response)
 
     except requests.exceptions.Timeout:
         print("❌ Classification request timed out.")
@@ -54,11 +62,109 @@ def classify(email_body: str) -> str:
         print("❌ Classification error:", e)
         return "unknown"
 
-def classify_with_retry(email_body: str, retries=2, delay=3):
+def classify_with_retry(email_body: str, retries=2, delay=None):
+    """
+    Re-ask when the model answers "unknown". Transport errors are already
+    retried inside chat_completion, so this only backs off (jittered, or a
+    fixed `delay`) while the deadline allows and the provider is healthy.
+    """
     for attempt in range(retries):
         label = classify(email_body)
-        if label != "unknown":
+        if label != "unknown" or attempt == retries - 1:
             return label
-        print(f"⚠️ Retry {attempt + 1}/{retries} after {delay}s...")
-        time.sleep(delay)
+        wait = backoff_delay(attempt) if delay is None else delay
+        remaining = remaining_time()
+        if get_circuit_breaker().state == "open" or (remaining is not None and wait >= remaining):
+            break
+        print(f"⚠️ Retry {attempt + 1}/{retries} after {wait:.1f}s...")
+        time.sleep(wait)
     return "unknown"
+
+
+def _parse_structured(content: str, message: str) -> dict:
+    """Validate the structured reply; raises ValueError if it does not match the schema."""
+    data = json.loads(content)
+    if not isinstance(data, dict):
+        raise ValueError("reply is not a JSON object")
+
+    label = str(data.get("label", "")).strip().lower()
+    if label not in VALID_LABELS:
+        raise ValueError(f"invalid label: {label!r}")
+
+    acknowledgement = data.get("acknowledgement")
+    if not isinstance(acknowledgement, str) or not acknowledgement.strip():
+        raise ValueError("missing acknowledgement")
+
+    # The model only picks among IDs that occur in the message (a made-up
+    # PO or ASN would drive a real SAP trigger); the local regex extraction
+    # fills any field the model left empty, invented or got wrong.
+    raw_ids = data.get("ids") or {}
+    if not isinstance(raw_ids, dict):
+        raise ValueError("ids is not an object")
+    in_message = extract_all_ids(message)
+    ids = {}
+    for field in ID_FIELDS:
+        value = raw_ids.get(field)
+        value = str(value).strip() if value not in (None, "", "null") else None
+        if value not in in_message[field]:
+            value = in_message[field][0] if in_message[field] else None
+        ids[field] = value
+
+    return {"label": label, "ids": ids, "acknowledgement": acknowledgement.strip()}
+
+def classify_extract_acknowledge(message: str):
+    """
+    Classify, extract IDs and write the acknowledgement in one LLM call.
+
+    Args:
+        message: The user's issue message
+
+    Returns:
+        Dict with label, ids and acknowledgement, or None if the call or
+        schema validation fails (callers fall back to classify + extract_ids).
+    """
+    with CLASSIFY_SECONDS.time(method="structured") as labels:
+        structured = _classify_extract_acknowledge(message)
+        labels["outcome"] = structured["label"] if structured else "rejected"
+    return structured
+
+async def aclassify_extract_acknowledge(message: str):
+    """classify_extract_acknowledge() for the asyncio core."""
+    with CLASSIFY_SECONDS.time(method="structured") as labels:
+        try:
+            response = await achat_completion(_structured_payload(message), timeout=30, purpose="classify")
+            structured = _parse_structured(response["choices"][0]["message"]["content"], message)
+        except Exception as e:
+            _report_structured_error(e)
+            structured = None
+        labels["outcome"] = structured["label"] if structured else "rejected"
+    return structured
+
+def _structured_payload(message: str) -> dict:
+    prompt = (
+        "You are a warehouse assistant. Analyse the warehouse message below and reply with ONE JSON object:\n"
+        '{"label": one of missing_asn, missing_po, missing_pallet, quantity_mismatch, unknown,\n'
+        ' "ids": {"po_id": 10 digits starting with 2 or null, "asn_id": 5 digits starting with 0 or null,'
+        ' "pallet_id": 15 digits starting with 5 or null},\n'
+        ' "acknowledgement": one crisp line telling the user what the issue was identified as and which IDs'
+        ' you are working with; do not ask questions}\n'
+        "Copy IDs exactly as written in the message. Return only the JSON.\n\n"
+        f"Message: {message}"
+    )
+    return build_payload("classify", [{"role": "user", "content": prompt}], response_format={"type": "json_object"})
+
+def _report_structured_error(e: Exception):
+    if isinstance(e, requests.exceptions.Timeout):
+        print("❌ Structured classification request timed out.")
+    elif isinstance(e, (ValueError, KeyError, TypeError)):
+        print("❌ Structured classification reply rejected:", e)
+    else:
+        print("❌ Structured classification error:", e)
+
+def _classify_extract_acknowledge(message: str):
+    try:
+        content = chat_completion(_structured_payload(message), timeout=30, purpose="classify")["choices"][0]["message"]["content"]
+        return _parse_structured(content, message)
+    except Exception as e:
+        _report_structured_error(e)
+    return None
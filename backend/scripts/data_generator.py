@@ -1,69 +1,347 @@
-print("Script started")
-import sqlite3
-from faker import Faker
+# scripts/data_generator.py
+# Synthetic warehouse data for benchmarks and performance tests.
+#
+# Writes PO_Header, PO_Line, ASN_Header and ASN_Line in the schema the app
+# queries, in batched executemany transactions, from a deterministic seed
+# (same seed and --as-of, same database). Missing ASNs, missing pallets and
+# quantity mismatches are injected at configurable rates; a manifest lists
+# the affected IDs and, optionally, SAP Excel replies are written for them.
+#
+#   cd backend
+#   python -m scripts.data_generator --db ../database/bench.db --asns 10000 --pos-per-asn 50
+#   python -m scripts.data_generator --db /tmp/small.db --asns 20 --fixtures-dir /tmp/sap_fixtures
+#
+# last_updated is spread over DATA_GEN_SPREAD_DAYS before --as-of, so rows
+# added with --append are mostly older than a running server's data. The
+# ID index still picks them up on its next refresh, which reads new rows
+# by rowid (scripts/id_index.py), not by last_updated.
+import argparse
+import json
+import os
 import random
-from datetime import datetime
+import sqlite3
+import string
+import sys
+import time
+from datetime import datetime, timedelta
 
+# ---------- CONFIGURATION ----------
+DATA_GEN_BATCH_SIZE = int(os.getenv("DATA_GEN_BATCH_SIZE", "50000"))  # rows per transaction
+DATA_GEN_SPREAD_DAYS = int(os.getenv("DATA_GEN_SPREAD_DAYS", "30"))  # last_updated spread before --as-of
 
-fake = Faker()
-conn = sqlite3.connect("database/edittrack.db")
-cursor = conn.cursor()
+# ID formats, as matched by scripts/extractor.py
+ASN_ID_SPACE = 10 ** 4  # "0" + 4 digits
+PO_ID_SPACE = 10 ** 9  # "2" + 9 digits
+PALLET_ID_SPACE = 10 ** 14  # "5" + 14 digits
 
-def create_tables():
-    cursor.execute('''CREATE TABLE IF NOT EXISTS PO_Header (
+PO_STATUSES = ("inprogress", "received", "hold")
+FAULT_KINDS = ("missing_asn", "missing_pallet", "quantity_mismatch")
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS PO_Header (
         po_id TEXT PRIMARY KEY,
         status TEXT,
-        last_updated TEXT)''')
-
-    cursor.execute('''CREATE TABLE IF NOT EXISTS PO_Line (
+        last_updated TEXT)""",
+    """CREATE TABLE IF NOT EXISTS PO_Line (
         pallet_id TEXT PRIMARY KEY,
         po_id TEXT,
-        asn TEXT,
+        asn_id TEXT,
         last_updated TEXT,
-        quantity INTEGER)''')
-
-    cursor.execute('''CREATE TABLE IF NOT EXISTS ASN_Header (
-        asn TEXT PRIMARY KEY,
+        quantity INTEGER)""",
+    """CREATE TABLE IF NOT EXISTS ASN_Header (
+        asn_id TEXT PRIMARY KEY,
         supplier_reference TEXT,
-        last_updated TEXT)''')
-
-    cursor.execute('''CREATE TABLE IF NOT EXISTS ASN_Line (
+        last_updated TEXT)""",
+    """CREATE TABLE IF NOT EXISTS ASN_Line (
         pallet_id TEXT PRIMARY KEY,
         po_id TEXT,
-        asn TEXT,
+        asn_id TEXT,
         supplier_reference TEXT,
         last_updated TEXT,
-        quantity INTEGER)''')
-    conn.commit()
-
-def generate_data():
-    print("Generating synthetic warehouse data...\n")
-    for _ in range(5):  # 5 ASNs
-        asn = f"0{fake.random_number(digits=4)}"
-        supplier_ref = fake.bothify(text='???###')
-        cursor.execute("INSERT INTO ASN_Header VALUES (?, ?, ?)", 
-                       (asn, supplier_ref, str(datetime.now())))
-        print(f"[OK] Created ASN: {asn} with supplier_ref: {supplier_ref}")
-
-        for _ in range(2):  # 2 POs per ASN
-            po_id = f"2{fake.random_number(digits=9)}"
-            status = random.choice(['inprogress', 'received', 'hold'])
-            cursor.execute("INSERT INTO PO_Header VALUES (?, ?, ?)", 
-                           (po_id, status, str(datetime.now())))
-            print(f"   PO: {po_id} ({status})")
-
-            for _ in range(random.randint(2, 4)):  # pallets per PO
-                pallet_id = f"5{fake.random_number(digits=14)}"
-                quantity = random.randint(1, 5)
-                cursor.execute("INSERT INTO PO_Line VALUES (?, ?, ?, ?, ?)", 
-                               (pallet_id, po_id, asn, str(datetime.now()), quantity))
-                cursor.execute("INSERT INTO ASN_Line VALUES (?, ?, ?, ?, ?, ?)", 
-                               (pallet_id, po_id, asn, supplier_ref, str(datetime.now()), quantity))
-                print(f"      Pallet: {pallet_id}, Qty: {quantity}")
-
-    conn.commit()
-    print("\n Data inserted successfully!")
-
-create_tables()
-generate_data()
-conn.close()
+        quantity INTEGER)""",
+)
+
+INSERTS = {
+    "PO_Header": "INSERT INTO PO_Header (po_id, status, last_updated) VALUES (?, ?, ?)",
+    "PO_Line": "INSERT INTO PO_Line (pallet_id, po_id, asn_id, last_updated, quantity) VALUES (?, ?, ?, ?, ?)",
+    "ASN_Header": "INSERT INTO ASN_Header (asn_id, supplier_reference, last_updated) VALUES (?, ?, ?)",
+    "ASN_Line": (
+        "INSERT INTO ASN_Line (pallet_id, po_id, asn_id, supplier_reference, last_updated, quantity) "
+        "VALUES (?, ?, ?, ?, ?, ?)"
+    ),
+}
+
+
+# ----------------------------
+# IDs and values
+# ----------------------------
+def asn_id(n: int) -> str:
+    return f"0{n:04d}"
+
+def po_id(n: int) -> str:
+    return f"2{n:09d}"
+
+def pallet_id(n: int) -> str:
+    return f"5{n:014d}"
+
+
+def supplier_reference(rng: random.Random) -> str:
+    return "".join(rng.choices(string.ascii_letters, k=3)) + "".join(rng.choices(string.digits, k=3))
+
+
+def _id_sequence(rng: random.Random, space: int, fmt):
+    """
+    Stream of distinct IDs in random-looking order: n -> (a*n + b) mod
+    space is a permutation when a is coprime with the power of ten `space`,
+    so no set of drawn IDs has to be kept in memory.
+    """
+    a = rng.randrange(1, space)
+    while a % 2 == 0 or a % 5 == 0:
+        a = rng.randrange(1, space)
+    b = rng.randrange(space)
+    for n in range(space):
+        yield fmt((a * n + b) % space)
+
+
+def _parse_range(text: str):
+    low, _, high = str(text).partition("-")
+    low = int(low)
+    high = int(high or low)
+    if low < 1 or high < low:
+        raise argparse.ArgumentTypeError(f"expected N or MIN-MAX with 1 <= MIN <= MAX, got {text!r}")
+    return low, high
+
+
+# ----------------------------
+# Generation
+# ----------------------------
+class _Writer:
+    """Buffers rows per table and writes them with executemany, one transaction per batch."""
+
+    def __init__(self, conn, batch_size: int):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.pending = {table: [] for table in INSERTS}
+        self.buffered = 0
+        self.written = {table: 0 for table in INSERTS}
+        self.started = time.perf_counter()
+
+    def add(self, table: str, row: tuple):
+        self.pending[table].append(row)
+        self.buffered += 1
+        if self.buffered >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffered:
+            return
+        with self.conn:
+            for table, rows in self.pending.items():
+                if rows:
+                    self.conn.executemany(INSERTS[table], rows)
+                    self.written[table] += len(rows)
+                    rows.clear()
+        self.buffered = 0
+        total = sum(self.written.values())
+        print(f"📦 {total} rows written ({total / (time.perf_counter() - self.started):.0f} rows/s)")
+
+
+class _Cases:
+    """Counts injected faults and keeps the first `limit` of each kind for the manifest."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.counts = {kind: 0 for kind in FAULT_KINDS + ("clean",)}
+        self.samples = {kind: [] for kind in FAULT_KINDS + ("clean",)}
+
+    def add(self, kind: str, case: dict):
+        self.counts[kind] += 1
+        if len(self.samples[kind]) < self.limit:
+            self.samples[kind].append(case)
+
+
+def generate(conn, asns: int, pos_per_asn=(2, 2), pallets_per_po=(2, 4), seed: int = 42,
+             missing_asn_rate: float = 0.02, missing_pallet_rate: float = 0.02, mismatch_rate: float = 0.05,
+             as_of: datetime = None, batch_size: int = DATA_GEN_BATCH_SIZE, manifest_limit: int = 1000) -> dict:
+    """
+    Write a synthetic dataset into conn (tables are created if missing).
+
+    Args:
+        conn: sqlite3 connection to the target database
+        asns: ASNs to generate (at most 10,000, the size of the ASN ID space)
+        pos_per_asn / pallets_per_po: (min, max) drawn uniformly per ASN / per PO
+        seed: Random seed; with the same as_of the output is identical
+        missing_asn_rate: Share of ASNs whose header and lines are left out
+            (their POs still reference them in PO_Line)
+        missing_pallet_rate: Share of pallets in PO_Line but absent from ASN_Line
+        mismatch_rate: Share of POs where one pallet's ASN quantity differs from the PO
+        as_of: Newest last_updated; rows are spread over DATA_GEN_SPREAD_DAYS before it
+        batch_size: Rows per executemany transaction
+        manifest_limit: Cases of each kind listed in the returned manifest
+
+    Returns:
+        Manifest dict: seed, row counts per table, fault counts and sample
+        cases ({"asn_id", "po_id", "pallet_id", "rows"}) per kind
+    """
+    if asns > ASN_ID_SPACE:
+        raise ValueError(f"At most {ASN_ID_SPACE} ASNs fit the 0XXXX format; raise --pos-per-asn instead")
+    rng = random.Random(seed)
+    as_of = as_of or datetime.now()
+    spread = DATA_GEN_SPREAD_DAYS * 86400
+
+    def timestamp():
+        return str(as_of - timedelta(seconds=rng.random() * spread))
+
+    for statement in SCHEMA:
+        conn.execute(statement)
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA journal_mode = MEMORY")
+
+    plan = [rng.randint(*pos_per_asn) for _ in range(asns)]
+    asn_ids = _id_sequence(rng, ASN_ID_SPACE, asn_id)
+    po_ids = _id_sequence(rng, PO_ID_SPACE, po_id)
+    pallet_ids = _id_sequence(rng, PALLET_ID_SPACE, pallet_id)
+
+    writer = _Writer(conn, batch_size)
+    cases = _Cases(manifest_limit)
+    for asn, po_count in zip(asn_ids, plan):
+        supplier_ref = supplier_reference(rng)
+        asn_missing = rng.random() < missing_asn_rate
+        if not asn_missing:
+            writer.add("ASN_Header", (asn, supplier_ref, timestamp()))
+        asn_rows = []
+        faulted = False  # a pallet of this ASN was dropped or given another quantity
+        shipped = None  # first row written to ASN_Line
+
+        for _ in range(po_count):
+            po = next(po_ids)
+            writer.add("PO_Header", (po, rng.choice(PO_STATUSES), timestamp()))
+            pallets = [(next(pallet_ids), rng.randint(1, 5)) for _ in range(rng.randint(*pallets_per_po))]
+            mismatched = None if asn_missing or rng.random() >= mismatch_rate else rng.randrange(len(pallets))
+            po_rows = []
+
+            for i, (pallet, qty) in enumerate(pallets):
+                updated = timestamp()
+                writer.add("PO_Line", (pallet, po, asn, updated, qty))
+                row = {"pallet_id": pallet, "po_id": po, "asn_id": asn, "qty": qty}
+                po_rows.append(row)
+                if asn_missing:
+                    continue
+                if rng.random() < missing_pallet_rate:
+                    faulted = True
+                    cases.add("missing_pallet", {"asn_id": asn, "po_id": po, "pallet_id": pallet, "rows": [row]})
+                    continue
+                asn_qty = qty + rng.choice((-1, 1)) * rng.randint(1, 3) if i == mismatched else qty
+                writer.add("ASN_Line", (pallet, po, asn, supplier_ref, updated, max(asn_qty, 0)))
+                shipped = shipped or row
+
+            asn_rows.extend(po_rows)
+            if mismatched is not None:
+                faulted = True
+                cases.add("quantity_mismatch", {"asn_id": asn, "po_id": po,
+                                                "pallet_id": pallets[mismatched][0], "rows": po_rows})
+
+        if asn_missing:
+            cases.add("missing_asn", {"asn_id": asn, "po_id": asn_rows[0]["po_id"] if asn_rows else None,
+                                      "pallet_id": None, "rows": asn_rows})
+        elif shipped and not faulted:
+            cases.add("clean", {"asn_id": asn, "po_id": shipped["po_id"],
+                                "pallet_id": shipped["pallet_id"], "rows": []})
+    writer.flush()
+
+    return {
+        "seed": seed,
+        "as_of": str(as_of),
+        "rows": writer.written,
+        "faults": cases.counts,
+        "cases": cases.samples,
+    }
+
+
+# ----------------------------
+# SAP Excel fixtures
+# ----------------------------
+def write_sap_fixtures(manifest: dict, directory: str, per_kind: int = 20) -> list:
+    """
+    Write the Excel reply SAP would send for the first `per_kind` cases of
+    each fault (columns pallet_id, po_id, asn_id, qty, as the resolver reads
+    them). Returns the paths written; none without pandas/openpyxl.
+    """
+    try:
+        import pandas as pd
+        import openpyxl  # noqa: F401  (pandas' xlsx writer)
+    except ImportError:
+        print("⚠️ pandas/openpyxl not installed, skipping SAP Excel fixtures")
+        return []
+
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for kind in FAULT_KINDS:
+        for case in manifest["cases"][kind][:per_kind]:
+            key = case["pallet_id"] if kind == "missing_pallet" else case["po_id"] if kind == "quantity_mismatch" else case["asn_id"]
+            path = os.path.join(directory, f"{kind}_{key}.xlsx")
+            pd.DataFrame(case["rows"], columns=["pallet_id", "po_id", "asn_id", "qty"]).to_excel(path, index=False)
+            case["fixture"] = path
+            paths.append(path)
+    return paths
+
+
+# ----------------------------
+# CLI
+# ----------------------------
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Generate a synthetic warehouse database for performance tests.")
+    parser.add_argument("--db", required=True, help="SQLite file to create")
+    parser.add_argument("--append", action="store_true", help="add to an existing database instead of refusing")
+    parser.add_argument("--asns", type=int, default=1000, help="ASNs to generate (max 10000)")
+    parser.add_argument("--pos-per-asn", type=_parse_range, default=(2, 2), help="N or MIN-MAX")
+    parser.add_argument("--pallets-per-po", type=_parse_range, default=(2, 4), help="N or MIN-MAX")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--as-of", type=datetime.fromisoformat, help="newest last_updated (default: now)")
+    parser.add_argument("--missing-asn-rate", type=float, default=0.02)
+    parser.add_argument("--missing-pallet-rate", type=float, default=0.02)
+    parser.add_argument("--mismatch-rate", type=float, default=0.05)
+    parser.add_argument("--batch-size", type=int, default=DATA_GEN_BATCH_SIZE, help="rows per transaction")
+    parser.add_argument("--manifest", help="write the fault manifest JSON here (default: <db>.manifest.json)")
+    parser.add_argument("--manifest-limit", type=int, default=1000, help="cases listed per fault kind")
+    parser.add_argument("--fixtures-dir", help="write SAP Excel replies for injected faults here")
+    parser.add_argument("--fixtures-per-kind", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.db) and not args.append:
+        print(f"❌ {args.db} already exists; pass --append or choose another path")
+        return 1
+
+    started = time.perf_counter()
+    conn = sqlite3.connect(args.db)
+    try:
+        manifest = generate(
+            conn, args.asns, args.pos_per_asn, args.pallets_per_po, seed=args.seed,
+            missing_asn_rate=args.missing_asn_rate, missing_pallet_rate=args.missing_pallet_rate,
+            mismatch_rate=args.mismatch_rate, as_of=args.as_of, batch_size=args.batch_size,
+            manifest_limit=args.manifest_limit,
+        )
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+    except sqlite3.IntegrityError as e:
+        print(f"❌ {e}: appending needs a different --seed than the existing data")
+        return 1
+    finally:
+        conn.close()
+
+    if args.fixtures_dir:
+        paths = write_sap_fixtures(manifest, args.fixtures_dir, args.fixtures_per_kind)
+        print(f"📎 {len(paths)} SAP Excel fixtures in {args.fixtures_dir}")
+
+    manifest_path = args.manifest or f"{args.db}.manifest.json"
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    print(f"✅ {sum(manifest['rows'].values())} rows in {time.perf_counter() - started:.1f}s -> {args.db}")
+    print(f"   faults: {manifest['faults']}, manifest: {manifest_path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,28 @@
+import os
 import sqlite3
 
-DB_PATH = "D:\genai\inbound receving with full ui\database\warehouse.db"  # Update if different
+from scripts.entity_cache import cached_lookup
+from scripts.id_index import skip_if_absent
+from scripts.metrics import DB_QUERY_SECONDS
+
+DB_PATH = os.getenv("WAREHOUSE_DB_PATH", r"D:\genai\inbound receving with full ui\database\warehouse.db")  # Update if different
 
 def connect_db():
     return sqlite3.connect(DB_PATH)
 
+def timed_query(fn):
+    """Record the latency of every call to fn in db_query_seconds{query=fn name}."""
+    return DB_QUERY_SECONDS.timed(query=fn.__name__)(fn)
+
+# Entity lookups below go through the read-through cache in
+# scripts/entity_cache.py; db_query_seconds only sees the misses. IDs the
+# membership index in scripts/id_index.py rules out skip both.
+
+EMPTY_QTY_SUMMARY = {"asn_pallets": 0, "asn_qty": 0, "po_pallets": 0, "po_qty": 0}
+
+@skip_if_absent("asn_id", "asn_id", False)
+@cached_lookup("asn_id")
+@timed_query
 def check_asn_exists(asn_id):
     with connect_db() as conn:
         cur = conn.cursor()
@@ -25,6 +43,9 @@ def check_asn_exists(asn_id):
     return bool(header_exists and line_exists and po_line_exists)
 
 
+@skip_if_absent("po_id", "po_id", False)
+@cached_lookup("po_id")
+@timed_query
 def check_po_exists(po_id):
     print(f" Checking if PO {po_id} exists in any table...")
     with connect_db() as conn:
@@ -44,6 +65,9 @@ def check_po_exists(po_id):
 
     return bool(header_exists or line_exists or asn_line_exists)
 
+@skip_if_absent("pallet_id", "pallet_id", False)
+@cached_lookup("po_id", "asn_id", "pallet_id")
+@timed_query
 def check_pallet_exists(po_id=None, asn_id=None, pallet_id=None):
     with connect_db() as conn:
         cur = conn.cursor()
@@ -65,16 +89,41 @@ def check_pallet_exists(po_id=None, asn_id=None, pallet_id=None):
                 results = False
     return any(results)
 
+@skip_if_absent("po_id", "po_id", EMPTY_QTY_SUMMARY)
+@cached_lookup("po_id")
+@timed_query
 def get_po_vs_asn_qty_summary(po_id):
     with connect_db() as conn:
         cur = conn.cursor()
 
         # From ASN line
-        cur.execute("SELECT COUNT(DISTINCT pallet_id), SUM(qty) FROM asn_line WHERE po_id = ?", (po_id,))
+        cur.execute("SELECT COUNT(DISTINCT pallet_id), SUM(quantity) FROM asn_line WHERE po_id = ?", (po_id,))
         asn_pallets, asn_qty = cur.fetchone()
 
         # From PO line
-        cur.execute("SELECT COUNT(DISTINCT pallet_id), SUM(qty) FROM po_line WHERE po_id = ?", (po_id,))
+        cur.execute("SELECT COUNT(DISTINCT pallet_id), SUM(quantity) FROM po_line WHERE po_id = ?", (po_id,))
+        po_pallets, po_qty = cur.fetchone()
+
+    return {
+        "asn_pallets": asn_pallets or 0,
+        "asn_qty": asn_qty or 0,
+        "po_pallets": po_pallets or 0,
+        "po_qty": po_qty or 0
+    }
+
+@skip_if_absent("asn_id", "asn_id", EMPTY_QTY_SUMMARY)
+@cached_lookup("asn_id")
+@timed_query
+def get_po_vs_asn_qty_summary_forasn(asn_id):
+    with connect_db() as conn:
+        cur = conn.cursor()
+
+        # From ASN line
+        cur.execute("SELECT COUNT(DISTINCT pallet_id), SUM(quantity) FROM asn_line WHERE asn_id = ?", (asn_id,))
+        asn_pallets, asn_qty = cur.fetchone()
+
+        # From PO line, for every PO shipped on this ASN
+        cur.execute("SELECT COUNT(DISTINCT pallet_id), SUM(quantity) FROM po_line WHERE asn_id = ?", (asn_id,))
         po_pallets, po_qty = cur.fetchone()
 
     return {
@@ -84,6 +133,7 @@ def get_po_vs_asn_qty_summary(po_id):
         "po_qty": po_qty or 0
     }
 
+@timed_query
 def get_existing_pallet_ids(db_path="warehouse.db") -> list:
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
@@ -92,6 +142,7 @@ def get_existing_pallet_ids(db_path="warehouse.db") -> list:
     conn.close()
     return results
 
+@timed_query
 def get_all_rows_from_table(table_name, where_clause="", params=()):
     with connect_db() as conn:
         cur = conn.cursor()
@@ -1,26 +1,56 @@
-import imaplib
 import email
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.image import MIMEImage
+from email.mime.application import MIMEApplication
 import io
-import smtplib
-import time
-import pandas as pd
 import time
 from datetime import datetime, timedelta
-import smtplib
-import requests
 import base64
+import os
+from scripts.llm_client import chat_completion, pause_deadline
+from scripts.model_router import build_payload
+from scripts.metrics import IMAP_POLL_SECONDS, SAP_WAIT_SECONDS, SMTP_SEND_SECONDS
+from scripts.entity_cache import invalidate_entities
+from scripts.id_index import refresh_id_index
+from scripts.screenshot_store import screenshot_attachment
 
 # ---------- CONFIGURATION ----------
-IMAP_SERVER = 'imap.gmail.com'
-SMTP_SERVER = 'smtp.gmail.com'
-EMAIL = 'leakhaa.warehouse.bot123@gmail.com'
-PASSWORD = 'owpc kbzs lskr cfte'  # Gmail app password
-WAREHOUSE_TEAM_EMAIL = 'leakhaganesh@gmail.com'  # Replace with your target email address
+# Every setting can be overridden from the environment, e.g. to point the
+# bot at the local stand-in in scripts/mail_standin.py.
+SAP_EMAIL = os.getenv('SAP_EMAIL', 'warehouse.sap.123@gmail.com')
+IMAP_SERVER = os.getenv('IMAP_SERVER', 'imap.gmail.com')
+IMAP_PORT = int(os.getenv('IMAP_PORT', '993'))
+IMAP_SSL = os.getenv('IMAP_SSL', '1') == '1'
+SMTP_SERVER = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
+SMTP_PORT = int(os.getenv('SMTP_PORT', '465'))
+SMTP_SSL = os.getenv('SMTP_SSL', '1') == '1'
+EMAIL = os.getenv('BOT_EMAIL', 'leakhaa.warehouse.bot123@gmail.com')
+PASSWORD = os.getenv('BOT_EMAIL_PASSWORD', 'owpc kbzs lskr cfte')  # Gmail app password
+WAREHOUSE_TEAM_EMAIL = os.getenv('WAREHOUSE_TEAM_EMAIL', 'leakhaganesh@gmail.com')  # Replace with your target email address
+SAP_POLL_SECONDS = int(os.getenv('SAP_POLL_SECONDS', '30'))
+
+def imap_connect():
+    """Logged-in IMAP connection to the bot mailbox."""
+    import imaplib
+
+    mail = imaplib.IMAP4_SSL(IMAP_SERVER, IMAP_PORT) if IMAP_SSL else imaplib.IMAP4(IMAP_SERVER, IMAP_PORT)
+    mail.login(EMAIL, PASSWORD)
+    return mail
+
+def smtp_connect():
+    """Logged-in SMTP connection for the bot account (use as a context manager)."""
+    import smtplib
+
+    server = smtplib.SMTP_SSL(SMTP_SERVER, SMTP_PORT) if SMTP_SSL else smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
+    server.login(EMAIL, PASSWORD)
+    return server
 
-API_KEY = "sk-xxx"
+def send_message(msg):
+    """Send a prepared MIME message over a fresh SMTP connection."""
+    with SMTP_SEND_SECONDS.time():
+        with smtp_connect() as server:
+            server.send_message(msg)
 
 def generate_email_body(issue_type: str, details: dict) -> str:
     prompt = f"""
@@ -35,24 +65,12 @@ Generate a concise message for the SAP team.
 Only return the email body, without greeting or signature.
 """
 
-    response = requests.post(
-        "https://api.groq.com/openai/v1/chat/completions",
-        headers={
-            "Authorization": f"Bearer {API_KEY}",
-            "Content-Type": "application/json"
-        },
-        json={
-            "model": "llama3-70b-8192",  # ✅ Updated model name
-            "messages": [
-                {"role": "system", "content": "You are an expert email assistant for warehouse operations."},
-                {"role": "user", "content": prompt}
-            ],
-            "temperature": 0.7
-        }
-    )
-
     try:
-        data = response.json()
+        # Model and temperature come from the "sap_email" route in scripts/model_router.py
+        data = chat_completion(build_payload("sap_email", [
+            {"role": "system", "content": "You are an expert email assistant for warehouse operations."},
+            {"role": "user", "content": prompt}
+        ]), timeout=None, purpose="sap_email")
         if "choices" in data:
             return data["choices"][0]["message"]["content"].strip()
         elif "error" in data:
@@ -63,18 +81,36 @@ Only return the email body, without greeting or signature.
         print("Failed to generate email body:", e)
         return "[Email content generation failed.]"
 # ---------- READ UNREAD EMAILS AND RETURN LIST ----------
-def get_unread_emails(from_filter=None):
-    mail = imaplib.IMAP4_SSL(IMAP_SERVER)
-    mail.login(EMAIL, PASSWORD)
+@IMAP_POLL_SECONDS.timed()
+def get_unread_emails(from_filter=None, exclude_from=None, send_confirmation=True, mark_seen=True):
+    """
+    Fetch unread mails as (subject, body, sender) tuples and mark them read.
+
+    Args:
+        from_filter: Only mails from this address (optional)
+        exclude_from: Skip mails from this address, leaving them unread (optional)
+        send_confirmation: Send a "Mail Read Confirmation" to the warehouse team per mail
+        mark_seen: False leaves the mails unread and returns (subject, body,
+            sender, uid) tuples; call mark_emails_seen() once a mail has been
+            handled, so a crash before that leaves it to be picked up again
+    """
+    mail = imap_connect()
     mail.select('inbox')
 
-    result, data = mail.search(None, 'UNSEEN')
+    criteria = ['UNSEEN']
+    if from_filter:
+        criteria.append(f'FROM "{from_filter}"')
+    if exclude_from:
+        criteria.append(f'NOT FROM "{exclude_from}"')
+    # UIDs rather than sequence numbers: they stay valid for mark_emails_seen()
+    # in a later session. BODY.PEEK[] leaves \Seen alone until the mail is handled.
+    result, data = mail.uid('search', None, f"({' '.join(criteria)})")
     mail_ids = data[0].split()
 
     email_data = []
 
     for mail_id in mail_ids:
-        result, message_data = mail.fetch(mail_id, '(RFC822)')
+        result, message_data = mail.uid('fetch', mail_id, '(BODY.PEEK[])')
         raw_email = message_data[0][1]
         msg = email.message_from_bytes(raw_email)
 
@@ -99,38 +135,67 @@ def get_unread_emails(from_filter=None):
         print("Body Preview:", body[:100].encode('ascii', errors='replace').decode('ascii'))
 
         # Send confirmation
-        confirmation = f"Mail with subject '{subject}' has been read successfully."
-        send_email(WAREHOUSE_TEAM_EMAIL, "Mail Read Confirmation", confirmation)
+        if send_confirmation:
+            send_read_confirmation(subject)
 
         # Append to list
-        email_data.append((subject.strip(), body.strip(), sender_email.strip()))
+        if mark_seen:
+            mail.uid('store', mail_id, '+FLAGS', '(\\Seen)')
+            email_data.append(((subject or "").strip(), body.strip(), (sender_email or "").strip()))
+        else:
+            email_data.append(((subject or "").strip(), body.strip(), (sender_email or "").strip(), mail_id.decode()))
 
+    mail.logout()
     return email_data
 
+def send_read_confirmation(subject):
+    """Tell the warehouse team a mail has been read."""
+    confirmation = f"Mail with subject '{subject}' has been read successfully."
+    send_email(WAREHOUSE_TEAM_EMAIL, "Mail Read Confirmation", confirmation)
+
+def mark_emails_seen(uids):
+    """Flag mails returned by get_unread_emails(mark_seen=False) as read."""
+    if not uids:
+        return
+    mail = imap_connect()
+    mail.select('inbox')
+    mail.uid('store', ",".join(uids), '+FLAGS', '(\\Seen)')
+    mail.logout()
+
+
 
+def wait_for_excel_from_sap(subject_keyword="SAP Reply", timeout=500, check_interval=None):
+    with pause_deadline(), SAP_WAIT_SECONDS.time(kind="excel") as labels:
+        df = _wait_for_excel_from_sap(subject_keyword, timeout, check_interval)
+        labels["outcome"] = "received" if df is not None else "timeout"
+    return df
 
-def wait_for_excel_from_sap(subject_keyword="SAP Reply", timeout=500, check_interval=15):
+def _wait_for_excel_from_sap(subject_keyword, timeout, check_interval):
     print("Waiting for SAP Excel mail...")
+    check_interval = check_interval or SAP_POLL_SECONDS
 
     end_time = time.time() + timeout
 
     while time.time() < end_time:
         try:
-            mail = imaplib.IMAP4_SSL(IMAP_SERVER)
-            mail.login(EMAIL, PASSWORD)
-            mail.select("inbox")
-
-            status, data = mail.search(None, f'(UNSEEN SUBJECT "{subject_keyword}")')
+            with IMAP_POLL_SECONDS.time():
+                mail = imap_connect()
+                mail.select("inbox")
+                status, data = mail.uid('search', None, f'(UNSEEN SUBJECT "{subject_keyword}")')
 
             for num in data[0].split():
-                typ, msg_data = mail.fetch(num, '(RFC822)')
+                # Peek, and only mark the mail read once its Excel has been parsed
+                typ, msg_data = mail.uid('fetch', num, '(BODY.PEEK[])')
                 raw_email = msg_data[0][1]
                 msg = email.message_from_bytes(raw_email)
 
                 for part in msg.walk():
                     if part.get_content_type() == "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet":
                         attachment = part.get_payload(decode=True)
+                        import pandas as pd
+
                         df = pd.read_excel(io.BytesIO(attachment))
+                        mail.uid('store', num, '+FLAGS', '(\\Seen)')
                         print("Excel received from SAP.")
                         return df
 
@@ -141,24 +206,78 @@ def wait_for_excel_from_sap(subject_keyword="SAP Reply", timeout=500, check_inte
     print("No reply received from SAP in given time.")
     return None
 
-def wait_for_trigger_confirmation_from_sap(keyword: str, timeout_minutes: int = 10):
+def wait_for_trigger_confirmation_from_sap(keyword: str, timeout_minutes: int = 10, correlation_id: str = None):
     """
     Waits for an email from SAP confirming action (Triggered/Not Triggered).
-    Returns either 'triggered', 'not_triggered', or None if timeout.
+    With the correlation ID of a batched request (scripts/sap_batcher.py)
+    only the reply recorded for that request counts, and a batch that could
+    not be mailed ends the wait at once.
+    Returns either 'triggered', 'not_triggered', 'failed' (batch never sent) or None if timeout.
     """
- 
-
-    deadline = datetime.now() + timedelta(minutes=timeout_minutes)
+    with pause_deadline(), SAP_WAIT_SECONDS.time(kind="trigger") as labels:
+        status = _wait_for_trigger_confirmation(keyword, timeout_minutes, correlation_id)
+        labels["outcome"] = status or "timeout"
+    if status in ("triggered", "not_triggered"):
+        # SAP has answered for this ID (and the rest of its batch), so their
+        # rows may have changed; the resolver's re-checks must read them from
+        # the database, and the ID index must know the rows SAP inserted
+        # (pallets included) first.
+        from scripts.sap_batcher import get_batch_ids
+
+        refresh_id_index()
+        invalidate_entities(keyword, get_batch_ids(correlation_id) if correlation_id else [])
+    return status
+
+def _wait_for_trigger_confirmation(keyword, timeout_minutes, correlation_id=None):
+    from scripts.sap_batcher import get_reply_status, get_request_status, record_reply
+
+    started = datetime.now()
+    deadline = started + timedelta(minutes=timeout_minutes)
 
     while datetime.now() < deadline:
-        emails = get_unread_emails(from_filter="warehouse.sap.123@gmail.com")
-        for subject, body,sender in emails:
-            if keyword.lower() in body.lower():
-                if "triggered" in body.lower():
-                    return "triggered"
-                elif "not triggered" in body.lower():
-                    return "not_triggered"
-        time.sleep(30)
+        # Another waiter may already have read the reply covering this ID.
+        if correlation_id:
+            status = get_request_status(correlation_id)
+        else:
+            status = get_reply_status(keyword, since=started.isoformat())
+        if status:
+            return status
+        # Peek only: other SAP mails (e.g. the Excel replies
+        # wait_for_excel_from_sap is after) must stay unread for their waiter.
+        emails = get_unread_emails(from_filter=SAP_EMAIL, send_confirmation=False, mark_seen=False)
+        handled = []
+        for subject, body, sender, uid in emails:
+            # Batch replies carry one status line per item; keep them for
+            # every request in the batch, not just this waiter's.
+            recorded = record_reply(body)
+            matched = None if correlation_id else _trigger_status(body, keyword)
+            if recorded or matched:
+                handled.append((uid, subject))
+            status = status or matched
+        if handled:
+            mark_emails_seen([uid for uid, _ in handled])
+            for _, subject in handled:
+                send_read_confirmation(subject)
+        if correlation_id:
+            status = get_request_status(correlation_id)
+        if status:
+            return status
+        time.sleep(SAP_POLL_SECONDS)
+    return None
+
+def _trigger_status(body, keyword):
+    """'triggered' / 'not_triggered' if the reply body answers for keyword, else None."""
+    for line in body.lower().splitlines():
+        if keyword.lower() in line:
+            if "not triggered" in line:
+                return "not_triggered"
+            elif "triggered" in line:
+                return "triggered"
+    if keyword.lower() in body.lower():
+        if "not triggered" in body.lower():
+            return "not_triggered"
+        elif "triggered" in body.lower():
+            return "triggered"
     return None
 
 # ---------- SEND EMAIL WITH SCREENSHOT ----------
@@ -170,7 +289,8 @@ def send_email_with_screenshot(to, subject, body, screenshot_data=None, html_for
         to: recipient email address
         subject: email subject
         body: email body text
-        screenshot_data: base64 encoded screenshot data (optional)
+        screenshot_data: screenshot reference from scripts/screenshot_store.py,
+            or base64 / data URL image data (optional)
         html_format: whether to send as HTML format
     """
     msg = MIMEMultipart()
@@ -184,19 +304,12 @@ def send_email_with_screenshot(to, subject, body, screenshot_data=None, html_for
     else:
         msg.attach(MIMEText(body, 'plain'))
 
-    # Add screenshot if provided
+    # Add screenshot if provided: stored bytes are attached as they are
     if screenshot_data:
         try:
-            # Remove data URL prefix if present
-            if screenshot_data.startswith('data:image/'):
-                screenshot_data = screenshot_data.split(',')[1]
-            
-            # Decode base64 data
-            image_data = base64.b64decode(screenshot_data)
-            
-            # Create image attachment
-            image = MIMEImage(image_data)
-            image.add_header('Content-Disposition', 'attachment', filename='screenshot.png')
+            image_data, subtype, filename = screenshot_attachment(screenshot_data)
+            image = MIMEImage(image_data, _subtype=subtype)
+            image.add_header('Content-Disposition', 'attachment', filename=filename)
             msg.attach(image)
             
             print("Screenshot attached to email successfully")
@@ -204,9 +317,22 @@ def send_email_with_screenshot(to, subject, body, screenshot_data=None, html_for
             print(f"Error attaching screenshot: {e}")
 
     # Send the email
-    with smtplib.SMTP_SSL(SMTP_SERVER, 465) as server:
-        server.login(EMAIL, PASSWORD)
-        server.send_message(msg)
+    send_message(msg)
+
+# ---------- SEND EMAIL WITH FILE ATTACHMENT ----------
+def send_email_with_attachment(to, subject, body, filename, data: bytes, subtype="octet-stream"):
+    """Send a plain-text email with one file attached (e.g. a CSV/xlsx item list)."""
+    msg = MIMEMultipart()
+    msg['From'] = EMAIL
+    msg['To'] = to
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'plain'))
+
+    attachment = MIMEApplication(data, _subtype=subtype)
+    attachment.add_header('Content-Disposition', 'attachment', filename=filename)
+    msg.attach(attachment)
+
+    send_message(msg)
 
 # ---------- SEND EMAIL ----------
 def send_email(to, subject, issue_details, html_format=False):
@@ -222,6 +348,4 @@ def send_email(to, subject, issue_details, html_format=False):
     else:
         msg.attach(MIMEText(body, 'plain'))
 
-    with smtplib.SMTP_SSL(SMTP_SERVER, 465) as server:
-        server.login(EMAIL, PASSWORD)
-        server.send_message(msg)
+    send_message(msg)
@@ -0,0 +1,162 @@
+# scripts/entity_cache.py
+# Read-through cache in front of the warehouse lookups in scripts/db.py.
+# Entries are tagged with the PO / ASN / pallet IDs they were read for;
+# ingestion writes and SAP confirmations invalidate those tags, and a TTL
+# bounds staleness from writers in other processes. "Not found" results
+# are never cached: SAP inserts rows for exactly those IDs, and only the
+# worker that waited on its reply would invalidate them.
+import inspect
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from scripts.id_index import mark_ids_present
+from scripts.metrics import Counter
+
+# ---------- CONFIGURATION ----------
+ENTITY_CACHE_MAX_ENTRIES = int(os.getenv("ENTITY_CACHE_MAX_ENTRIES", "10000"))
+ENTITY_CACHE_TTL_SECONDS = float(os.getenv("ENTITY_CACHE_TTL_SECONDS", "60"))  # 0 disables the cache
+
+DB_CACHE_LOOKUPS = Counter("db_cache_lookups", "Warehouse lookups served by the entity cache.", ("query", "result"))
+
+
+class EntityCache:
+    """
+    LRU of lookup results with a TTL, invalidated by ID tags.
+
+    A result read while an invalidation ran is not stored: the generation
+    counter moves on every invalidation, and put() drops values computed
+    under an older generation.
+    """
+
+    def __init__(self, max_entries=ENTITY_CACHE_MAX_ENTRIES, ttl_seconds=ENTITY_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (expires_at, value, tags)
+        self._by_tag = {}  # tag -> set of keys
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, key):
+        """(True, value) on a fresh hit, else (False, None)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            if entry[0] < time.monotonic():
+                self._drop(key)
+                return False, None
+            self._entries.move_to_end(key)
+            return True, entry[1]
+
+    def put(self, key, value, tags, generation: int):
+        with self._lock:
+            if generation != self._generation:
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value, tags)
+            for tag in tags:
+                self._by_tag.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_tag[tag]
+
+    def invalidate(self, tags) -> int:
+        """Drop every entry read for any of these IDs; returns the number dropped."""
+        with self._lock:
+            self._generation += 1
+            keys = set()
+            for tag in tags:
+                keys |= self._by_tag.get(tag, set())
+            for key in keys:
+                self._drop(key)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._by_tag.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_cache = EntityCache()
+
+def get_entity_cache() -> EntityCache:
+    return _cache
+
+
+def _tag(value):
+    return str(value).strip() if value not in (None, "") else None
+
+
+def invalidate_entities(*ids) -> int:
+    """
+    Forget cached lookups for these PO / ASN / pallet IDs (lists are flattened).
+    Call after anything writes rows for them; the IDs are also added to the
+    membership index, so its next refresh is not needed to find them.
+    """
+    mark_ids_present(*ids)
+    tags = set()
+    for value in ids:
+        for item in (value if isinstance(value, (list, tuple, set)) else [value]):
+            tag = _tag(item)
+            if tag:
+                tags.add(tag)
+    return _cache.invalidate(tags) if tags else 0
+
+
+def _is_negative(value) -> bool:
+    """False / None, or a summary dict of all zeros: nothing was found."""
+    if isinstance(value, dict):
+        return not any(value.values())
+    return not value
+
+
+def cached_lookup(*id_params):
+    """
+    Serve fn from the entity cache, keyed by its arguments and tagged with
+    the values of the `id_params` arguments (e.g. "po_id"). Negative
+    results go to the database every time.
+    """
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _cache.ttl_seconds <= 0:
+                return fn(*args, **kwargs)
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = (fn.__name__, tuple(_tag(v) for v in bound.arguments.values()))
+            hit, value = _cache.get(key)
+            if hit:
+                DB_CACHE_LOOKUPS.inc(query=fn.__name__, result="hit")
+                return dict(value) if isinstance(value, dict) else value
+            DB_CACHE_LOOKUPS.inc(query=fn.__name__, result="miss")
+            generation = _cache.generation
+            value = fn(*args, **kwargs)
+            if _is_negative(value):
+                return value
+            tags = tuple(t for t in (_tag(bound.arguments.get(p)) for p in id_params) if t)
+            _cache.put(key, dict(value) if isinstance(value, dict) else value, tags, generation)
+            return value
+        return wrapper
+    return decorator
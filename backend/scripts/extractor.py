@@ -1,33 +1,85 @@
 # scripts/extractor.py
 import re
 
-def extract_ids(text: str) -> dict:
-    ids = {
-        "po_id": None,
-        "asn_id": None,
-        "pallet_id": None
-    }
+ID_TYPES = ("po_id", "asn_id", "pallet_id")
+
+# One alternation, so the text is scanned once for every ID type.
+# PO: 10 digits starting with 2, ASN: 5 digits starting with 0,
+# pallet: 15 digits starting with 5. \b keeps longer numbers from matching.
+ID_PATTERN = re.compile(r"\b(?:(?P<pallet_id>5\d{14})|(?P<po_id>2\d{9})|(?P<asn_id>0\d{4}))\b")
 
-    po_match = re.search(r"\b(2\d{9})\b", text)
-    if po_match:
-        po_id = po_match.group(1)
-        if len(po_id) == 10:
-            ids["po_id"] = po_id
+# The longest ID is 15 digits; a longer run of word characters cannot hold one.
+MAX_ID_LENGTH = 15
 
-    asn_match = re.search(r"\b(0\d{4})\b", text)
-    if asn_match:
-        asn_id = asn_match.group(1)
-        if len(asn_id) == 5:
-            ids["asn_id"] = asn_id
+def iter_ids(chunks, dedupe: bool = True):
+    """
+    Yield every ID found in a stream of text chunks, in order of appearance.
 
-    pallet_match = re.search(r"\b(5\d{14})\b", text)
-    if pallet_match:
-        pallet_id = pallet_match.group(1)
-        if len(pallet_id) == 15:
-            ids["pallet_id"] = pallet_id
+    Args:
+        chunks: A string, or any iterable of strings (e.g. lines of an email body)
+        dedupe: Skip an ID already yielded earlier in the stream
 
+    Yields:
+        Dicts with type, value, start and end (offsets into the whole stream)
+    """
+    if isinstance(chunks, str):
+        chunks = (chunks,)
+    seen = set()
+    carry = ""
+    offset = 0  # stream position of carry[0]
+    for chunk in chunks:
+        buffer = carry + chunk
+        # Hold back the trailing run of word characters: it may continue in
+        # the next chunk, and \b needs to see how it ends.
+        cut = len(buffer)
+        while cut > 0 and (buffer[cut - 1].isalnum() or buffer[cut - 1] == "_"):
+            cut -= 1
+        for match in ID_PATTERN.finditer(buffer, 0, cut):
+            found = _to_entity(match, offset)
+            if dedupe and (found["type"], found["value"]) in seen:
+                continue
+            seen.add((found["type"], found["value"]))
+            yield found
+        if len(buffer) - cut > MAX_ID_LENGTH:
+            # A word run this long can never be an ID; keep one word
+            # character so the next chunk still knows it starts mid-word.
+            carry = "_"
+            offset += len(buffer) - 1
+        else:
+            carry = buffer[cut:]
+            offset += cut
+    for match in ID_PATTERN.finditer(carry):
+        found = _to_entity(match, offset)
+        if dedupe and (found["type"], found["value"]) in seen:
+            continue
+        seen.add((found["type"], found["value"]))
+        yield found
+
+def _to_entity(match, offset: int) -> dict:
+    id_type = match.lastgroup
+    return {
+        "type": id_type,
+        "value": match.group(id_type),
+        "start": offset + match.start(),
+        "end": offset + match.end(),
+    }
+
+def scan_ids(text: str) -> list:
+    """Every distinct ID in the text with its type and position."""
+    return list(iter_ids(text))
+
+def extract_all_ids(text) -> dict:
+    """All distinct IDs grouped by type, in order of appearance."""
+    ids = {id_type: [] for id_type in ID_TYPES}
+    for found in iter_ids(text):
+        ids[found["type"]].append(found["value"])
     return ids
 
+def extract_ids(text: str) -> dict:
+    """First PO, ASN and pallet ID in the text (None when absent)."""
+    all_ids = extract_all_ids(text)
+    return {id_type: (values[0] if values else None) for id_type, values in all_ids.items()}
+
 def validate_ids(ids: dict) -> list:
     issues = []
 
@@ -0,0 +1,343 @@
+# scripts/id_index.py
+# In-process membership index of every PO, ASN and pallet ID in the
+# warehouse tables. Most IDs users report are typos or truly missing; a
+# lookup the index rules out answers "not found" without touching SQLite.
+#
+# Each ID type is a sorted array of 64-bit integers (the digits with a "1"
+# prepended, so leading zeros survive) plus a small set of recent additions.
+# The index only ever answers "definitely absent" or "maybe": rows deleted
+# since the last rebuild just fall through to the database.
+#
+# Refreshes pick up rows with a rowid above the highest one already read,
+# whatever their last_updated (SAP and Excel ingestion insert rows with
+# none), plus rows whose last_updated moved past the watermark. Rows other
+# processes insert are therefore visible within ID_INDEX_REFRESH_SECONDS;
+# refresh_id_index() makes them visible at once, e.g. after an SAP reply.
+import inspect
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+from array import array
+from bisect import bisect_left
+from contextlib import closing
+from functools import wraps
+
+from scripts.metrics import Counter
+
+# ---------- CONFIGURATION ----------
+ID_INDEX_ENABLED = os.getenv("ID_INDEX_ENABLED", "1") == "1"
+ID_INDEX_REFRESH_SECONDS = float(os.getenv("ID_INDEX_REFRESH_SECONDS", "15"))  # rows with a newer last_updated
+ID_INDEX_REBUILD_SECONDS = float(os.getenv("ID_INDEX_REBUILD_SECONDS", "3600"))  # full rescan (rows without last_updated)
+ID_INDEX_MERGE_THRESHOLD = int(os.getenv("ID_INDEX_MERGE_THRESHOLD", "4096"))  # recent additions folded into the array
+
+ID_TYPES = ("po_id", "asn_id", "pallet_id")
+
+# Which ID columns each table contributes; a lookup only needs the ID to be
+# absent from every one of them to be answered without the database.
+INDEXED_COLUMNS = {
+    "po_header": ("po_id",),
+    "po_line": ("pallet_id", "po_id", "asn_id"),
+    "asn_header": ("asn_id",),
+    "asn_line": ("pallet_id", "po_id", "asn_id"),
+}
+
+MAX_ENCODED_DIGITS = 18  # "1" + 18 digits still fits a signed 64-bit integer
+
+ID_INDEX_LOOKUPS = Counter(
+    "id_index_lookups", "Warehouse lookups checked against the ID membership index.", ("id_type", "result")
+)
+
+
+def _encode(value):
+    """int for an all-digit ID, else the stripped string (kept in a side set)."""
+    text = str(value).strip()
+    if text.isdigit() and len(text) <= MAX_ENCODED_DIGITS:
+        return int("1" + text)
+    return text
+
+
+class _Members:
+    """Sorted int64 array + recent additions + non-numeric IDs, for one ID type."""
+
+    def __init__(self, encoded=()):
+        numbers = sorted({v for v in encoded if isinstance(v, int)})
+        self.sorted = array("q", numbers)
+        self.recent = set()
+        self.other = {v for v in encoded if isinstance(v, str)}
+
+    def __contains__(self, key) -> bool:
+        if isinstance(key, str):
+            return key in self.other
+        if key in self.recent:
+            return True
+        i = bisect_left(self.sorted, key)
+        return i < len(self.sorted) and self.sorted[i] == key
+
+    def add(self, key):
+        if isinstance(key, str):
+            self.other.add(key)
+        elif key not in self:
+            self.recent.add(key)
+            if len(self.recent) >= ID_INDEX_MERGE_THRESHOLD:
+                self.sorted = array("q", sorted(set(self.sorted) | self.recent))
+                self.recent = set()
+
+    def __len__(self):
+        return len(self.sorted) + len(self.recent) + len(self.other)
+
+
+class IdIndex:
+    """
+    Membership index for PO / ASN / pallet IDs.
+
+    Until the first build has finished every ID counts as "maybe", so the
+    index can start in the background without ever hiding a row.
+    """
+
+    def __init__(self):
+        self._members = {id_type: _Members() for id_type in ID_TYPES}
+        self._ready = False
+        self._watermark = None  # newest last_updated seen
+        self._rowids = {}  # table -> highest rowid read
+        self._marked = []  # IDs added by mark_present() while a rebuild runs
+        self._rebuilding = False
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready
+
+    def might_exist(self, id_type: str, value) -> bool:
+        """False only when value is definitely in none of the warehouse tables."""
+        if not self._ready or value in (None, ""):
+            return True
+        return _encode(value) in self._members[id_type]
+
+    def mark_present(self, id_type: str, value):
+        """Treat an ID as present, e.g. right after this process wrote rows for it."""
+        if value in (None, ""):
+            return
+        key = _encode(value)
+        with self._lock:
+            self._members[id_type].add(key)
+            if self._rebuilding:
+                self._marked.append((id_type, key))
+
+    # ----------------------------
+    # Loading from the database
+    # ----------------------------
+    def _scan(self, conn, since=None, rowids=None):
+        """
+        IDs from rows inserted after the `rowids` (table -> highest rowid
+        read) or updated at or after `since`; all rows when rowids is None.
+
+        Returns:
+            (id_type -> set of encoded IDs, newest last_updated, table ->
+            highest rowid, complete), complete being False when a table
+            could not be read
+        """
+        found = {id_type: set() for id_type in ID_TYPES}
+        newest = since
+        highest = dict(rowids or {})
+        complete = True
+        for table, columns in INDEXED_COLUMNS.items():
+            where, params = "", ()
+            if rowids is not None:
+                where, params = "WHERE rowid > ?", (rowids.get(table, 0),)
+                if since is not None:
+                    where, params = where + " OR last_updated >= ?", params + (since,)
+            try:
+                cur = conn.execute(f"SELECT {', '.join(columns)}, last_updated, rowid FROM {table} {where}", params)
+            except sqlite3.OperationalError as e:
+                print(f"⚠️ ID index could not read {table}: {e}")
+                complete = False
+                continue
+            for row in cur:
+                for id_type, value in zip(columns, row):
+                    if value not in (None, ""):
+                        found[id_type].add(_encode(value))
+                updated, rowid = row[-2], row[-1]
+                if updated is not None and (newest is None or str(updated) > newest):
+                    newest = str(updated)
+                if rowid > highest.get(table, 0):
+                    highest[table] = rowid
+        return found, newest, highest, complete
+
+    def rebuild(self, connect) -> bool:
+        """Rescan every table and swap in fresh arrays; returns False (index unchanged) if a table is unreadable."""
+        with self._refresh_lock:
+            started = time.perf_counter()
+            with self._lock:
+                self._rebuilding = True
+                self._marked = []
+            try:
+                with closing(connect()) as conn:
+                    found, newest, rowids, complete = self._scan(conn)
+                if not complete:
+                    return False
+                members = {id_type: _Members(found[id_type]) for id_type in ID_TYPES}
+                with self._lock:
+                    for id_type, key in self._marked:
+                        members[id_type].add(key)
+                    self._members = members
+                    self._watermark = newest
+                    self._rowids = rowids
+                    self._ready = True
+            finally:
+                with self._lock:
+                    self._rebuilding = False
+                    self._marked = []
+            print(
+                f"🗂️ ID index built: {len(members['po_id'])} POs, {len(members['asn_id'])} ASNs, "
+                f"{len(members['pallet_id'])} pallets in {(time.perf_counter() - started) * 1000:.0f} ms"
+            )
+            return True
+
+    def ensure_built(self, connect) -> bool:
+        """Build the index unless a build (e.g. the background one) already finished; True once ready."""
+        with self._refresh_lock:
+            if self._ready:
+                return True
+        return self.rebuild(connect)
+
+    def refresh(self, connect) -> int:
+        """Add IDs from rows inserted or updated since the last scan; returns how many were new."""
+        if not self._ready:
+            self.rebuild(connect)
+            return 0
+        with self._refresh_lock:
+            with closing(connect()) as conn:
+                found, newest, rowids, complete = self._scan(conn, since=self._watermark, rowids=self._rowids)
+            added = 0
+            with self._lock:
+                for id_type, keys in found.items():
+                    members = self._members[id_type]
+                    for key in keys:
+                        if key not in members:
+                            members.add(key)
+                            added += 1
+                if complete:
+                    self._watermark = newest
+                    self._rowids = rowids
+            return added
+
+
+_index = IdIndex()
+_refresher = {"pid": None, "stop": None}  # the refresher thread of this process
+
+def get_id_index() -> IdIndex:
+    return _index
+
+
+def connect_readonly():
+    """Read-only connection to the warehouse DB; a missing file is an error rather than a new empty database."""
+    from scripts import db
+
+    path = urllib.parse.quote(os.path.abspath(db.DB_PATH))
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+
+def id_type_of(value):
+    """ID type by format (see scripts/extractor.py), or None if it matches none."""
+    from scripts.extractor import ID_PATTERN
+
+    match = ID_PATTERN.fullmatch(str(value).strip())
+    return match.lastgroup if match else None
+
+
+def refresh_id_index() -> int:
+    """
+    Pick up rows other processes inserted (e.g. SAP, before it replies)
+    without waiting for the background refresh; returns how many IDs were new.
+    Errors are printed, and the index then stays as it was.
+    """
+    if not (ID_INDEX_ENABLED and _index.ready):
+        return 0
+    try:
+        return _index.refresh(connect_readonly)
+    except Exception as e:
+        print(f"⚠️ ID index refresh failed: {e}")
+        return 0
+
+
+def mark_ids_present(*ids):
+    """
+    Add written IDs to the index without waiting for the next refresh (lists
+    are flattened). IDs whose type cannot be told from their format are
+    added under every type.
+    """
+    for value in ids:
+        for item in (value if isinstance(value, (list, tuple, set)) else [value]):
+            if item in (None, ""):
+                continue
+            id_type = id_type_of(item)
+            for t in ((id_type,) if id_type else ID_TYPES):
+                _index.mark_present(t, item)
+
+
+def start_id_index(refresh_interval: float = ID_INDEX_REFRESH_SECONDS,
+                   rebuild_interval: float = ID_INDEX_REBUILD_SECONDS):
+    """
+    Build the index in the background, then keep it current: incremental
+    refreshes every `refresh_interval` seconds and a full rebuild every
+    `rebuild_interval`. Returns the stop event, or None when disabled.
+
+    Call it in each worker process, after the fork: threads do not survive
+    fork(), so a refresher started in the gunicorn master leaves every
+    worker with a frozen index. A second call in the same process returns
+    the running refresher's stop event.
+    """
+    if not ID_INDEX_ENABLED:
+        return None
+    if _refresher["pid"] == os.getpid():
+        return _refresher["stop"]
+    stop = threading.Event()
+
+    def run():
+        last_rebuild = time.monotonic() if _index.ready else 0.0
+        last_error = None
+        while True:
+            try:
+                if time.monotonic() - last_rebuild >= rebuild_interval or not _index.ready:
+                    _index.rebuild(connect_readonly)
+                    last_rebuild = time.monotonic()
+                else:
+                    _index.refresh(connect_readonly)
+                last_error = None
+            except Exception as e:
+                if str(e) != last_error:
+                    print(f"⚠️ ID index refresh failed: {e}")
+                last_error = str(e)
+            if refresh_interval <= 0 or stop.wait(refresh_interval):
+                return
+
+    threading.Thread(target=run, name="id-index", daemon=True).start()
+    _refresher.update(pid=os.getpid(), stop=stop)
+    return stop
+
+
+def skip_if_absent(id_param: str, id_type: str, absent):
+    """
+    Return `absent` (copied if it is a dict) without calling fn when the
+    `id_param` argument is definitely not in the warehouse tables.
+    """
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _index.ready:
+                ID_INDEX_LOOKUPS.inc(id_type=id_type, result="not_ready")
+                return fn(*args, **kwargs)
+            bound = signature.bind(*args, **kwargs)
+            value = bound.arguments.get(id_param)
+            if value in (None, "") or _index.might_exist(id_type, value):
+                ID_INDEX_LOOKUPS.inc(id_type=id_type, result="maybe")
+                return fn(*args, **kwargs)
+            ID_INDEX_LOOKUPS.inc(id_type=id_type, result="absent")
+            return dict(absent) if isinstance(absent, dict) else absent
+        return wrapper
+    return decorator
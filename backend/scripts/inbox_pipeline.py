@@ -0,0 +1,154 @@
+# scripts/inbox_pipeline.py
+# Headless processing of support emails sent to the bot mailbox:
+# fetch -> classify/extract -> resolve_issue -> reply to the sender,
+# on a bounded worker pool.
+#
+#   cd backend
+#   python -m scripts.inbox_pipeline --workers 16          # drain the inbox once
+#   python -m scripts.inbox_pipeline --loop --interval 60  # keep polling
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from email.utils import parseaddr
+
+from scripts.chat_interface import NeedInput
+from scripts.classifier import classify, classify_extract_acknowledge
+from scripts.email_handler import SAP_EMAIL, get_unread_emails, mark_emails_seen, send_email_with_screenshot
+from scripts.extractor import extract_all_ids
+from scripts.lookup_context import prefetch_lookups
+from scripts.metrics import start_metrics_snapshots
+from scripts.resolver import resolve_issues_bulk
+from scripts.session_store import session_scope
+from scripts.usage_tracker import update_usage_context, usage_scope
+
+# ---------- CONFIGURATION ----------
+INBOX_WORKERS = int(os.getenv("INBOX_WORKERS", "8"))
+INBOX_POLL_INTERVAL = int(os.getenv("INBOX_POLL_INTERVAL", "60"))
+
+
+class PipelineStats:
+    """Thread-safe counters for one pipeline run."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.fetched = 0
+        self.resolved = 0
+        self.failed = 0
+        self.by_label = {}
+        self.durations = []
+
+    def record(self, label: str, seconds: float, ok: bool):
+        with self._lock:
+            if ok:
+                self.resolved += 1
+            else:
+                self.failed += 1
+            self.by_label[label] = self.by_label.get(label, 0) + 1
+            self.durations.append(seconds)
+
+    def summary(self) -> dict:
+        with self._lock:
+            elapsed = time.time() - self.started
+            done = self.resolved + self.failed
+            durations = sorted(self.durations)
+            return {
+                "fetched": self.fetched,
+                "resolved": self.resolved,
+                "failed": self.failed,
+                "by_label": dict(self.by_label),
+                "elapsed_seconds": round(elapsed, 2),
+                "emails_per_minute": round(done / elapsed * 60, 2) if elapsed else 0.0,
+                "median_seconds": round(durations[len(durations) // 2], 2) if durations else 0.0,
+                "max_seconds": round(durations[-1], 2) if durations else 0.0,
+            }
+
+
+def process_email(subject: str, body: str, sender: str) -> dict:
+    """
+    Classify, extract and resolve one support email, then reply to its sender.
+
+    Returns:
+        Dict with sender, subject, label and the confirmation text
+    """
+    sender_address = parseaddr(sender)[1] or sender
+    text = f"{subject}\n{body}"
+
+    with session_scope() as session_id, usage_scope(session_id=session_id, user_email=sender_address):
+        # Stream the body line by line so long SAP-style listings stay cheap.
+        all_ids = extract_all_ids(text.splitlines(keepends=True))
+        lookups = prefetch_lookups(all_ids)
+        try:
+            structured = classify_extract_acknowledge(text)
+            if structured:
+                label = structured["label"]
+                for key, value in structured["ids"].items():
+                    if value:
+                        all_ids[key] = [value] + [v for v in all_ids[key] if v != value]
+            else:
+                label = classify(text)
+            update_usage_context(scenario=label)
+            try:
+                confirmation = resolve_issues_bulk(label, all_ids, sender_address, lookups=lookups)
+            except NeedInput as need:
+                # Mail cannot be paused: ask in the reply; the answer arrives as a new mail.
+                confirmation = f"{need.prompt} Please reply to this mail with the details."
+        finally:
+            lookups.cancel()
+
+    send_email_with_screenshot(sender_address, f"Re: {subject}", confirmation)
+    return {"sender": sender_address, "subject": subject, "label": label, "confirmation": confirmation}
+
+
+def run_once(workers: int = INBOX_WORKERS, stats: PipelineStats = None) -> PipelineStats:
+    """Drain the current unread support emails with at most `workers` in flight."""
+    stats = stats or PipelineStats()
+    # SAP replies stay unread for the resolver workflows waiting on them.
+    # Support mails stay unread until their reply is sent: a crash or an
+    # LLM/SMTP failure leaves the mail for the next poll instead of losing it.
+    emails = get_unread_emails(exclude_from=SAP_EMAIL, send_confirmation=False, mark_seen=False)
+    stats.fetched += len(emails)
+    if not emails:
+        return stats
+    print(f"📥 {len(emails)} support emails to process with {workers} workers")
+
+    def handle(subject, body, sender, uid):
+        start = time.time()
+        try:
+            result = process_email(subject, body, sender)
+            mark_emails_seen([uid])
+            stats.record(result["label"], time.time() - start, ok=True)
+            print(f"✅ {result['sender']}: {result['label']}")
+        except Exception as e:
+            stats.record("error", time.time() - start, ok=False)
+            print(f"❌ Failed to process mail '{subject}' from {sender}: {e}")
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="inbox") as pool:
+        futures = [pool.submit(handle, *mail) for mail in emails]
+        for future in as_completed(futures):
+            future.result()
+    return stats
+
+
+def run_forever(workers: int = INBOX_WORKERS, interval: int = INBOX_POLL_INTERVAL):
+    stats = PipelineStats()
+    while True:
+        run_once(workers, stats)
+        print(f"📊 {stats.summary()}")
+        time.sleep(interval)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Process support emails from the bot mailbox.")
+    parser.add_argument("--workers", type=int, default=INBOX_WORKERS, help="concurrent resolutions")
+    parser.add_argument("--loop", action="store_true", help="keep polling the inbox")
+    parser.add_argument("--interval", type=int, default=INBOX_POLL_INTERVAL, help="seconds between polls")
+    args = parser.parse_args()
+
+    start_metrics_snapshots()
+    if args.loop:
+        run_forever(args.workers, args.interval)
+    else:
+        print(f"📊 {run_once(args.workers).summary()}")
@@ -0,0 +1,585 @@
+# scripts/llm_client.py
+# Single entry point for Groq chat completions, with a record/replay
+# cassette underneath so classifier, chat and email-drafting calls can be
+# served offline and deterministically.
+#
+#   LLM_CASSETTE_MODE=record  -> call Groq and store every reply by request hash
+#   LLM_CASSETTE_MODE=replay  -> serve stored replies only; misses are errors
+#   LLM_CASSETTE_MODE=auto    -> replay when stored, otherwise call Groq and record
+#
+# Live calls are bounded by the caller's deadline, retried with jittered
+# exponential backoff (honouring Retry-After), and short-circuited while
+# the provider is failing.
+#
+# achat_completion() is the asyncio twin used by asgi.py: the same cassette,
+# budget, deadline, retry and breaker rules, with the HTTP wait awaited on
+# httpx instead of holding a thread.
+import asyncio
+import atexit
+import contextlib
+import contextvars
+import hashlib
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+
+try:
+    import httpx
+except ImportError:
+    httpx = None  # achat_completion falls back to chat_completion on a worker thread
+
+from scripts.async_io import run_blocking
+from scripts.metrics import LLM_REQUEST_SECONDS, Counter
+from scripts.model_router import get_model_router
+from scripts.usage_tracker import get_usage_tracker
+
+# ---------- CONFIGURATION ----------
+API_URL = os.getenv("GROQ_API_URL", "https://api.groq.com/openai/v1/chat/completions")
+GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
+LLM_CASSETTE_MODE = os.getenv("LLM_CASSETTE_MODE", "off")  # off, record, replay or auto
+LLM_CASSETTE_PATH = os.getenv(
+    "LLM_CASSETTE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "database", "llm_cassette.db"),
+)
+# Simulated latency on replay: "0" for none, "recorded" for the original
+# call's latency, or a fixed number of milliseconds.
+LLM_REPLAY_LATENCY = os.getenv("LLM_REPLAY_LATENCY", "0")
+
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))  # per attempt, when the caller gives none
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))  # consecutive failures that open the circuit
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+LLM_ASYNC_MAX_CONNECTIONS = int(os.getenv("LLM_ASYNC_MAX_CONNECTIONS", "200"))  # per event loop
+
+LLM_RETRIES = Counter("llm_retries", "LLM attempts that were retried.", ("reason",))
+LLM_CIRCUIT = Counter("llm_circuit_transitions", "LLM circuit breaker state changes.", ("state",))
+
+
+def _headers():
+    return {
+        "Authorization": f"Bearer {GROQ_API_KEY}",
+        "Content-Type": "application/json",
+    }
+
+
+EMAIL_ADDRESS = re.compile(r"[\w\.-]+@[\w\.-]+\.\w{2,}")
+
+
+def _cassette_key_payload(payload: dict, purpose: str = None) -> dict:
+    """
+    The request as the cassette sees it: canned assistant turns dropped
+    (their variant rotates round-robin), email addresses masked, and a
+    fallback model replaced by its route's primary, so a replay matches
+    the recording whichever user, variant or model the run got.
+    """
+    from scripts.canned_responses import is_canned
+
+    key = dict(payload)
+    route = get_model_router().routes.get(purpose)
+    if route and key.get("model") in [route["model"]] + list(route.get("fallbacks", [])):
+        key["model"] = route["model"]
+    messages = []
+    for message in payload.get("messages", []):
+        content = message.get("content")
+        if not isinstance(content, str):
+            messages.append(message)
+        elif not (message.get("role") == "assistant" and is_canned(content)):
+            messages.append(dict(message, content=EMAIL_ADDRESS.sub("<email>", content)))
+    key["messages"] = messages
+    return key
+
+
+def request_hash(payload: dict, purpose: str = None) -> str:
+    """
+    Stable hash of a chat completion request (key order and whitespace do
+    not matter), over the normalised request from _cassette_key_payload.
+    `purpose` is the model router task the payload was built for.
+    """
+    canonical = json.dumps(_cassette_key_payload(payload, purpose), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class CassetteMiss(requests.exceptions.RequestException):
+    """Raised in replay mode when no recorded reply matches the request."""
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """Raised when the caller's deadline leaves no time for (another) LLM attempt."""
+
+
+class CircuitOpen(requests.exceptions.RequestException):
+    """Raised without calling the provider while the circuit breaker is open."""
+
+
+# ----------------------------
+# Deadlines
+# ----------------------------
+class _Deadline:
+    """
+    Deadline shared by a request and the threads it hands work to (contexts
+    copied by scripts/async_io.py hold the same object). Its clock stops
+    while any of them is inside pause_deadline(), e.g. waiting on SAP.
+    """
+
+    def __init__(self, seconds: float):
+        self._at = time.monotonic() + seconds
+        self._pauses = 0
+        self._paused_at = None
+        self._lock = threading.Lock()
+
+    def remaining(self) -> float:
+        with self._lock:
+            return self._at - (self._paused_at if self._pauses else time.monotonic())
+
+    def pause(self):
+        with self._lock:
+            if not self._pauses:
+                self._paused_at = time.monotonic()
+            self._pauses += 1
+
+    def resume(self):
+        with self._lock:
+            self._pauses -= 1
+            if not self._pauses:
+                self._at += time.monotonic() - self._paused_at
+
+
+_deadline = contextvars.ContextVar("llm_deadline", default=None)
+
+
+def start_deadline(seconds: float):
+    """Bound every LLM call from here on by `seconds`; returns a token for end_deadline()."""
+    outer = _deadline.get()
+    if outer is not None and outer.remaining() <= seconds:
+        return _deadline.set(outer)
+    return _deadline.set(_Deadline(seconds))
+
+
+def end_deadline(token):
+    _deadline.reset(token)
+
+
+@contextlib.contextmanager
+def deadline_scope(seconds: float):
+    token = start_deadline(seconds)
+    try:
+        yield
+    finally:
+        end_deadline(token)
+
+
+@contextlib.contextmanager
+def pause_deadline():
+    """Stop the current deadline's clock for the block: time spent waiting on SAP is not LLM time."""
+    deadline = _deadline.get()
+    if deadline is None:
+        yield
+        return
+    deadline.pause()
+    try:
+        yield
+    finally:
+        deadline.resume()
+
+
+def remaining_time():
+    """Seconds left before the current deadline, or None when there is none."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline.remaining()
+
+
+def backoff_delay(attempt: int, base: float = LLM_BACKOFF_BASE, cap: float = LLM_BACKOFF_MAX) -> float:
+    """Full-jitter exponential backoff for the given 0-based retry attempt."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def _retry_after(response):
+    """Seconds from a Retry-After header (delta-seconds or HTTP date), or None."""
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+# ----------------------------
+# Circuit breaker
+# ----------------------------
+class CircuitBreaker:
+    """
+    closed -> open after `failure_threshold` consecutive failures; open ->
+    half-open after `reset_seconds`, when a single probe call is let
+    through; the probe's result closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold=LLM_BREAKER_FAILURES, reset_seconds=LLM_BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _transition(self, state: str):
+        if state != self.state:
+            self.state = state
+            LLM_CIRCUIT.inc(state=state)
+            print(f"🔌 LLM circuit {state}")
+
+    def before_call(self):
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self._opened_at < self.reset_seconds:
+                    raise CircuitOpen("LLM provider circuit is open")
+                self._transition("half_open")
+            if self.state == "half_open":
+                if self._probing:
+                    raise CircuitOpen("LLM provider circuit is half-open; probe in flight")
+                self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            self._transition("closed")
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._probing = False
+                self._transition("open")
+
+    def abandon_call(self):
+        """The call was cancelled before the provider answered: free the probe slot, count nothing."""
+        with self._lock:
+            self._probing = False
+
+
+_breaker = CircuitBreaker()
+
+def get_circuit_breaker() -> CircuitBreaker:
+    return _breaker
+
+
+# ----------------------------
+# Cassette store
+# ----------------------------
+class Cassette:
+    """Request-hash -> response pairs in SQLite, plus hit/miss counters for the run."""
+
+    def __init__(self, path=LLM_CASSETTE_PATH, mode=LLM_CASSETTE_MODE, replay_latency=LLM_REPLAY_LATENCY):
+        self.path = path
+        self.mode = mode
+        self.replay_latency = replay_latency
+        self.hits = 0
+        self.recorded = 0
+        self.misses = []
+        self._lock = threading.Lock()
+        if self.mode != "off":
+            with self._connect() as conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS llm_cassette (
+                        request_hash TEXT PRIMARY KEY,
+                        model TEXT,
+                        request_json TEXT,
+                        response_json TEXT,
+                        latency_ms REAL,
+                        recorded_at TEXT
+                    )
+                """)
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        return sqlite3.connect(self.path, timeout=30)
+
+    def lookup(self, key: str):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT response_json, latency_ms FROM llm_cassette WHERE request_hash = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1] or 0.0
+
+    def record(self, key: str, payload: dict, response: dict, latency_ms: float):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cassette VALUES (?, ?, ?, ?, ?, ?)",
+                (key, payload.get("model"), json.dumps(payload, ensure_ascii=False),
+                 json.dumps(response, ensure_ascii=False), latency_ms, datetime.now().isoformat()),
+            )
+        with self._lock:
+            self.recorded += 1
+
+    def simulate_latency(self, recorded_ms: float):
+        if self.replay_latency == "recorded":
+            delay_ms = recorded_ms
+        else:
+            try:
+                delay_ms = float(self.replay_latency)
+            except ValueError:
+                delay_ms = 0.0
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000)
+
+    def note_hit(self):
+        with self._lock:
+            self.hits += 1
+
+    def note_miss(self, key: str, payload: dict):
+        preview = str(payload.get("messages", [{}])[-1].get("content", ""))[:80].replace("\n", " ")
+        with self._lock:
+            self.misses.append({"request_hash": key, "model": payload.get("model"), "preview": preview})
+        print(f"⚠️ LLM cassette miss {key[:12]}: {preview}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"mode": self.mode, "hits": self.hits, "recorded": self.recorded,
+                    "misses": len(self.misses), "missed_requests": list(self.misses)}
+
+    def report(self):
+        if self.mode == "off":
+            return
+        stats = self.stats()
+        print(f"📼 LLM cassette ({self.mode}): {stats['hits']} hits, {stats['recorded']} recorded, {stats['misses']} misses")
+
+
+_cassette = None
+_cassette_lock = threading.Lock()
+
+def get_cassette() -> Cassette:
+    global _cassette
+    with _cassette_lock:
+        if _cassette is None:
+            _cassette = Cassette()
+            atexit.register(_cassette.report)
+        return _cassette
+
+def set_cassette(cassette: Cassette):
+    """Swap the cassette, e.g. to replay a fixture file in a benchmark run."""
+    global _cassette
+    with _cassette_lock:
+        _cassette = cassette
+
+
+# ----------------------------
+# Chat completion
+# ----------------------------
+def _record_usage(payload: dict, data: dict, purpose: str, source: str):
+    try:
+        get_usage_tracker().record(payload.get("model", ""), purpose, source, data.get("usage"))
+    except Exception as e:
+        print(f"❌ Failed to record LLM usage: {e}")
+
+
+def _attempt_timeout(timeout: float) -> float:
+    remaining = remaining_time()
+    if remaining is None:
+        return timeout
+    if remaining <= 0:
+        raise DeadlineExceeded("Request deadline passed before the LLM call")
+    return min(timeout, remaining)
+
+
+def _observe_attempt(purpose: str, payload: dict, started: float):
+    """
+    Feed one provider round trip to the model router. Only attempts that got
+    an answer or timed out count: backoff sleeps, refused connections and
+    calls stopped by the breaker or deadline say nothing about the model.
+    """
+    get_model_router().observe(purpose, payload.get("model", ""), time.perf_counter() - started)
+
+
+def _post_with_retries(payload: dict, timeout: float, purpose: str) -> dict:
+    breaker = get_circuit_breaker()
+    attempt = 0
+    while True:
+        attempt_timeout = _attempt_timeout(timeout)
+        breaker.before_call()
+        started = time.perf_counter()
+        try:
+            response = requests.post(API_URL, headers=_headers(), json=payload, timeout=attempt_timeout)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            breaker.record_failure()
+            if isinstance(e, requests.exceptions.Timeout):
+                # A model that times out is a slow model.
+                _observe_attempt(purpose, payload, started)
+            error, reason, wait = e, type(e).__name__, None
+        except Exception:
+            breaker.record_failure()
+            raise
+        else:
+            _observe_attempt(purpose, payload, started)
+            if response.status_code not in RETRY_STATUSES:
+                # The provider answered; a 4xx here is our problem, not an outage.
+                breaker.record_success()
+                response.raise_for_status()
+                return response.json()
+            breaker.record_failure()
+            error = requests.exceptions.HTTPError(f"{response.status_code} from LLM provider", response=response)
+            reason, wait = str(response.status_code), _retry_after(response)
+
+        time.sleep(_retry_wait(attempt, error, reason, wait))
+        attempt += 1
+
+
+def _retry_wait(attempt: int, error: Exception, reason: str, wait):
+    """Seconds to wait before retrying, or raise `error` when out of retries or out of time."""
+    if attempt >= LLM_MAX_RETRIES:
+        raise error
+    wait = backoff_delay(attempt) if wait is None else wait
+    remaining = remaining_time()
+    if remaining is not None and wait >= remaining:
+        raise error
+    LLM_RETRIES.inc(reason=reason)
+    print(f"⚠️ LLM call failed ({reason}), retry {attempt + 1}/{LLM_MAX_RETRIES} in {wait:.1f}s")
+    return wait
+
+
+def chat_completion(payload: dict, timeout=30, purpose: str = "chat") -> dict:
+    """
+    Send one chat completion request, through the cassette when enabled.
+
+    Args:
+        payload: Groq/OpenAI chat completion body (model, messages, ...)
+        timeout: Seconds per attempt (None means LLM_TIMEOUT_SECONDS), further
+            capped by the deadline of the surrounding deadline_scope
+        purpose: What the call is for (chat, classify, email, ...), for
+            usage accounting and budget exemptions
+
+    Returns:
+        The decoded response JSON
+
+    Raises:
+        requests.exceptions.RequestException on HTTP errors and timeouts,
+        CassetteMiss in replay mode when nothing was recorded for the request,
+        BudgetExceeded when the session or user is over its LLM budget,
+        DeadlineExceeded / CircuitOpen when failing fast
+    """
+    get_usage_tracker().check_budget(purpose)
+    cassette = get_cassette()
+    key = request_hash(payload, purpose) if cassette.mode != "off" else None
+    model = payload.get("model", "")
+
+    if cassette.mode in ("replay", "auto"):
+        with LLM_REQUEST_SECONDS.time(model=model, source="cassette") as labels:
+            stored = cassette.lookup(key)
+            if stored is not None:
+                response, latency_ms = stored
+                cassette.simulate_latency(latency_ms)
+                cassette.note_hit()
+                _record_usage(payload, response, purpose, "cassette")
+                return response
+            labels["outcome"] = "miss"
+        if cassette.mode == "replay":
+            cassette.note_miss(key, payload)
+            raise CassetteMiss(f"No recorded LLM reply for request {key[:12]}")
+
+    with LLM_REQUEST_SECONDS.time(model=model, source="live"):
+        start = time.perf_counter()
+        data = _post_with_retries(payload, LLM_TIMEOUT_SECONDS if timeout is None else timeout, purpose)
+    if cassette.mode in ("record", "auto"):
+        cassette.record(key, payload, data, (time.perf_counter() - start) * 1000)
+    _record_usage(payload, data, purpose, "live")
+    return data
+
+
+# ----------------------------
+# Async chat completion
+# ----------------------------
+_async_client = None
+_async_client_loop = None
+
+def _get_async_client():
+    """Pooled httpx client for the running event loop (one per worker process)."""
+    global _async_client, _async_client_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client_loop is not loop:
+        _async_client = httpx.AsyncClient(limits=httpx.Limits(
+            max_connections=LLM_ASYNC_MAX_CONNECTIONS, max_keepalive_connections=LLM_ASYNC_MAX_CONNECTIONS))
+        _async_client_loop = loop
+    return _async_client
+
+async def close_async_client():
+    global _async_client, _async_client_loop
+    if _async_client is not None:
+        await _async_client.aclose()
+    _async_client = _async_client_loop = None
+
+
+async def _apost_with_retries(payload: dict, timeout: float, purpose: str) -> dict:
+    client = _get_async_client()
+    breaker = get_circuit_breaker()
+    attempt = 0
+    while True:
+        attempt_timeout = _attempt_timeout(timeout)
+        breaker.before_call()
+        started = time.perf_counter()
+        try:
+            response = await client.post(API_URL, headers=_headers(), json=payload, timeout=attempt_timeout)
+        except httpx.TimeoutException as e:
+            breaker.record_failure()
+            _observe_attempt(purpose, payload, started)
+            error, reason, wait = requests.exceptions.Timeout(str(e)), type(e).__name__, None
+        except httpx.TransportError as e:
+            breaker.record_failure()
+            error, reason, wait = requests.exceptions.ConnectionError(str(e)), type(e).__name__, None
+        except asyncio.CancelledError:
+            breaker.abandon_call()
+            raise
+        except Exception:
+            breaker.record_failure()
+            raise
+        else:
+            _observe_attempt(purpose, payload, started)
+            if response.status_code not in RETRY_STATUSES:
+                breaker.record_success()
+                if response.status_code >= 400:
+                    raise requests.exceptions.HTTPError(f"{response.status_code} from LLM provider")
+                return response.json()
+            breaker.record_failure()
+            error = requests.exceptions.HTTPError(f"{response.status_code} from LLM provider")
+            reason, wait = str(response.status_code), _retry_after(response)
+
+        await asyncio.sleep(_retry_wait(attempt, error, reason, wait))
+        attempt += 1
+
+
+async def achat_completion(payload: dict, timeout=30, purpose: str = "chat") -> dict:
+    """
+    Async chat_completion: same arguments, result and exceptions.
+
+    Only the provider round trip and the backoff sleeps are awaited; the
+    budget check and usage row are short SQLite calls and run on the I/O
+    pool. Cassette modes and installs without httpx run the whole sync
+    call on that pool instead.
+    """
+    if httpx is None or get_cassette().mode != "off":
+        return await run_blocking(chat_completion, payload, timeout, purpose)
+
+    await run_blocking(get_usage_tracker().check_budget, purpose)
+    model = payload.get("model", "")
+    with LLM_REQUEST_SECONDS.time(model=model, source="live"):
+        data = await _apost_with_retries(payload, LLM_TIMEOUT_SECONDS if timeout is None else timeout, purpose)
+    await run_blocking(_record_usage, payload, data, purpose, "live")
+    return data
@@ -0,0 +1,80 @@
+# scripts/lookup_context.py
+# Request-scoped speculative DB lookups: started as soon as the regex
+# extractor has found IDs, so they run while the LLM is still classifying.
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from scripts.db import (
+    check_asn_exists, check_po_exists, check_pallet_exists,
+    get_po_vs_asn_qty_summary, get_po_vs_asn_qty_summary_forasn
+)
+
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "8"))
+
+_executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+
+
+def _key(fn, args, kwargs):
+    return (fn.__name__, args, tuple(sorted(kwargs.items())))
+
+
+class LookupContext:
+    """
+    Holds prefetched lookup futures for one request.
+
+    take() hands out each prefetched result once; any later call with the
+    same arguments (e.g. the re-check after an SAP trigger) goes to the
+    database again, so post-trigger checks are never served stale data.
+    """
+
+    def __init__(self):
+        self._futures = {}
+
+    def prefetch(self, fn, *args, **kwargs):
+        key = _key(fn, args, kwargs)
+        if key not in self._futures:
+            self._futures[key] = _executor.submit(fn, *args, **kwargs)
+
+    def take(self, fn, *args, **kwargs):
+        future = self._futures.pop(_key(fn, args, kwargs), None)
+        if future is None:
+            return fn(*args, **kwargs)
+        return future.result()
+
+    def cancel(self):
+        for future in self._futures.values():
+            future.cancel()
+        self._futures.clear()
+
+
+def _as_list(value):
+    if not value:
+        return []
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+def prefetch_lookups(ids: dict) -> LookupContext:
+    """
+    Start the existence checks and qty summaries the resolver will need.
+
+    ids may map each type to one ID (extract_ids) or to a list of IDs
+    (extract_all_ids); pallet checks are paired with the first PO and ASN,
+    the same way resolve_issues_bulk pairs them.
+    """
+    context = LookupContext()
+    pos = _as_list(ids.get("po_id"))
+    asns = _as_list(ids.get("asn_id"))
+    pallets = _as_list(ids.get("pallet_id"))
+
+    for asn in asns:
+        context.prefetch(check_asn_exists, asn)
+        context.prefetch(get_po_vs_asn_qty_summary_forasn, asn)
+    for po in pos:
+        context.prefetch(check_po_exists, po)
+        context.prefetch(get_po_vs_asn_qty_summary, po)
+    po = pos[0] if pos else None
+    asn = asns[0] if asns else None
+    if po or asn:
+        for pallet in pallets:
+            context.prefetch(check_pallet_exists, po_id=po, asn_id=asn, pallet_id=pallet)
+    return context
@@ -0,0 +1,474 @@
+# scripts/mail_standin.py
+# Local stand-in for Gmail and the SAP team, for offline end-to-end and
+# load testing of email_handler.py / resolver.py.
+#
+#   cd backend
+#   python -m scripts.mail_standin --delay-min 1 --delay-max 5
+#
+# then start the app with the environment it prints (IMAP_SERVER, SMTP_PORT, ...).
+# Mail is kept in a SQLite file: an SMTP sink delivers into it, a minimal
+# IMAP4rev1 server reads from it, and a scripted SAP responder answers
+# mails sent to SAP_EMAIL after a configurable delay.
+import argparse
+import email
+import io
+import os
+import random
+import re
+import socketserver
+import sqlite3
+import threading
+import time
+from base64 import b64decode
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import getaddresses, parseaddr
+
+# ---------- CONFIGURATION ----------
+STANDIN_HOST = os.getenv("STANDIN_HOST", "127.0.0.1")
+STANDIN_SMTP_PORT = int(os.getenv("STANDIN_SMTP_PORT", "8025"))
+STANDIN_IMAP_PORT = int(os.getenv("STANDIN_IMAP_PORT", "8143"))
+STANDIN_DB_PATH = os.getenv("STANDIN_DB_PATH", "mail_standin.db")
+SAP_EMAIL = os.getenv("SAP_EMAIL", "warehouse.sap.123@gmail.com")
+
+CORRELATION_LINE = re.compile(r"^\s*([0-9A-F]{8}-\d{3})\b", re.MULTILINE)
+
+
+# ----------------------------
+# Mail store
+# ----------------------------
+class MailStore:
+    """One SQLite table of delivered messages, one row per recipient mailbox."""
+
+    def __init__(self, db_path=STANDIN_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    mailbox TEXT NOT NULL,
+                    sender TEXT,
+                    subject TEXT,
+                    raw BLOB NOT NULL,
+                    seen INTEGER DEFAULT 0,
+                    delivered_at REAL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_mailbox ON messages (mailbox, seen)")
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def deliver(self, raw: bytes, recipients=None):
+        msg = email.message_from_bytes(raw)
+        if not recipients:
+            recipients = [addr for _, addr in getaddresses(msg.get_all("To", []) + msg.get_all("Cc", []))]
+        sender = parseaddr(msg.get("From", ""))[1].lower()
+        subject = msg.get("Subject", "")
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO messages (mailbox, sender, subject, raw, delivered_at) VALUES (?, ?, ?, ?, ?)",
+                [(rcpt.lower(), sender, subject, raw, time.time()) for rcpt in recipients],
+            )
+
+    def search(self, mailbox: str, criteria: list) -> list:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, sender, subject, seen FROM messages WHERE mailbox = ? ORDER BY id",
+                (mailbox.lower(),),
+            ).fetchall()
+        return [row[0] for row in rows if _matches(criteria, {"sender": row[1], "subject": row[2] or "", "seen": row[3]})]
+
+    def fetch(self, mailbox: str, message_id: int, mark_seen=True):
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT raw FROM messages WHERE mailbox = ? AND id = ?", (mailbox.lower(), message_id)
+            ).fetchone()
+            if row and mark_seen:
+                conn.execute("UPDATE messages SET seen = 1 WHERE id = ?", (message_id,))
+        return row[0] if row else None
+
+    def set_seen(self, mailbox: str, message_id: int, seen=True):
+        with self._lock, self._connect() as conn:
+            conn.execute("UPDATE messages SET seen = ? WHERE mailbox = ? AND id = ?", (int(seen), mailbox.lower(), message_id))
+
+    def count(self, mailbox: str) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM messages WHERE mailbox = ?", (mailbox.lower(),)).fetchone()[0]
+
+
+def _matches(criteria: list, message: dict) -> bool:
+    """Evaluate a flat IMAP SEARCH key list (UNSEEN, SEEN, ALL, FROM, SUBJECT, NOT)."""
+    i = 0
+    while i < len(criteria):
+        key = criteria[i].upper()
+        negate = key == "NOT"
+        if negate:
+            i += 1
+            key = criteria[i].upper()
+        if key in ("FROM", "SUBJECT"):
+            i += 1
+            field = "sender" if key == "FROM" else "subject"
+            result = criteria[i].lower() in message[field].lower()
+        elif key == "UNSEEN":
+            result = not message["seen"]
+        elif key == "SEEN":
+            result = bool(message["seen"])
+        else:  # ALL and anything we don't model
+            result = True
+        if result == negate:
+            return False
+        i += 1
+    return True
+
+
+def _tokenize(line: str) -> list:
+    """Split an IMAP command into atoms and quoted strings, dropping parentheses."""
+    tokens, i = [], 0
+    while i < len(line):
+        ch = line[i]
+        if ch in " ()":
+            i += 1
+        elif ch == '"':
+            i += 1
+            value = ""
+            while i < len(line) and line[i] != '"':
+                if line[i] == "\\":
+                    i += 1
+                value += line[i]
+                i += 1
+            tokens.append(value)
+            i += 1
+        else:
+            start = i
+            while i < len(line) and line[i] not in " ()":
+                i += 1
+            tokens.append(line[start:i])
+    return tokens
+
+
+# ----------------------------
+# SMTP sink
+# ----------------------------
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, text):
+        self.wfile.write((text + "\r\n").encode())
+
+    def handle(self):
+        store, credentials = self.server.store, self.server.credentials
+        self.reply("220 mail-standin ESMTP ready")
+        rcpts = []
+        while True:
+            line = self.rfile.readline().decode(errors="replace").rstrip("\r\n")
+            if not line:
+                return
+            verb = line.split(" ", 1)[0].upper()
+            arg = line[len(verb):].strip()
+            if verb == "EHLO":
+                self.reply("250-mail-standin")
+                self.reply("250 AUTH PLAIN LOGIN")
+            elif verb == "HELO":
+                self.reply("250 mail-standin")
+            elif verb == "AUTH":
+                parts = arg.split()
+                if parts[0].upper() == "PLAIN":
+                    token = parts[1] if len(parts) > 1 else None
+                    if token is None:
+                        self.reply("334 ")
+                        token = self.rfile.readline().decode().strip()
+                    _, user, password = b64decode(token).decode().split("\0")
+                else:  # LOGIN
+                    self.reply("334 VXNlcm5hbWU6")
+                    user = b64decode(self.rfile.readline().strip()).decode()
+                    self.reply("334 UGFzc3dvcmQ6")
+                    password = b64decode(self.rfile.readline().strip()).decode()
+                if credentials is None or credentials.get(user.lower()) == password:
+                    self.reply("235 2.7.0 Authentication successful")
+                else:
+                    self.reply("535 5.7.8 Authentication credentials invalid")
+            elif verb == "MAIL":
+                rcpts = []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                rcpts.append(parseaddr(arg.split(":", 1)[1])[1])
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                while True:
+                    data = self.rfile.readline()
+                    if data in (b".\r\n", b".\n", b""):
+                        break
+                    lines.append(data[1:] if data.startswith(b"..") else data)
+                store.deliver(b"".join(lines), rcpts)
+                self.reply("250 OK: queued")
+            elif verb == "RSET":
+                rcpts = []
+                self.reply("250 OK")
+            elif verb == "NOOP":
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+# ----------------------------
+# Minimal IMAP4rev1 server
+# ----------------------------
+class IMAPHandler(socketserver.StreamRequestHandler):
+    def send(self, text):
+        self.wfile.write((text + "\r\n").encode())
+
+    def handle(self):
+        store, credentials = self.server.store, self.server.credentials
+        mailbox = None
+        self.send("* OK mail-standin IMAP4rev1 ready")
+        while True:
+            line = self.rfile.readline().decode(errors="replace").rstrip("\r\n")
+            if not line:
+                return
+            tag, _, rest = line.partition(" ")
+            command, _, args = rest.partition(" ")
+            command = command.upper()
+            if command == "UID":  # message ids double as UIDs
+                command, _, args = args.partition(" ")
+                command = command.upper()
+            tokens = _tokenize(args)
+
+            if command == "CAPABILITY":
+                self.send("* CAPABILITY IMAP4rev1 AUTH=PLAIN")
+                self.send(f"{tag} OK CAPABILITY completed")
+            elif command == "LOGIN":
+                user, password = tokens[0], tokens[1] if len(tokens) > 1 else ""
+                if credentials is None or credentials.get(user.lower()) == password:
+                    mailbox = user.lower()
+                    self.send(f"{tag} OK LOGIN completed")
+                else:
+                    self.send(f"{tag} NO [AUTHENTICATIONFAILED] Invalid credentials")
+            elif command in ("SELECT", "EXAMINE"):
+                self.send(f"* {store.count(mailbox)} EXISTS")
+                self.send("* 0 RECENT")
+                self.send("* FLAGS (\\Seen)")
+                self.send(f"{tag} OK [READ-WRITE] {command} completed")
+            elif command == "SEARCH":
+                if tokens and tokens[0].upper() == "CHARSET":
+                    tokens = tokens[2:]
+                ids = store.search(mailbox, tokens)
+                self.send("* SEARCH" + "".join(f" {i}" for i in ids))
+                self.send(f"{tag} OK SEARCH completed")
+            elif command == "FETCH":
+                for message_id in tokens[0].split(","):
+                    peek = "BODY.PEEK" in args.upper()
+                    raw = store.fetch(mailbox, int(message_id), mark_seen=not peek)
+                    if raw is None:
+                        continue
+                    self.wfile.write(f"* {message_id} FETCH (RFC822 {{{len(raw)}}}\r\n".encode())
+                    self.wfile.write(raw)
+                    self.wfile.write(b")\r\n")
+                self.send(f"{tag} OK FETCH completed")
+            elif command == "STORE":
+                if "\\SEEN" in args.upper():
+                    for message_id in tokens[0].split(","):
+                        store.set_seen(mailbox, int(message_id), not tokens[1].startswith("-"))
+                self.send(f"{tag} OK STORE completed")
+            elif command in ("NOOP", "CLOSE", "EXPUNGE", "CHECK"):
+                self.send(f"{tag} OK {command} completed")
+            elif command == "LOGOUT":
+                self.send("* BYE mail-standin logging out")
+                self.send(f"{tag} OK LOGOUT completed")
+                return
+            else:
+                self.send(f"{tag} BAD {command} not supported")
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, handler, store, credentials):
+        self.store = store
+        self.credentials = credentials
+        super().__init__(address, handler)
+
+
+# ----------------------------
+# Scripted SAP responder
+# ----------------------------
+class SapResponder:
+    """
+    Answers mails delivered to SAP_EMAIL after a random delay:
+    batch requests get one status line per correlation ID, pallet and
+    mismatch requests get an Excel file, other trigger mails get a status
+    line per PO/ASN/pallet ID found in the body.
+    """
+
+    def __init__(self, store, sap_email=SAP_EMAIL, delay=(1.0, 5.0), not_triggered_rate=0.0,
+                 send_excel=True, poll_seconds=0.5):
+        self.store = store
+        self.sap_email = sap_email
+        self.delay = delay
+        self.not_triggered_rate = not_triggered_rate
+        self.send_excel = send_excel
+        self.poll_seconds = poll_seconds
+        self.replied = 0
+        self._stop = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, name="sap-responder", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _status(self):
+        return "not triggered" if random.random() < self.not_triggered_rate else "triggered"
+
+    def _run(self):
+        while not self._stop.wait(self.poll_seconds):
+            for message_id in self.store.search(self.sap_email, ["UNSEEN"]):
+                raw = self.store.fetch(self.sap_email, message_id)
+                timer = threading.Timer(random.uniform(*self.delay), self._reply, args=(raw,))
+                timer.daemon = True
+                timer.start()
+
+    def _reply(self, raw: bytes):
+        from scripts.extractor import extract_all_ids
+
+        request = email.message_from_bytes(raw)
+        subject = request.get("Subject", "")
+        to = parseaddr(request.get("From", ""))[1]
+        body = _plain_body(request)
+
+        reply = MIMEMultipart()
+        reply["From"] = self.sap_email
+        reply["To"] = to
+        reply["Subject"] = f"Re: {subject}"
+
+        correlations = CORRELATION_LINE.findall(body)
+        ids = extract_all_ids(f"{subject}\n{body}")
+        if correlations:
+            lines = [f"{cid} {self._status()}" for cid in correlations]
+        else:
+            lines = [f"{value} {self._status()}" for values in ids.values() for value in values]
+        wants_excel = any(word in subject.lower() for word in ("pallet", "mismatch"))
+
+        if wants_excel and self.send_excel:
+            attachment = _excel_for(ids)
+            if attachment is not None:
+                part = MIMEApplication(attachment, _subtype="vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+                part.add_header("Content-Disposition", "attachment", filename="sap_reply.xlsx")
+                reply.attach(MIMEText("Hi, please find the requested details attached.\n" + "\n".join(lines), "plain"))
+                reply.attach(part)
+            else:
+                reply.attach(MIMEText("\n".join(lines) or "No details available.", "plain"))
+        elif lines:
+            reply.attach(MIMEText("Hi,\n" + "\n".join(lines) + "\nRegards, SAP Team", "plain"))
+        else:
+            return
+        self.store.deliver(reply.as_bytes(), [to])
+        self.replied += 1
+
+
+def _plain_body(msg) -> str:
+    for part in msg.walk():
+        if part.get_content_type() in ("text/plain", "text/html") and part.get_payload(decode=True):
+            return part.get_payload(decode=True).decode(errors="replace")
+    return ""
+
+
+def _excel_for(ids: dict):
+    """Excel bytes with one row per pallet for the requested IDs (None without openpyxl)."""
+    try:
+        import pandas as pd
+        import openpyxl  # noqa: F401  (pandas' xlsx writer)
+    except ImportError:
+        print("⚠️ pandas/openpyxl not installed, SAP stand-in replies without Excel")
+        return None
+    po = (ids["po_id"] or [f"2{random.randint(0, 10**9 - 1):09d}"])[0]
+    asn = (ids["asn_id"] or [f"0{random.randint(0, 9999):04d}"])[0]
+    pallets = ids["pallet_id"] or [f"5{random.randint(0, 10**14 - 1):014d}" for _ in range(3)]
+    df = pd.DataFrame({
+        "pallet_id": pallets,
+        "po_id": [po] * len(pallets),
+        "asn_id": [asn] * len(pallets),
+        "qty": [random.randint(1, 5) for _ in pallets],
+    })
+    buffer = io.BytesIO()
+    df.to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+# ----------------------------
+# Wiring
+# ----------------------------
+class StandIn:
+    """Running SMTP sink + IMAP server + SAP responder; call stop() when done."""
+
+    def __init__(self, store, smtp_server, imap_server, responder):
+        self.store = store
+        self.smtp_server = smtp_server
+        self.imap_server = imap_server
+        self.responder = responder
+
+    def environment(self) -> dict:
+        """Settings that point email_handler at this stand-in."""
+        smtp_host, smtp_port = self.smtp_server.server_address[:2]
+        imap_host, imap_port = self.imap_server.server_address[:2]
+        return {
+            "SMTP_SERVER": smtp_host, "SMTP_PORT": str(smtp_port), "SMTP_SSL": "0",
+            "IMAP_SERVER": imap_host, "IMAP_PORT": str(imap_port), "IMAP_SSL": "0",
+            "SAP_EMAIL": self.responder.sap_email,
+        }
+
+    def stop(self):
+        self.responder.stop()
+        for server in (self.smtp_server, self.imap_server):
+            server.shutdown()
+            server.server_close()
+
+
+def start_standin(host=STANDIN_HOST, smtp_port=STANDIN_SMTP_PORT, imap_port=STANDIN_IMAP_PORT,
+                  db_path=STANDIN_DB_PATH, credentials=None, **responder_options) -> StandIn:
+    """Start all three components in background threads (port 0 picks a free port)."""
+    store = MailStore(db_path)
+    smtp_server = _Server((host, smtp_port), SMTPHandler, store, credentials)
+    imap_server = _Server((host, imap_port), IMAPHandler, store, credentials)
+    for server in (smtp_server, imap_server):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    responder = SapResponder(store, **responder_options).start()
+    return StandIn(store, smtp_server, imap_server, responder)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local SMTP/IMAP/SAP stand-in for load testing.")
+    parser.add_argument("--host", default=STANDIN_HOST)
+    parser.add_argument("--smtp-port", type=int, default=STANDIN_SMTP_PORT)
+    parser.add_argument("--imap-port", type=int, default=STANDIN_IMAP_PORT)
+    parser.add_argument("--db", default=STANDIN_DB_PATH, help="SQLite file holding every mailbox")
+    parser.add_argument("--sap-email", default=SAP_EMAIL)
+    parser.add_argument("--delay-min", type=float, default=1.0, help="min seconds before SAP replies")
+    parser.add_argument("--delay-max", type=float, default=5.0, help="max seconds before SAP replies")
+    parser.add_argument("--not-triggered-rate", type=float, default=0.0, help="share of items SAP answers 'not triggered'")
+    parser.add_argument("--no-excel", action="store_true", help="never attach Excel files")
+    parser.add_argument("--user", action="append", default=[], metavar="EMAIL:PASSWORD",
+                        help="accepted login (repeatable); any login is accepted when omitted")
+    args = parser.parse_args()
+
+    credentials = {user.lower(): password for user, password in (u.split(":", 1) for u in args.user)} or None
+    standin = start_standin(
+        args.host, args.smtp_port, args.imap_port, args.db, credentials,
+        sap_email=args.sap_email, delay=(args.delay_min, args.delay_max),
+        not_triggered_rate=args.not_triggered_rate, send_excel=not args.no_excel,
+    )
+    print("📮 Mail stand-in running. Start the app with:")
+    for key, value in standin.environment().items():
+        print(f"  export {key}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        standin.stop()
@@ -0,0 +1,285 @@
+# scripts/metrics.py
+# In-process counters and latency histograms, rendered in the Prometheus
+# text format by GET /metrics.
+#
+# Under gunicorn each worker has its own registry; set METRICS_DIR to a
+# shared directory and every worker writes a snapshot there, so a scrape
+# that lands on any worker sees the totals of all of them.
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# ---------- CONFIGURATION ----------
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_SNAPSHOT_SECONDS = float(os.getenv("METRICS_SNAPSHOT_SECONDS", "5"))
+# A snapshot not rewritten for this long, or whose worker PID is gone, is deleted
+METRICS_STALE_SECONDS = float(os.getenv("METRICS_STALE_SECONDS", str(METRICS_SNAPSHOT_SECONDS * 3)))
+
+# Seconds; wide enough for a sub-millisecond query and a ten minute SAP wait.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def _label_key(label_names, labels):
+    unknown = set(labels) - set(label_names)
+    if unknown:
+        raise ValueError(f"Unknown metric labels: {', '.join(sorted(unknown))}")
+    return tuple(str(labels.get(name, "")) for name in label_names)
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    escaped = (
+        f'{name}="' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for name, value in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+class Counter:
+    """Monotonic count per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, label_names=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values = {}
+        _register(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(self.label_names, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {json.dumps(key): value for key, value in self._values.items()}
+
+    @staticmethod
+    def merge(total: dict, snapshot: dict):
+        for key, value in snapshot.items():
+            total[key] = total.get(key, 0) + value
+
+    def render(self, merged: dict) -> list:
+        lines = []
+        for key, value in sorted(merged.items()):
+            pairs = list(zip(self.label_names, json.loads(key)))
+            lines.append(f"{self.name}_total{_format_labels(pairs)} {value}")
+        return lines
+
+
+class Histogram:
+    """
+    Latency distribution per label set.
+
+    If "outcome" is one of the label names, time() fills it with "ok" or
+    "error" unless the caller sets it on the yielded labels dict.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._values = {}  # label key -> [bucket counts..., sum, count]
+        _register(self)
+
+    def observe(self, seconds: float, **labels):
+        key = _label_key(self.label_names, labels)
+        with self._lock:
+            state = self._values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    state[i] += 1
+            state[-2] += seconds
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        labels = dict(labels)
+        start = time.perf_counter()
+        try:
+            yield labels
+        except BaseException:
+            if "outcome" in self.label_names:
+                labels.setdefault("outcome", "error")
+            raise
+        finally:
+            if "outcome" in self.label_names:
+                labels.setdefault("outcome", "ok")
+            self.observe(time.perf_counter() - start, **labels)
+
+    def timed(self, **labels):
+        """Decorator form of time()."""
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.time(**labels):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {json.dumps(key): list(state) for key, state in self._values.items()}
+
+    @staticmethod
+    def merge(total: dict, snapshot: dict):
+        for key, state in snapshot.items():
+            if key in total:
+                total[key] = [a + b for a, b in zip(total[key], state)]
+            else:
+                total[key] = list(state)
+
+    def render(self, merged: dict) -> list:
+        lines = []
+        for key, state in sorted(merged.items()):
+            pairs = list(zip(self.label_names, json.loads(key)))
+            for bound, count in zip(self.buckets, state):
+                lines.append(f"{self.name}_bucket{_format_labels(pairs + [('le', bound)])} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(pairs + [('le', '+Inf')])} {state[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(pairs)} {round(state[-2], 6)}")
+            lines.append(f"{self.name}_count{_format_labels(pairs)} {state[-1]}")
+        return lines
+
+
+def _register(metric):
+    with _registry_lock:
+        if metric.name in _registry:
+            raise ValueError(f"Metric {metric.name} registered twice")
+        _registry[metric.name] = metric
+
+
+# ----------------------------
+# Cross-worker snapshots
+# ----------------------------
+def _snapshot_all() -> dict:
+    with _registry_lock:
+        metrics = list(_registry.values())
+    return {metric.name: metric.snapshot() for metric in metrics}
+
+
+def write_snapshot(directory: str = METRICS_DIR):
+    """Write this process's metrics to <directory>/<pid>.json (atomic rename)."""
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{os.getpid()}.json")
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(_snapshot_all(), f)
+    os.replace(tmp, path)
+
+
+_snapshot_pid = None  # process whose snapshot thread is running
+
+
+def start_metrics_snapshots():
+    """
+    Write this process's snapshot to METRICS_DIR every METRICS_SNAPSHOT_SECONDS
+    (nothing when METRICS_DIR is unset). Call it in each worker after the
+    fork, like the other background threads: a thread started at import
+    would only run in the gunicorn master. Repeated calls in one process
+    start one thread.
+    """
+    global _snapshot_pid
+    if not METRICS_DIR or _snapshot_pid == os.getpid():
+        return
+    _snapshot_pid = os.getpid()
+
+    def run():
+        while True:
+            time.sleep(METRICS_SNAPSHOT_SECONDS)
+            try:
+                write_snapshot()
+            except Exception as e:
+                print(f"❌ Metrics snapshot failed: {e}")
+    threading.Thread(target=run, name="metrics-snapshot", daemon=True).start()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # exists, owned by another user
+    return True
+
+
+def _is_stale(path: str, pid) -> bool:
+    """True for a snapshot of an exited worker: its PID is gone or it stopped being rewritten."""
+    if pid is not None and not _pid_alive(pid):
+        return True
+    return time.time() - os.path.getmtime(path) > METRICS_STALE_SECONDS
+
+
+def render_metrics() -> str:
+    """
+    Prometheus text exposition of every registered metric (all workers when
+    METRICS_DIR is set). Snapshots of exited workers are deleted rather
+    than counted, so restarts do not inflate the totals.
+    """
+    snapshots = [_snapshot_all()]
+    if METRICS_DIR and os.path.isdir(METRICS_DIR):
+        own = f"{os.getpid()}.json"
+        for filename in os.listdir(METRICS_DIR):
+            if filename.endswith(".json") and filename != own:
+                path = os.path.join(METRICS_DIR, filename)
+                stem = filename[:-len(".json")]
+                try:
+                    if _is_stale(path, int(stem) if stem.isdigit() else None):
+                        os.remove(path)
+                        continue
+                    with open(path, encoding="utf-8") as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+
+    with _registry_lock:
+        metrics = sorted(_registry.values(), key=lambda m: m.name)
+    lines = []
+    for metric in metrics:
+        merged = {}
+        for snapshot in snapshots:
+            metric.merge(merged, snapshot.get(metric.name, {}))
+        exposed = f"{metric.name}_total" if metric.kind == "counter" else metric.name
+        lines.append(f"# HELP {exposed} {metric.help}")
+        lines.append(f"# TYPE {exposed} {metric.kind}")
+        lines.extend(metric.render(merged))
+    return "\n".join(lines) + "\n"
+
+
+# ----------------------------
+# Shared metrics
+# ----------------------------
+CHAT_REQUEST_SECONDS = Histogram(
+    "chat_request_seconds", "End-to-end /chat latency.", ("phase", "scenario", "outcome"))
+CHAT_REQUESTS = Counter(
+    "chat_requests", "Handled /chat requests.", ("phase", "scenario", "outcome"))
+CHAT_STAGE_SECONDS = Histogram(
+    "chat_stage_seconds", "Latency of each /chat pipeline stage.", ("stage", "scenario", "outcome"))
+CLASSIFY_SECONDS = Histogram(
+    "classify_seconds", "Issue classification latency by method and resulting label.", ("method", "outcome"))
+LLM_REQUEST_SECONDS = Histogram(
+    "llm_request_seconds", "Latency of each LLM chat completion.", ("model", "source", "outcome"))
+DB_QUERY_SECONDS = Histogram(
+    "db_query_seconds", "Latency of warehouse DB queries in scripts/db.py.", ("query", "outcome"))
+SMTP_SEND_SECONDS = Histogram(
+    "smtp_send_seconds", "Latency of SMTP sends.", ("outcome",))
+IMAP_POLL_SECONDS = Histogram(
+    "imap_poll_seconds", "Latency of one IMAP inbox poll.", ("outcome",))
+SAP_WAIT_SECONDS = Histogram(
+    "sap_wait_seconds", "Time spent waiting for an SAP reply.", ("kind", "outcome"))
@@ -0,0 +1,144 @@
+# scripts/model_router.py
+# Maps each LLM task to a model, token limit and temperature, and moves a
+# task to a faster fallback model while its primary breaches the latency SLO.
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+
+from scripts.metrics import Counter
+
+# ---------- CONFIGURATION ----------
+# Task table. Override per task with LLM_ROUTES='{"sap_email": {"model": "llama3-8b-8192"}}'.
+DEFAULT_ROUTES = {
+    # Short, latency-critical calls stay on small models.
+    "classify": {"model": "llama3-8b-8192", "temperature": 0.0, "max_tokens": 256,
+                 "slo_ms": 2000, "fallbacks": ["llama-3.1-8b-instant"]},
+    "acknowledge": {"model": "llama3-8b-8192", "temperature": 0.2, "max_tokens": 150,
+                    "slo_ms": 2500, "fallbacks": ["llama-3.1-8b-instant"]},
+    "chat": {"model": "llama3-8b-8192", "temperature": 0.2, "max_tokens": 400,
+             "slo_ms": 4000, "fallbacks": ["llama-3.1-8b-instant"]},
+    "user_email": {"model": "llama3-8b-8192", "temperature": 0.2, "max_tokens": 300,
+                   "slo_ms": 5000, "fallbacks": ["llama-3.1-8b-instant"]},
+    # Mails to SAP are off the interactive path and get the larger model.
+    "sap_email": {"model": "llama3-70b-8192", "temperature": 0.7, "max_tokens": 400,
+                  "slo_ms": 8000, "fallbacks": ["llama3-8b-8192"]},
+    "canned": {"model": "llama3-8b-8192", "temperature": 0.9, "max_tokens": 120,
+               "slo_ms": 10000, "fallbacks": []},
+}
+LLM_ROUTER_WINDOW_SECONDS = float(os.getenv("LLM_ROUTER_WINDOW_SECONDS", "300"))
+LLM_ROUTER_MIN_SAMPLES = int(os.getenv("LLM_ROUTER_MIN_SAMPLES", "5"))
+LLM_ROUTER_PERCENTILE = float(os.getenv("LLM_ROUTER_PERCENTILE", "95"))
+
+
+def _load_routes() -> dict:
+    routes = {task: dict(route) for task, route in DEFAULT_ROUTES.items()}
+    overrides = json.loads(os.getenv("LLM_ROUTES", "{}"))
+    for task, route in overrides.items():
+        routes.setdefault(task, dict(DEFAULT_ROUTES["chat"])).update(route)
+    return routes
+
+
+LLM_ROUTE_FALLBACKS = Counter(
+    "llm_route_fallbacks", "LLM calls sent to a fallback model because the primary breached its SLO.",
+    ("task", "model"))
+
+
+class ModelRouter:
+    """
+    Picks the model for a task from recent observed latency.
+
+    Latency is tracked per (task, model): a long-context chat or SAP mail
+    call is slower than a classify call on the same model, and must not
+    push the short tasks onto their fallbacks. Samples older than `window_seconds` are dropped, so a primary that was
+    routed around gets traffic again once its slow samples have aged out.
+    """
+
+    def __init__(self, routes=None, window_seconds=LLM_ROUTER_WINDOW_SECONDS,
+                 min_samples=LLM_ROUTER_MIN_SAMPLES, percentile=LLM_ROUTER_PERCENTILE):
+        self.routes = routes or _load_routes()
+        self.window_seconds = window_seconds
+        self.min_samples = min_samples
+        self.percentile = percentile
+        self._samples = {}  # (task, model) -> deque of (timestamp, seconds)
+        self._lock = threading.Lock()
+
+    def _task(self, task: str) -> str:
+        """Route key a task is served by (unknown tasks use the chat route)."""
+        return task if task in self.routes else "chat"
+
+    def observe(self, task: str, model: str, seconds: float):
+        now = time.monotonic()
+        with self._lock:
+            samples = self._samples.setdefault((self._task(task), model), deque(maxlen=500))
+            samples.append((now, seconds))
+
+    def latency_ms(self, task: str, model: str):
+        """Observed latency percentile of a model on a task in ms, or None with too few recent samples."""
+        cutoff = time.monotonic() - self.window_seconds
+        with self._lock:
+            samples = self._samples.get((self._task(task), model))
+            if not samples:
+                return None
+            while samples and samples[0][0] < cutoff:
+                samples.popleft()
+            values = sorted(seconds for _, seconds in samples)
+        if len(values) < self.min_samples:
+            return None
+        rank = max(1, math.ceil(self.percentile / 100 * len(values)))
+        return values[rank - 1] * 1000
+
+    def choose_model(self, task: str) -> str:
+        route = self.routes.get(task) or self.routes["chat"]
+        candidates = [route["model"]] + list(route.get("fallbacks", []))
+        observed = []
+        for model in candidates:
+            latency = self.latency_ms(task, model)
+            if latency is None or latency <= route["slo_ms"]:
+                chosen = model
+                break
+            observed.append((latency, model))
+        else:
+            # Everything is over the SLO: take the fastest.
+            chosen = min(observed)[1]
+        if chosen != route["model"]:
+            LLM_ROUTE_FALLBACKS.inc(task=task, model=chosen)
+        return chosen
+
+    def build_payload(self, task: str, messages: list, **extra) -> dict:
+        """
+        Chat completion body for a task: routed model, temperature and token limit.
+
+        Args:
+            task: Key of the task table (classify, acknowledge, chat, user_email, sap_email, canned)
+            messages: Chat messages
+            extra: Further body fields, e.g. response_format
+
+        Returns:
+            Payload for llm_client.chat_completion
+        """
+        route = self.routes.get(task) or self.routes["chat"]
+        payload = {
+            "model": self.choose_model(task),
+            "messages": messages,
+            "temperature": route["temperature"],
+            "max_tokens": route["max_tokens"],
+        }
+        payload.update(extra)
+        return payload
+
+
+_router = None
+_router_lock = threading.Lock()
+
+def get_model_router() -> ModelRouter:
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = ModelRouter()
+        return _router
+
+def build_payload(task: str, messages: list, **extra) -> dict:
+    return get_model_router().build_payload(task, messages, **extra)
@@ -1,9 +1,9 @@
 import sqlite3
 from datetime import datetime
-from faker import Faker
 import random
 
-fake = Faker()
+from scripts import data_generator as gen
+
 DB_PATH = "warehouse.db"
 
 def connect_db():
@@ -76,61 +76,60 @@ def get_po_vs_asn_qty_summary(po_id):
 
 # Insert PO (header + line)
 def insert_po_data(po_id: str):
+    now = str(datetime.now())
     with connect_db() as conn:
         cursor = conn.cursor()
 
         # Insert into PO_HEADER
         cursor.execute(
             """
-            INSERT OR IGNORE INTO po_header (po_id, supplier_name, order_date, status)
-            VALUES (?, ?, ?, ?)
+            INSERT OR IGNORE INTO po_header (po_id, status, last_updated)
+            VALUES (?, ?, ?)
             """,
-            (po_id, fake.company(), fake.date(), "open"),
+            (po_id, random.choice(gen.PO_STATUSES), now),
         )
 
         # Insert into PO_LINE
-        for _ in range(random.randint(1, 3)):
-            cursor.execute(
-                """
-                INSERT INTO po+line (po_id, item_description, quantity, unit_price)
-                VALUES (?, ?, ?, ?)
-                """,
-                (po_id, fake.word(), random.randint(10, 100), round(random.uniform(10.0, 100.0), 2)),
-            )
+        cursor.executemany(
+            """
+            INSERT INTO po_line (pallet_id, po_id, asn_id, last_updated, quantity)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            [
+                (gen.pallet_id(random.randrange(gen.PALLET_ID_SPACE)), po_id, None, now, random.randint(1, 5))
+                for _ in range(random.randint(1, 3))
+            ],
+        )
 
         conn.commit()
 
 # Insert ASN (header + line)
 def insert_asn_data(asn_id: str):
+    now = str(datetime.now())
+    supplier_ref = gen.supplier_reference(random)
     with connect_db() as conn:
         cursor = conn.cursor()
 
         # Insert ASN header
         cursor.execute(
             """
-            INSERT OR IGNORE INTO asn_header (asn_id, shipment_date, carrier)
+            INSERT OR IGNORE INTO asn_header (asn_id, supplier_reference, last_updated)
             VALUES (?, ?, ?)
             """,
-            (asn_id, fake.date(), fake.company())
+            (asn_id, supplier_ref, now)
         )
 
         # Insert ASN line
-        for _ in range(random.randint(1, 3)):
-            po_id = fake.uuid4()[:8]
-            pallet_id = fake.uuid4()[:8]
-            cursor.execute(
-                """
-                INSERT INTO asn_line (pallet_id, po_id, asn_id, supplier_reference, last_updated, quantity)
-                VALUES (?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    pallet_id,
-                    po_id,
-                    asn_id,
-                    fake.bothify(text="REF-####"),
-                    datetime.now().isoformat(),
-                    random.randint(1, 50)
-                )
-            )
+        cursor.executemany(
+            """
+            INSERT INTO asn_line (pallet_id, po_id, asn_id, supplier_reference, last_updated, quantity)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (gen.pallet_id(random.randrange(gen.PALLET_ID_SPACE)), gen.po_id(random.randrange(gen.PO_ID_SPACE)),
+                 asn_id, supplier_ref, now, random.randint(1, 5))
+                for _ in range(random.randint(1, 3))
+            ],
+        )
 
         conn.commit()
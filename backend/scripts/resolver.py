@@ -1,8 +1,13 @@
+import contextvars
+import os
 import re
 import sys
-import pandas as pd
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
 from io import StringIO
 from scripts.email_handler import (
+    SAP_EMAIL,
     send_email,
     send_email_with_screenshot,
     wait_for_excel_from_sap,
@@ -16,14 +21,31 @@ from scripts.db import (
     check_asn_exists, check_po_exists, check_pallet_exists,
     get_po_vs_asn_qty_summary, get_existing_pallet_ids,get_po_vs_asn_qty_summary_forasn
 )
+from scripts.llm_client import pause_deadline
+from scripts.lookup_context import LookupContext
+from scripts.similar_issues import case_scope, record_resolution, reusable_outcome, similar_cases_note
+from scripts.singleflight import SingleFlight
+from scripts.sap_batcher import request_sap_trigger
 from scripts.utils import (
     parse_excel_to_df, insert_pallets_from_excel,
     fetch_rows, generate_html_snippet
 )
 
-# Global variable to store print outputs
+# IDs of one message resolved at the same time; their SAP trigger requests
+# then share a batch (scripts/sap_batcher.py) and one wait
+BULK_RESOLVE_WORKERS = int(os.getenv("BULK_RESOLVE_WORKERS", "8"))
+
+ASN_OR_PO_PROMPT = ("Could you please provide the ASN (5 digits starting with 0) "
+                    "or PO (10 digits starting with 2) so we can proceed?")
+
+# Print outputs for the CLI (main.py). The web app keeps them per session
+# in the session store via app.broadcast_print_output instead.
 print_outputs = []
 
+# Set by _run_and_record(): the reporter of the running workflow and the
+# last mail sent to them, as (subject, context, details, html_format)
+_reporter_mail = contextvars.ContextVar("resolver_reporter_mail", default=None)
+
 def generate_ai_email_content(context: str, details: dict, user_email: str = None) -> str:
     """
     Generate AI-powered email content based on context and details
@@ -83,7 +105,8 @@ Important:
 Return ONLY the email body content, nothing else.
 """
 
-        ai_content = chat_with_ai(prompt).strip()
+        task = "sap_email" if user_email == SAP_EMAIL else "user_email"
+        ai_content = chat_with_ai(prompt, purpose=task).strip()
 
         # Clean up if wrapped in quotes
         if ai_content.startswith('"') and ai_content.endswith('"'):
@@ -95,8 +118,9 @@ Return ONLY the email body content, nothing else.
 
         return ai_content
 
-    except ImportError:
-        # Fallback messages with proper personalization
+    except (ImportError, requests.exceptions.RequestException):
+        # Fallback messages with proper personalization (also used when the LLM is
+        # over budget, past the request deadline or failing)
         user_name = user_email.split('@')[0] if user_email else 'User'
         
         fallback_messages = {
@@ -111,7 +135,8 @@ Return ONLY the email body content, nothing else.
             "Quantity Mismatch": f"Hi {user_name}, Quantity mismatch detected for PO {details.get('po_id', 'N/A')}. Our team is investigating the issue.",
             "Mismatch Resolved": f"Hi {user_name}, Quantity mismatch for PO {details.get('po_id', 'N/A')} has been successfully resolved. Quantities now match between PO and ASN.",
             "SAP Request": f"Hi {user_name}, Request sent to SAP for {details.get('type', 'information')}. We will notify you once we receive a response.",
-            "Error": f"Hi {user_name}, An error occurred: {details.get('message', 'Unknown error')}. Please contact support if this persists."
+            "Error": f"Hi {user_name}, An error occurred: {details.get('message', 'Unknown error')}. Please contact support if this persists.",
+            "Issue Update": f"Hi {user_name}, the {details.get('issue', 'issue')} you reported has been processed. We will follow up by mail if anything else is needed."
         }
         return fallback_messages.get(context, f"Hi {user_name}, Status update: {context}")
 
@@ -124,9 +149,13 @@ def send_ai_email_with_screenshot(user_email: str, subject: str, context: str, d
         subject: Email subject line
         context: Context for AI content generation
         details: Details dictionary for AI content
-        screenshot_data: Screenshot data (optional)
+        screenshot_data: Screenshot reference from scripts/screenshot_store.py (optional)
         html_format: Whether to format as HTML
     """
+    sent = _reporter_mail.get()
+    if sent is not None and user_email == sent["user_email"]:
+        sent["mail"] = (subject, context, dict(details), html_format)
+
     # Update details with screenshot information
     details_with_screenshot = details.copy()
     details_with_screenshot['screenshot_provided'] = bool(screenshot_data)
@@ -137,6 +166,12 @@ def send_ai_email_with_screenshot(user_email: str, subject: str, context: str, d
     # Add HTML formatting if requested
     if html_format and details.get('html'):
         ai_content += f"<br><br>{details['html']}"
+
+    # Escalations to SAP list the most similar cases resolved before
+    if user_email == SAP_EMAIL:
+        note = similar_cases_note()
+        if note:
+            ai_content += ("<br><br>" + note.replace("\n", "<br>")) if html_format else "\n\n" + note
     
     # Send email with AI-generated content
     send_email_with_screenshot(user_email, subject, ai_content, screenshot_data, html_format)
@@ -180,7 +215,8 @@ def add_print_output(message):
     global print_outputs
     print_outputs.append(message)
 
-def resolve_issue(scenario: str, params:dict, user_email:str, screenshot_data:str = None)-> str:
+def get_live_print():
+    """print() that also surfaces each line to the current chat session, when running under app.py."""
     # Use live print broadcasting instead of local capture
     # Try to import and use the live print function from app
     try:
@@ -193,6 +229,87 @@ def resolve_issue(scenario: str, params:dict, user_email:str, screenshot_data:st
     except ImportError:
         # Fallback to regular print if import fails
         live_print = print
+    return live_print
+
+# Identical open issues share one workflow run (see resolve_issue)
+_inflight = SingleFlight()
+
+def coalesce_key(scenario: str, params: dict):
+    """(scenario, normalized IDs), or None when there is nothing to coalesce on."""
+    ids = tuple(
+        (field, str(params[field]).strip())
+        for field in ("po_id", "asn_id", "pallet_id")
+        if params.get(field)
+    )
+    if scenario not in ("missing_asn", "missing_po", "missing_pallet", "quantity_mismatch") or not ids:
+        return None
+    return (scenario, ids)
+
+def resolve_issue(scenario: str, params:dict, user_email:str, screenshot_data:str = None, lookups: LookupContext = None)-> str:
+    """
+    Resolve an issue, coalescing identical requests that are already in flight.
+
+    When ten users report the same stuck ASN, only the first report runs the
+    workflow (one SAP mail, one poll loop). The others wait for it, get the
+    same confirmation, and are mailed the outcome. A ticket already resolved
+    within SIMILAR_ISSUE_REUSE_SECONDS, with its warehouse rows unchanged
+    since, gets that outcome without running the workflow again.
+    """
+    key = coalesce_key(scenario, params)
+    if key is None:
+        return _resolve_issue(scenario, params, user_email, screenshot_data, lookups)
+
+    reused = reusable_outcome(scenario, params)
+    if reused is not None:
+        get_live_print()(f"♻️ This issue was resolved at {time.strftime('%H:%M', time.localtime(reused['resolved_at']))} "
+                         f"and nothing has changed in the system since.")
+        (result, mail), leader = (reused["outcome"], reused["mail"]), False
+    else:
+        if key in _inflight.in_flight():
+            get_live_print()(f"🔗 This issue is already being worked on, attaching your request to it.")
+        # Followers wait on the leader's SAP round trip, which does not count against their LLM deadline
+        (result, mail), leader = _inflight.do(key, lambda: _run_and_record(scenario, params, user_email, screenshot_data, lookups),
+                                              wait_scope=pause_deadline)
+    if not leader and user_email:
+        notify_reporter(user_email, scenario, params, mail, screenshot_data)
+    return result
+
+def notify_reporter(user_email: str, scenario: str, params: dict, mail, screenshot_data: str = None):
+    """
+    Mail a reporter whose ticket was answered by another run (coalesced or
+    reused): the same mail that run sent its own reporter, written for this
+    one. The confirmation string itself is prompt text, not a mail body.
+    """
+    if mail:
+        subject, context, details, html_format = mail
+    else:
+        subject, context, html_format = f"Update: {scenario.replace('_', ' ')}", "Issue Update", False
+        details = {field: value for field, value in params.items() if field in ("po_id", "asn_id", "pallet_id") and value}
+        details["issue"] = scenario.replace("_", " ")
+    try:
+        send_ai_email_with_screenshot(user_email, subject, context, details, screenshot_data, html_format)
+    except Exception as e:
+        print(f"❌ Could not notify {user_email}: {e}")
+
+def _run_and_record(scenario: str, params: dict, user_email: str, screenshot_data: str, lookups: LookupContext):
+    # Recorded with the state of its rows after the run, for reuse and for
+    # the similar-case list in SAP escalations (scripts/similar_issues.py).
+    # The last mail to the reporter tells what kind of outcome it was.
+    sent = {"user_email": user_email, "mail": None}
+    token = _reporter_mail.set(sent)
+    try:
+        with case_scope(scenario, params):
+            result = _resolve_issue(scenario, params, user_email, screenshot_data, lookups)
+    finally:
+        _reporter_mail.reset(token)
+    record_resolution(scenario, params, result, sent["mail"])
+    return result, sent["mail"]
+
+def _resolve_issue(scenario: str, params:dict, user_email:str, screenshot_data:str = None, lookups: LookupContext = None)-> str:
+    # lookups carries DB checks prefetched while the LLM was classifying;
+    # without one every lookup goes straight to the database.
+    lookups = lookups or LookupContext()
+    live_print = get_live_print()
     
     live_print(f"🔍 Resolving scenario: {scenario}")
     live_print(f"📋 Parameters received: {params}")
@@ -204,17 +321,17 @@ def resolve_issue(scenario: str, params:dict, user_email:str, screenshot_data:st
     
     if scenario == "missing_asn":
         asn = params.get("asn_id")
-        summary = get_po_vs_asn_qty_summary_forasn(asn)
+        summary = lookups.take(get_po_vs_asn_qty_summary_forasn, asn)
         if not asn :
             # send_email(user_email, "ASN Error", "ASN ID missing.")
             response = "ASN error: ASN ID missing."
             return response
 
-        if check_asn_exists(asn) and summary["po_pallets"] == summary["asn_pallets"] and summary["po_qty"] == summary["asn_qty"]:
+        if lookups.take(check_asn_exists, asn) and summary["po_pallets"] == summary["asn_pallets"] and summary["po_qty"] == summary["asn_qty"]:
             
-            rows = fetch_rows("asn_header", "WHERE asn_id = ?", (asn,))
+            rows = fetch_rows("asn_header", {"asn_id": asn})
             html = generate_html_snippet(rows, "asn_id", asn)
-            rows = fetch_rows("asn_line", "WHERE asn_id = ?", (asn,))
+            rows = fetch_rows("asn_line", {"asn_id": asn})
             html = generate_html_snippet(rows, "asn_id", asn)
             
             
@@ -223,8 +340,8 @@ def resolve_issue(scenario: str, params:dict, user_email:str, screenshot_data:st
             return f"ASN {asn} already exists in the system. Please proceed with receiving."
         else:
             live_print(f"📧 Mail has been sent to SAP to trigger ASN {asn}.we will let you know through mail once we receive a response.")
-            send_ai_email_with_screenshot("warehouse.sap.123@gmail.com", "Trigger ASN", "please Trigger ASN", {"asn_id": asn}, screenshot_data)
-            status = wait_for_trigger_confirmation_from_sap(asn)
+            correlation_id = request_sap_trigger("asn", {"asn_id": asn}, user_email)
+            status = wait_for_trigger_confirmation_from_sap(asn, correlation_id=correlation_id)
             if status == "triggered":
                 if check_asn_exists(asn) and summary["po_pallets"] == summary["asn_pallets"] and summary["po_qty"] == summary["asn_qty"]:
                     send_ai_email_with_screenshot(user_email, "ASN Triggered", "ASN Triggered", {"asn_id": asn,}, screenshot_data,html_format=True)
@@ -233,7 +350,7 @@ def resolve_issue(scenario: str, params:dict, user_email:str, screenshot_data:st
                     send_ai_email_with_screenshot(user_email, "ASN Trigger Failed", "ASN Trigger Failed", {"asn_id": asn}, screenshot_data)
                     return f"ASN {asn} was triggered but not found in system. support team was contacted we will let you knoe the further process through mail."
             elif status == "not_triggered":
-                send_ai_email_with_screenshot("warehouse.sap.123@gmail.com", "ASN Not Triggered", "ASN Not Triggered", {"asn_id": asn}, screenshot_data)
+                send_ai_email_with_screenshot(SAP_EMAIL, "ASN Not Triggered", "ASN Not Triggered", {"asn_id": asn}, screenshot_data)
                 return f"The asn is not triggered by SAP. support team was contacted we will let you knoe the further process through mail."
             else:
                 send_ai_email_with_screenshot(user_email, "ASN Trigger Pending", "ASN Trigger Pending", {"asn_id": asn}, screenshot_data)
@@ -247,12 +364,12 @@ def resolve_issue(scenario: str, params:dict, user_email:str, screenshot_data:st
             send_ai_email_with_screenshot(user_email, "PO Error", "please provide valid po", {"message": "PO ID missing."}, screenshot_data)
             return "PO error: PO ID missing."
 
-        if check_po_exists(po):
+        if lookups.take(check_po_exists, po):
             live_print(f"✅ PO {po} found in system")
-            summary = get_po_vs_asn_qty_summary(po)
+            summary = lookups.take(get_po_vs_asn_qty_summary, po)
             if summary["po_pallets"] == summary["asn_pallets"] and summary["po_qty"] == summary["asn_qty"]:
                 live_print(f"✅ PO {po} quantities match - proceeding with receiving")
-                rows = fetch_rows("po_line", "WHERE po_id = ?", (po,))
+                rows = fetch_rows("po_line", {"po_id": po})
                 html = generate_html_snippet(rows, "po_id", po)
                 send_ai_email_with_screenshot(user_email, "PO Found in the system", "PO Found", {"po_id": po, "html": html}, screenshot_data, html_format=True)
                 return f"PO {po} already exists in the system. Please proceed with receiving."
@@ -262,12 +379,12 @@ def resolve_issue(scenario: str, params:dict, user_email:str, screenshot_data:st
                 return f"PO {po} found, but mismatch detected. Investigating further"
         else:   
             live_print(f"🔍 PO not found, mail has been sent to sap to trigger the po")
-            send_ai_email_with_screenshot("warehouse.sap.123@gmail.com", "Trigger PO", "Trigger PO", {"po_id": po}, screenshot_data)
-            status = wait_for_trigger_confirmation_from_sap(po)
+            correlation_id = request_sap_trigger("po", {"po_id": po}, user_email)
+            status = wait_for_trigger_confirmation_from_sap(po, correlation_id=correlation_id)
             if status == "triggered":
                 if summary["po_pallets"] == summary["asn_pallets"] and summary["po_qty"] == summary["asn_qty"]:
                      print(f"✅ PO {po} quantities match both in asn line and po line - proceeding with receiving")
-                     rows = fetch_rows("po_line", "WHERE po_id = ?", (po,))
+                     rows = fetch_rows("po_line", {"po_id": po})
                      html = generate_html_snippet(rows, "po_id", po)
                      send_ai_email_with_screenshot(user_email, "PO Triggered", "PO Triggered", {"po_id": po}, screenshot_data)
                      return f"PO {po} has been successfully triggered.  you may  proceed with receiving and check now."
@@ -283,34 +400,25 @@ def resolve_issue(scenario: str, params:dict, user_email:str, screenshot_data:st
         po = params.get("po_id")
         asn = params.get("asn_id")
 
-        # Validate and request missing ASN or PO
-        while not (asn and re.match(r"^0\d{4}$", asn)) and not (po and re.match(r"^2\d{9}$", po)):
-            live_print("Could you please provide the ASN or PO details so we can proceed?")
-            user_input = ask_user_for_input("Enter ASN (5 digits starting with 0) or PO (10 digits starting with 2):")
-            if re.match(r"^0\d{4}$", user_input):
-                asn = user_input
-                params["asn"] = asn
-            elif re.match(r"^2\d{9}$", user_input):
-                po = user_input
-                params["po"] = po
-            else:
-                live_print("Invalid format. Please re-enter a valid ASN (starts with 0, 5 digits) or PO (starts with 2, 10 digits).")
+        # Validate and request missing ASN or PO; the workflow pauses here
+        # and is re-run with the user's answer.
+        if not (asn and re.match(r"^0\d{4}$", asn)) and not (po and re.match(r"^2\d{9}$", po)):
+            ask_user_for_input(ASN_OR_PO_PROMPT, ("asn_id", "po_id"))
 
         # Check if pallet ID is missing
         if not pallet_id:
             send_ai_email_with_screenshot(user_email, "Pallet Error", "Pallet Error", {"message": "Pallet ID missing."}, screenshot_data)
-            live_print("Pallet ID is missing. Please provide it.")
-            user_input = ask_user_for_input("Enter Pallet ID:")
-            
+            ask_user_for_input("Pallet ID is missing. Please provide it (15 digits starting with 5).", ("pallet_id",))
+
 
         # Check if the pallet already exists
-        if check_pallet_exists(po_id=po, asn_id=asn, pallet_id=pallet_id):
+        if lookups.take(check_pallet_exists, po_id=po, asn_id=asn, pallet_id=pallet_id):
             send_ai_email_with_screenshot(user_email, "Pallet Found", "Pallet Found", {"pallet_id": pallet_id}, screenshot_data)
             return f"Pallet {pallet_id} is already present in the system . Try receiving now , for further concern please reach out to us. we are closing this log. Thank you"
             
         
         # Trigger SAP for pallet info
-        send_ai_email_with_screenshot("warehouse.sap.123@gmail.com", "Trigger Pallet", "Trigger Pallet and also details for this parameter", {"pallet_id": pallet_id, "po_id": po, "asn_id": asn}, screenshot_data)
+        send_ai_email_with_screenshot(SAP_EMAIL, "Trigger Pallet", "Trigger Pallet and also details for this parameter", {"pallet_id": pallet_id, "po_id": po, "asn_id": asn}, screenshot_data)
         live_print(f"Missing pallet {pallet_id} for PO {po} and ASN {asn}. Request sent to SAP. Please wait...")
 
         # Wait for Excel from SAP
@@ -327,7 +435,7 @@ def resolve_issue(scenario: str, params:dict, user_email:str, screenshot_data:st
                 live_print("all the pallets has been interfaced into the system successfully.")
 
             # Insert the missing pallet data
-            send_email_with_screenshot("warehouse.sap.123@gmail.com", "Trigger Pallets", "Pallet Trigger Request", {"pallet_id": missing_list, "po_id": po, "asn_id": asn, "message": "Please trigger the following pallets in the system"})
+            send_email_with_screenshot(SAP_EMAIL, "Trigger Pallets", "Pallet Trigger Request", {"pallet_id": missing_list, "po_id": po, "asn_id": asn, "message": "Please trigger the following pallets in the system"})
             #insert_pallets_from_excel(df, po_id=po or df.iloc[0]["po_id"], asn_id=asn or df.iloc[0]["asn_id"])
             status = wait_for_trigger_confirmation_from_sap(po)
             if status == "triggered":
@@ -344,30 +452,22 @@ def resolve_issue(scenario: str, params:dict, user_email:str, screenshot_data:st
             return "No SAP response received. Timeout occurred.we will let you know through mail once we receive a response. Thank you for your patience."
     
     elif scenario == "quantity_mismatch":
-        po = params.get("po")
+        po = params.get("po_id")
         pallet_id = params.get("pallet_id")
         asn = params.get("asn_id")
         
 
         # Step 1: Ask for valid PO/ASN if missing
-        while not (asn and re.match(r"^0\d{4}$", asn)) and not (po and re.match(r"^2\d{9}$", po)):
-            live_print("Could you please provide the ASN or PO details so we can proceed?")
-            user_input = ask_user_for_input("Enter ASN (5 digits starting with 0) or PO (10 digits starting with 2):")
-            if re.match(r"^0\d{4}$", user_input):
-                asn = user_input
-                params["asn"] = asn
-            elif re.match(r"^2\d{9}$", user_input):
-                po = user_input
-                params["po"] = po
-            else:
-                live_print("Invalid format. Please re-enter a valid ASN or PO.")
+        if not (asn and re.match(r"^0\d{4}$", asn)) and not (po and re.match(r"^2\d{9}$", po)):
+            ask_user_for_input(ASN_OR_PO_PROMPT, ("asn_id", "po_id"))
 
         # Step 2: Request mismatch file from SAP
         identifiers = ", ".join([f"{k.upper()}: {v}" for k, v in params.items() if v])
-        send_ai_email_with_screenshot("warehouse.sap.123@gmail.com", "Quantity Mismatch", "Quantity Mismatch Request", {"po_id": po, "pallet_id": pallet_id, "asn_id": asn, "message": "Please provide details about the quantity mismatch for the specified parameters"})
+        send_ai_email_with_screenshot(SAP_EMAIL, "Quantity Mismatch", "Quantity Mismatch Request", {"po_id": po, "pallet_id": pallet_id, "asn_id": asn, "message": "Please provide details about the quantity mismatch for the specified parameters"})
         live_print("Request sent to SAP for mismatch Excel file. Waiting for reply...")
 
         path_or_df = wait_for_excel_from_sap("mismatch")
+        import pandas as pd  # only SAP Excel paths need pandas; see scripts/utils.py
 
 # If it returns a path string:
         if isinstance(path_or_df, str) and path_or_df:
@@ -424,7 +524,7 @@ def resolve_issue(scenario: str, params:dict, user_email:str, screenshot_data:st
          
         live_print(f"Mail has been sent to SAP to trigger the missing entries.please wait for the response.")
             # Step 4: Now check if PO exists in system
-        send_ai_email_with_screenshot("warehouse.sap.123@gmail.com", "Mismatch Quantity Resolution", "Missing Entries Trigger Request", {"asn_id": missing_asn_entries, "po_id": missing_po_list, "pallet_id": missing_pallets, "message": "Please trigger the missing quantities for the specified entries"})
+        send_ai_email_with_screenshot(SAP_EMAIL, "Mismatch Quantity Resolution", "Missing Entries Trigger Request", {"asn_id": missing_asn_entries, "po_id": missing_po_list, "pallet_id": missing_pallets, "message": "Please trigger the missing quantities for the specified entries"})
 
         status = wait_for_trigger_confirmation_from_sap(po)
         if status == "triggered":
@@ -443,7 +543,7 @@ def resolve_issue(scenario: str, params:dict, user_email:str, screenshot_data:st
                             live_print(f"❌ Pallet {pallet} not found in system even after SAP response")
                             continue
                 else:
-                    send_ai_email_with_screenshot("warehouse.sap.123@gmail.com", "PO Missing", "the retriggered failed in the wms system. please retrigger it", {"po_id": missing_po_list}, screenshot_data)
+                    send_ai_email_with_screenshot(SAP_EMAIL, "PO Missing", "the retriggered failed in the wms system. please retrigger it", {"po_id": missing_po_list}, screenshot_data)
                
         else:
                 send_ai_email_with_screenshot(user_email, "SAP Timeout", "PO Trigger Timeout, we will let you know we receive the response", {"po_id": missing_po_list}, screenshot_data)
@@ -463,3 +563,49 @@ def resolve_issue(scenario: str, params:dict, user_email:str, screenshot_data:st
         return "Unknown scenario. Please check the issue, parameters and try again."
     
     return "Issue resolution completed."
+
+# The ID type each scenario resolves one at a time in bulk mode
+BULK_KEYS = {
+    "missing_asn": "asn_id",
+    "missing_po": "po_id",
+    "missing_pallet": "pallet_id",
+}
+
+def resolve_issues_bulk(scenario: str, all_ids: dict, user_email: str, screenshot_data: str = None, lookups: LookupContext = None) -> str:
+    """
+    Resolve every ID of the scenario's type found in one message.
+
+    Args:
+        scenario: Classified issue label
+        all_ids: IDs grouped by type, as returned by extractor.extract_all_ids
+        user_email: User's email address
+        screenshot_data: Screenshot reference from scripts/screenshot_store.py (optional)
+        lookups: Prefetched DB lookups for these IDs (optional)
+
+    Returns:
+        One confirmation line per resolved ID
+
+    Raises:
+        NeedInput when the workflow needs details the message did not
+        contain; re-run it with the user's answer merged into all_ids
+    """
+    first = {key: (values[0] if values else None) for key, values in all_ids.items()}
+    key = BULK_KEYS.get(scenario)
+    if not key or len(all_ids.get(key) or []) <= 1:
+        return resolve_issue(scenario, first, user_email, screenshot_data, lookups=lookups)
+
+    # One ID after the other, each run could wait up to 10 minutes on SAP.
+    # In parallel their trigger requests land in the same SAP batch and the
+    # waits overlap. Each run gets its own copy of the caller's context
+    # (session, usage attribution, deadline).
+    values = all_ids[key]
+    with ThreadPoolExecutor(max_workers=min(BULK_RESOLVE_WORKERS, len(values)), thread_name_prefix="bulk-resolve") as pool:
+        futures = [
+            pool.submit(contextvars.copy_context().run, resolve_issue, scenario, dict(first, **{key: value}),
+                        user_email, screenshot_data, lookups=lookups)
+            for value in values
+        ]
+        # In ID order, so the first NeedInput is the one raised
+        confirmations = [future.result() for future in futures]
+    return "\n".join(confirmations)
+
@@ -0,0 +1,280 @@
+# scripts/sap_batcher.py
+# Collects SAP trigger requests and sends one consolidated mail per batch,
+# with a machine-readable item list attached and a correlation ID per item
+# so SAP replies can be mapped back to the request that asked for them.
+import csv
+import io
+import os
+import re
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+
+from scripts.email_handler import SAP_EMAIL, send_email_with_attachment
+
+# ---------- CONFIGURATION ----------
+SAP_BATCH_WINDOW_SECONDS = float(os.getenv("SAP_BATCH_WINDOW_SECONDS", "30"))
+SAP_BATCH_MAX_ITEMS = int(os.getenv("SAP_BATCH_MAX_ITEMS", "50"))
+SAP_BATCH_FORMAT = os.getenv("SAP_BATCH_FORMAT", "csv")  # "csv" or "xlsx"
+SAP_BATCH_SEND_RETRIES = int(os.getenv("SAP_BATCH_SEND_RETRIES", "3"))  # resends of a batch whose mail failed
+SAP_BATCH_RETRY_SECONDS = float(os.getenv("SAP_BATCH_RETRY_SECONDS", "30"))  # first resend delay, doubled each time
+SAP_REQUESTS_DB_PATH = os.getenv(
+    "SAP_REQUESTS_DB_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "database", "sap_requests.db"),
+)
+
+ITEM_COLUMNS = ["correlation_id", "kind", "po_id", "asn_id", "pallet_id", "requested_by", "requested_at"]
+ID_FIELDS = ("po_id", "asn_id", "pallet_id")
+
+# One reply line per item, e.g. "B1A2-003 01506 triggered" or "2368319298: not triggered"
+CORRELATION_PATTERN = re.compile(r"\b([0-9A-F]{8}-\d{3})\b", re.IGNORECASE)
+STATUS_PATTERN = re.compile(r"\b(not\s+triggered|triggered)\b", re.IGNORECASE)
+
+
+# ----------------------------
+# Correlation store
+# ----------------------------
+def _connect():
+    os.makedirs(os.path.dirname(os.path.abspath(SAP_REQUESTS_DB_PATH)), exist_ok=True)
+    conn = sqlite3.connect(SAP_REQUESTS_DB_PATH, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sap_requests (
+            correlation_id TEXT PRIMARY KEY,
+            batch_id TEXT,
+            kind TEXT,
+            po_id TEXT,
+            asn_id TEXT,
+            pallet_id TEXT,
+            requested_by TEXT,
+            requested_at TEXT,
+            sent_at TEXT,
+            status TEXT DEFAULT 'pending',
+            replied_at TEXT
+        )
+    """)
+    return conn
+
+
+def record_reply(body: str) -> int:
+    """
+    Store the per-item statuses found in an SAP reply body.
+
+    Each line is matched to a request by correlation ID, or failing that by
+    any PO/ASN/pallet ID of a pending request. Returns the number of
+    requests updated. Waiters read statuses from here, so a reply consumed
+    from the inbox by one waiter still reaches every request in its batch.
+    """
+    from scripts.extractor import extract_all_ids
+
+    updated = 0
+    now = datetime.now().isoformat()
+    with _connect() as conn:
+        for line in body.splitlines():
+            status_match = STATUS_PATTERN.search(line)
+            if not status_match:
+                continue
+            status = "not_triggered" if status_match.group(1).lower().startswith("not") else "triggered"
+            correlation = CORRELATION_PATTERN.search(line)
+            if correlation:
+                updated += conn.execute(
+                    "UPDATE sap_requests SET status = ?, replied_at = ? WHERE correlation_id = ?",
+                    (status, now, correlation.group(1).upper()),
+                ).rowcount
+                continue
+            ids = extract_all_ids(line)
+            for field in ID_FIELDS:
+                for value in ids[field]:
+                    updated += conn.execute(
+                        f"UPDATE sap_requests SET status = ?, replied_at = ? WHERE {field} = ? AND status = 'pending'",
+                        (status, now, value),
+                    ).rowcount
+    return updated
+
+
+def get_request_status(correlation_id: str):
+    """Status of one request ('triggered' / 'not_triggered' / 'failed'), or None while it is pending."""
+    with _connect() as conn:
+        row = conn.execute(
+            "SELECT status FROM sap_requests WHERE correlation_id = ? AND status != 'pending'", (correlation_id,)
+        ).fetchone()
+    return row["status"] if row else None
+
+
+def get_batch_ids(correlation_id: str) -> list:
+    """Every PO / ASN / pallet ID requested in the batch of this request (SAP may insert rows for any of them)."""
+    with _connect() as conn:
+        rows = conn.execute(
+            "SELECT po_id, asn_id, pallet_id FROM sap_requests "
+            "WHERE batch_id = (SELECT batch_id FROM sap_requests WHERE correlation_id = ?)",
+            (correlation_id,),
+        ).fetchall()
+    return sorted({value for row in rows for value in row if value})
+
+
+def get_reply_status(keyword: str, since: str = ""):
+    """Latest status ('triggered' / 'not_triggered') replied after `since` for a request with this ID, or None."""
+    with _connect() as conn:
+        row = conn.execute(
+            "SELECT status FROM sap_requests WHERE status IN ('triggered', 'not_triggered') AND replied_at >= ? "
+            "AND (po_id = ? OR asn_id = ? OR pallet_id = ? OR correlation_id = ?) "
+            "ORDER BY replied_at DESC LIMIT 1",
+            (since, keyword, keyword, keyword, keyword),
+        ).fetchone()
+    return row["status"] if row else None
+
+
+# ----------------------------
+# Attachment (written row by row)
+# ----------------------------
+def _build_attachment(items: list):
+    if SAP_BATCH_FORMAT == "xlsx":
+        try:
+            from openpyxl import Workbook
+        except ImportError:
+            print("⚠️ openpyxl not installed, sending SAP batch as CSV")
+        else:
+            # write_only streams rows to the file instead of building the sheet in memory
+            workbook = Workbook(write_only=True)
+            sheet = workbook.create_sheet("requests")
+            sheet.append(ITEM_COLUMNS)
+            for item in items:
+                sheet.append([item.get(col) or "" for col in ITEM_COLUMNS])
+            buffer = io.BytesIO()
+            workbook.save(buffer)
+            return "sap_requests.xlsx", buffer.getvalue(), "vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(ITEM_COLUMNS)
+    for item in items:
+        writer.writerow([item.get(col) or "" for col in ITEM_COLUMNS])
+    return "sap_requests.csv", buffer.getvalue().encode("utf-8"), "csv"
+
+
+def _build_body(batch_id: str, items: list) -> str:
+    lines = [
+        "Hi SAP Team,",
+        "",
+        f"Could you please trigger the following {len(items)} item(s) in the system (batch {batch_id}).",
+        "The attached file lists the same items. Please reply with one line per item,",
+        "e.g. '<correlation id> triggered' or '<correlation id> not triggered'.",
+        "",
+    ]
+    for item in items:
+        ids = ", ".join(f"{field.split('_')[0].upper()} {item[field]}" for field in ID_FIELDS if item.get(field))
+        lines.append(f"{item['correlation_id']}  {item['kind'].upper()}  {ids}")
+    lines += ["", "Thank you."]
+    return "\n".join(lines)
+
+
+# ----------------------------
+# Batcher
+# ----------------------------
+class SapBatcher:
+    """
+    Buffers trigger requests and flushes them as one SAP mail when the
+    window expires or SAP_BATCH_MAX_ITEMS items are waiting.
+    """
+
+    def __init__(self, window_seconds=SAP_BATCH_WINDOW_SECONDS, max_items=SAP_BATCH_MAX_ITEMS):
+        self.window_seconds = window_seconds
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        self._items = []
+        self._batch_id = None
+        self._timer = None
+
+    def submit(self, kind: str, ids: dict, requested_by: str = None) -> str:
+        """Queue one trigger request; returns its correlation ID."""
+        with self._lock:
+            if self._batch_id is None:
+                self._batch_id = uuid.uuid4().hex[:8].upper()
+            item = {
+                "correlation_id": f"{self._batch_id}-{len(self._items) + 1:03d}",
+                "batch_id": self._batch_id,
+                "kind": kind,
+                "requested_by": requested_by,
+                "requested_at": datetime.now().isoformat(),
+            }
+            item.update({field: ids.get(field) for field in ID_FIELDS})
+            self._items.append(item)
+            with _connect() as conn:
+                conn.execute(
+                    "INSERT INTO sap_requests (correlation_id, batch_id, kind, po_id, asn_id, pallet_id, requested_by, requested_at) "
+                    "VALUES (:correlation_id, :batch_id, :kind, :po_id, :asn_id, :pallet_id, :requested_by, :requested_at)",
+                    item,
+                )
+            flush_now = len(self._items) >= self.max_items or self.window_seconds <= 0
+            if not flush_now and self._timer is None:
+                self._timer = threading.Timer(self.window_seconds, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if flush_now:
+            self.flush()
+        return item["correlation_id"]
+
+    def flush(self):
+        """Send everything queued so far as one mail."""
+        with self._lock:
+            items, batch_id = self._items, self._batch_id
+            self._items, self._batch_id = [], None
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not items:
+            return None
+        return self._send(batch_id, items)
+
+    def _send(self, batch_id: str, items: list, attempt: int = 0):
+        """
+        Mail one batch. A failed send is retried with exponential backoff;
+        after SAP_BATCH_SEND_RETRIES its requests are marked 'failed', so
+        their waiters stop polling for a reply to a mail never sent.
+        """
+        filename, data, subtype = _build_attachment(items)
+        try:
+            send_email_with_attachment(
+                SAP_EMAIL,
+                f"Trigger Request Batch {batch_id} ({len(items)} items)",
+                _build_body(batch_id, items),
+                filename, data, subtype,
+            )
+        except Exception as e:
+            if attempt < SAP_BATCH_SEND_RETRIES:
+                delay = SAP_BATCH_RETRY_SECONDS * 2 ** attempt
+                print(f"⚠️ Failed to send SAP batch {batch_id}: {e}; retry {attempt + 1}/{SAP_BATCH_SEND_RETRIES} in {delay:.0f}s")
+                timer = threading.Timer(delay, self._send, (batch_id, items, attempt + 1))
+                timer.daemon = True
+                timer.start()
+                return None
+            print(f"❌ Failed to send SAP batch {batch_id} after {attempt + 1} attempts: {e}")
+            with _connect() as conn:
+                conn.execute(
+                    "UPDATE sap_requests SET status = 'failed', replied_at = ? WHERE batch_id = ? AND status = 'pending'",
+                    (datetime.now().isoformat(), batch_id),
+                )
+            return None
+        with _connect() as conn:
+            conn.execute(
+                "UPDATE sap_requests SET sent_at = ? WHERE batch_id = ?",
+                (datetime.now().isoformat(), batch_id),
+            )
+        print(f"📧 SAP batch {batch_id} sent with {len(items)} items")
+        return batch_id
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+def get_sap_batcher() -> SapBatcher:
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = SapBatcher()
+        return _batcher
+
+def request_sap_trigger(kind: str, ids: dict, requested_by: str = None) -> str:
+    """Queue a trigger request for the next SAP batch; returns its correlation ID."""
+    return get_sap_batcher().submit(kind, ids, requested_by)
@@ -0,0 +1,217 @@
+# scripts/screenshot_store.py
+# Content-addressed screenshot storage. An upload is streamed to disk,
+# downscaled and recompressed once, and stored under the SHA-256 of the
+# result; workflows pass the short reference around and every email
+# attaches the stored bytes as they are.
+import base64
+import hashlib
+import io
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+
+# ---------- CONFIGURATION ----------
+SCREENSHOT_DIR = os.getenv(
+    "SCREENSHOT_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "database", "screenshots"),
+)
+SCREENSHOT_MAX_UPLOAD_BYTES = int(os.getenv("SCREENSHOT_MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+SCREENSHOT_MAX_DIMENSION = int(os.getenv("SCREENSHOT_MAX_DIMENSION", "1600"))  # longest side, pixels
+SCREENSHOT_JPEG_QUALITY = int(os.getenv("SCREENSHOT_JPEG_QUALITY", "80"))
+SCREENSHOT_CACHE_ITEMS = int(os.getenv("SCREENSHOT_CACHE_ITEMS", "32"))  # stored images kept in memory
+
+CHUNK_SIZE = 64 * 1024
+REF_PATTERN = re.compile(r"^[0-9a-f]{64}\.(png|jpg|gif|webp)$")
+MAGIC = (
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpg"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+)
+SUBTYPES = {"png": "png", "jpg": "jpeg", "gif": "gif", "webp": "webp"}
+
+
+class ScreenshotTooLarge(ValueError):
+    """Raised while streaming an upload past SCREENSHOT_MAX_UPLOAD_BYTES."""
+
+
+def _sniff(head: bytes):
+    for magic, ext in MAGIC:
+        if head.startswith(magic):
+            return ext
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def is_screenshot_ref(value) -> bool:
+    return isinstance(value, str) and REF_PATTERN.match(value) is not None
+
+
+def _path(ref: str) -> str:
+    return os.path.join(SCREENSHOT_DIR, ref[:2], ref)
+
+
+def _alias_path(upload_digest: str) -> str:
+    # Raw upload hash -> stored ref, so a re-sent screenshot skips recompression
+    return os.path.join(SCREENSHOT_DIR, "uploads", upload_digest)
+
+
+# ----------------------------
+# Upload
+# ----------------------------
+def _spool(stream, max_bytes: int):
+    """Copy a stream to a temp file in chunks; returns (file, sha256 hex, size)."""
+    os.makedirs(SCREENSHOT_DIR, exist_ok=True)
+    spool = tempfile.TemporaryFile(dir=SCREENSHOT_DIR)
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_bytes:
+            spool.close()
+            raise ScreenshotTooLarge(f"Screenshot is larger than {max_bytes} bytes")
+        digest.update(chunk)
+        spool.write(chunk)
+    spool.seek(0)
+    return spool, digest.hexdigest(), size
+
+
+def _recompress(spool, ext: str):
+    """
+    Downscale to SCREENSHOT_MAX_DIMENSION and re-encode (JPEG, or PNG when
+    the image has transparency). Returns (bytes, ext), or None to keep the
+    upload as it is (Pillow missing, animated GIF, or no size gain).
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        print("⚠️ Pillow not installed, storing screenshots without recompression")
+        return None
+
+    image = Image.open(spool)
+    if getattr(image, "is_animated", False):
+        return None
+    image.load()
+    resized = max(image.size) > SCREENSHOT_MAX_DIMENSION
+    if resized:
+        image.thumbnail((SCREENSHOT_MAX_DIMENSION, SCREENSHOT_MAX_DIMENSION))
+
+    out = io.BytesIO()
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image.save(out, format="PNG", optimize=True)
+        new_ext = "png"
+    else:
+        image.convert("RGB").save(out, format="JPEG", quality=SCREENSHOT_JPEG_QUALITY, optimize=True, progressive=True)
+        new_ext = "jpg"
+
+    spool.seek(0, os.SEEK_END)
+    if not resized and out.tell() >= spool.tell():
+        return None
+    return out.getvalue(), new_ext
+
+
+def _write_atomic(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def store_screenshot(stream, max_bytes: int = SCREENSHOT_MAX_UPLOAD_BYTES) -> dict:
+    """
+    Stream an uploaded image to disk, recompress it once and store it by content hash.
+
+    Args:
+        stream: File-like object with read(n), e.g. a multipart file or the request body
+        max_bytes: Upload size limit
+
+    Returns:
+        Dict with ref (pass this through workflows), bytes (stored size)
+        and uploaded_bytes
+
+    Raises:
+        ScreenshotTooLarge past max_bytes, ValueError when the upload is not
+        a PNG, JPEG, GIF or WebP image
+    """
+    spool, upload_digest, uploaded = _spool(stream, max_bytes)
+    with spool:
+        alias = _alias_path(upload_digest)
+        if os.path.exists(alias):
+            with open(alias, encoding="ascii") as f:
+                ref = f.read().strip()
+            if is_screenshot_ref(ref) and os.path.exists(_path(ref)):
+                return {"ref": ref, "bytes": os.path.getsize(_path(ref)), "uploaded_bytes": uploaded}
+
+        ext = _sniff(spool.read(16))
+        if ext is None:
+            raise ValueError("Screenshot must be a PNG, JPEG, GIF or WebP image")
+        spool.seek(0)
+        try:
+            result = _recompress(spool, ext)
+        except Exception as e:
+            print(f"⚠️ Could not recompress screenshot, storing it unchanged: {e}")
+            result = None
+        if result is None:
+            spool.seek(0)
+            data = spool.read()
+        else:
+            data, ext = result
+
+    ref = f"{hashlib.sha256(data).hexdigest()}.{ext}"
+    path = _path(ref)
+    if not os.path.exists(path):
+        _write_atomic(path, data)
+    _write_atomic(alias, ref.encode("ascii"))
+    print(f"🖼️ Stored screenshot {ref[:12]} ({uploaded} -> {len(data)} bytes)")
+    return {"ref": ref, "bytes": len(data), "uploaded_bytes": uploaded}
+
+
+# ----------------------------
+# Read
+# ----------------------------
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def load_screenshot(ref: str) -> bytes:
+    """Stored bytes for a reference (kept in a small LRU, since one ticket mails them several times)."""
+    if not is_screenshot_ref(ref):
+        raise ValueError(f"Invalid screenshot reference: {ref!r}")
+    with _cache_lock:
+        if ref in _cache:
+            _cache.move_to_end(ref)
+            return _cache[ref]
+    with open(_path(ref), "rb") as f:
+        data = f.read()
+    with _cache_lock:
+        _cache[ref] = data
+        while len(_cache) > SCREENSHOT_CACHE_ITEMS:
+            _cache.popitem(last=False)
+    return data
+
+
+def screenshot_exists(ref: str) -> bool:
+    return is_screenshot_ref(ref) and os.path.exists(_path(ref))
+
+
+def screenshot_attachment(screenshot):
+    """
+    (bytes, MIME subtype, filename) to attach for a screenshot reference.
+
+    Base64 strings and data URLs from older callers are still accepted and
+    decoded here.
+    """
+    if is_screenshot_ref(screenshot):
+        ext = screenshot.rsplit(".", 1)[1]
+        return load_screenshot(screenshot), SUBTYPES[ext], f"screenshot.{ext}"
+    if screenshot.startswith("data:image/"):
+        screenshot = screenshot.split(",", 1)[1]
+    data = base64.b64decode(screenshot)
+    ext = _sniff(data[:16]) or "png"
+    return data, SUBTYPES[ext], f"screenshot.{ext}"
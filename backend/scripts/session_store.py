@@ -0,0 +1,194 @@
+# scripts/session_store.py
+import contextlib
+import contextvars
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+# ---------- CONFIGURATION ----------
+SESSION_STORE = os.getenv("SESSION_STORE", "sqlite")  # "sqlite" or "memory"
+SESSION_DB_PATH = os.getenv(
+    "SESSION_DB_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "database", "sessions.db"),
+)
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", str(24 * 3600)))
+
+
+# Session for work that runs outside a Flask request (e.g. the inbox pipeline)
+_headless_session = contextvars.ContextVar("headless_session", default=None)
+
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+
+def headless_session_id() -> str:
+    """Session ID for the current thread/task when there is no web request."""
+    sid = _headless_session.get()
+    if sid is None:
+        sid = new_session_id()
+        _headless_session.set(sid)
+    return sid
+
+
+@contextlib.contextmanager
+def session_scope(session_id: str = None):
+    """Run a block of headless work under its own session."""
+    token = _headless_session.set(session_id or new_session_id())
+    try:
+        yield _headless_session.get()
+    finally:
+        _headless_session.reset(token)
+
+
+def empty_state() -> dict:
+    """Per-user state that used to live in module globals of app.py and resolver.py."""
+    # pending_input: a resolver workflow paused for details (see app.park_workflow)
+    return {"conversation": [], "print_outputs": [], "pending_input": None}
+
+
+# ----------------------------
+# Store interface
+# ----------------------------
+class SessionStore:
+    """Base class: subclasses implement load/save/delete/update keyed by session ID."""
+
+    def load(self, session_id: str) -> dict:
+        raise NotImplementedError
+
+    def save(self, session_id: str, state: dict):
+        raise NotImplementedError
+
+    def delete(self, session_id: str):
+        raise NotImplementedError
+
+    def update(self, session_id: str, fn) -> dict:
+        """Apply fn(state) atomically and persist the result."""
+        raise NotImplementedError
+
+
+# ----------------------------
+# In-process store (single worker / dev only)
+# ----------------------------
+class MemorySessionStore(SessionStore):
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def load(self, session_id):
+        with self._lock:
+            return json.loads(json.dumps(self._data.get(session_id) or empty_state()))
+
+    def save(self, session_id, state):
+        with self._lock:
+            self._data[session_id] = json.loads(json.dumps(state))
+
+    def delete(self, session_id):
+        with self._lock:
+            self._data.pop(session_id, None)
+
+    def update(self, session_id, fn):
+        with self._lock:
+            state = self._data.get(session_id) or empty_state()
+            fn(state)
+            self._data[session_id] = state
+            return json.loads(json.dumps(state))
+
+
+# ----------------------------
+# SQLite store (default, shared across worker processes)
+# ----------------------------
+class SQLiteSessionStore(SessionStore):
+    def __init__(self, db_path=SESSION_DB_PATH, ttl_seconds=SESSION_TTL_SECONDS):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.commit()
+
+    def _connect(self):
+        # One connection per thread; sqlite3 connections are not thread safe.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _read(self, conn, session_id):
+        row = conn.execute(
+            "SELECT data, updated_at FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if not row or time.time() - row[1] > self.ttl_seconds:
+            return empty_state()
+        return json.loads(row[0])
+
+    def _write(self, conn, session_id, state):
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (session_id, data, updated_at) VALUES (?, ?, ?)",
+            (session_id, json.dumps(state), time.time()),
+        )
+
+    def load(self, session_id):
+        return self._read(self._connect(), session_id)
+
+    def save(self, session_id, state):
+        conn = self._connect()
+        self._write(conn, session_id, state)
+
+    def delete(self, session_id):
+        self._connect().execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def update(self, session_id, fn):
+        conn = self._connect()
+        # BEGIN IMMEDIATE takes the write lock up front so two workers
+        # appending to the same session cannot lose each other's turns.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            state = self._read(conn, session_id)
+            fn(state)
+            self._write(conn, session_id, state)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return state
+
+    def purge_expired(self):
+        cutoff = time.time() - self.ttl_seconds
+        self._connect().execute("DELETE FROM sessions WHERE updated_at < ?", (cutoff,))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_session_store() -> SessionStore:
+    """Return the process-wide store selected by SESSION_STORE."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            if SESSION_STORE == "memory":
+                _store = MemorySessionStore()
+            elif SESSION_STORE == "sqlite":
+                _store = SQLiteSessionStore()
+            else:
+                raise ValueError(f"Unknown SESSION_STORE: {SESSION_STORE}")
+        return _store
+
+def set_session_store(store: SessionStore):
+    """Plug in a custom store (e.g. Redis-backed) before the app takes traffic."""
+    global _store
+    with _store_lock:
+        _store = store
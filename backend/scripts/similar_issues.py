@@ -0,0 +1,377 @@
+# scripts/similar_issues.py
+# Local retrieval index over resolved tickets. Every finished workflow is
+# stored with its outcome and a fingerprint of the warehouse rows it looked
+# at. Before a workflow runs, an identical ticket (same scenario and IDs)
+# resolved recently against unchanged rows returns its outcome at once;
+# SAP escalation mails list the most similar past cases.
+#
+# Cases are hashed n-gram vectors (scenario, IDs and their digit trigrams,
+# supplier references) weighted by TF-IDF and compared by cosine
+# similarity in NumPy. Nothing leaves the process.
+import contextlib
+import contextvars
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime
+
+from scripts.metrics import Counter
+
+# ---------- CONFIGURATION ----------
+SIMILAR_ISSUES_DB_PATH = os.getenv(
+    "SIMILAR_ISSUES_DB_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "database", "resolved_issues.db"),
+)
+SIMILAR_ISSUE_REUSE_SECONDS = float(os.getenv("SIMILAR_ISSUE_REUSE_SECONDS", "900"))  # 0 never reuses outcomes
+SIMILAR_ISSUE_TOP_K = int(os.getenv("SIMILAR_ISSUE_TOP_K", "3"))  # past cases listed in SAP escalations
+SIMILAR_ISSUE_MIN_SCORE = float(os.getenv("SIMILAR_ISSUE_MIN_SCORE", "0.3"))
+SIMILAR_ISSUE_MAX_CASES = int(os.getenv("SIMILAR_ISSUE_MAX_CASES", "5000"))  # most recent cases kept in memory
+SIMILAR_ISSUE_DIMENSIONS = int(os.getenv("SIMILAR_ISSUE_DIMENSIONS", "1024"))
+
+ID_FIELDS = ("po_id", "asn_id", "pallet_id")
+# Mails to the reporter (contexts in scripts/resolver.py) that close a
+# ticket. Only these outcomes are reused: a timeout or "not triggered"
+# leaves the rows unchanged, and replaying it would never contact SAP again.
+REUSABLE_OUTCOMES = (
+    "ASN Found", "ASN Triggered", "PO Found", "PO Triggered", "Pallet Found", "Pallet Resolved", "Mismatch Resolved",
+)
+SCENARIOS = ("missing_asn", "missing_po", "missing_pallet", "quantity_mismatch")
+
+CASE_COLUMNS = "id, case_key, scenario, ids, suppliers, outcome, fingerprint, resolved_at, outcome_kind, mail"
+
+SIMILAR_ISSUE_LOOKUPS = Counter(
+    "similar_issue_lookups", "Resolver runs checked against past resolutions.", ("result",)
+)
+
+
+# ----------------------------
+# Case features
+# ----------------------------
+def _ids(params: dict) -> dict:
+    return {field: str(params[field]).strip() for field in ID_FIELDS if params.get(field)}
+
+
+def case_key(scenario: str, params: dict):
+    """(scenario, IDs) identifying equivalent tickets, or None when there is nothing to match on."""
+    ids = _ids(params)
+    if scenario not in SCENARIOS or not ids:
+        return None
+    return json.dumps([scenario, sorted(ids.items())])
+
+
+def case_features(scenario: str, params: dict, suppliers=()) -> dict:
+    """
+    Feature -> count for one ticket: the scenario, each ID, each ID's digit
+    trigrams (so mistyped IDs still land near the real one) and the supplier
+    references of the ASNs involved.
+    """
+    features = {f"scenario={scenario}": 1}
+    for field, value in _ids(params).items():
+        features[f"{field}={value}"] = 1
+        for i in range(len(value) - 2):
+            gram = f"{field}~{value[i:i + 3]}"
+            features[gram] = features.get(gram, 0) + 1
+    for supplier in suppliers:
+        features[f"supplier={str(supplier).lower()}"] = 1
+    return features
+
+
+def _bucket(feature: str) -> int:
+    # crc32 rather than hash(): stable across processes and restarts
+    return zlib.crc32(feature.encode("utf-8")) % SIMILAR_ISSUE_DIMENSIONS
+
+
+# ----------------------------
+# Warehouse state fingerprint
+# ----------------------------
+def warehouse_state(params: dict):
+    """
+    (fingerprint, supplier references) of the warehouse rows for these IDs.
+
+    The fingerprint hashes row count, newest last_updated and total quantity
+    per table and ID, so any insert, update or trigger for them changes it.
+    Returns (None, []) when the warehouse DB cannot be read.
+    """
+    from scripts import db
+    from scripts.utils import TABLE_COLUMNS
+
+    ids = _ids(params)
+    digest = hashlib.sha256()
+    suppliers = set()
+    try:
+        with contextlib.closing(db.connect_db()) as conn:
+            for field, value in sorted(ids.items()):
+                for table, columns in TABLE_COLUMNS.items():
+                    if field not in columns:
+                        continue
+                    quantity = "TOTAL(quantity)" if "quantity" in columns else "0"
+                    row = conn.execute(
+                        f"SELECT COUNT(*), MAX(last_updated), {quantity} FROM {table} WHERE {field} = ?", (value,)
+                    ).fetchone()
+                    digest.update(repr((table, field, value, tuple(row))).encode("utf-8"))
+                    if "supplier_reference" in columns:
+                        suppliers.update(
+                            r[0] for r in conn.execute(
+                                f"SELECT DISTINCT supplier_reference FROM {table} WHERE {field} = ? LIMIT 5", (value,)
+                            ) if r[0]
+                        )
+    except sqlite3.Error as e:
+        print(f"⚠️ Could not fingerprint warehouse rows for {ids}: {e}")
+        return None, []
+    return digest.hexdigest(), sorted(suppliers)
+
+
+# ----------------------------
+# Index
+# ----------------------------
+class IssueIndex:
+    """
+    Resolved tickets in SQLite, with the most recent SIMILAR_ISSUE_MAX_CASES
+    held in memory as a term-frequency matrix for similarity search.
+    """
+
+    def __init__(self, db_path=SIMILAR_ISSUES_DB_PATH, max_cases=SIMILAR_ISSUE_MAX_CASES):
+        self.db_path = db_path
+        self.max_cases = max_cases
+        self._lock = threading.Lock()
+        self._cases = []  # case dicts, row i of the matrix
+        self._tf = None  # float32 [capacity, dimensions]
+        self._df = None  # documents per feature bucket
+        self._weighted = None  # TF-IDF rows, L2-normalised; rebuilt after appends
+        self._last_id = 0  # newest resolved_issues row in the matrix
+        self._migrated = False
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS resolved_issues (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                case_key TEXT,
+                scenario TEXT,
+                ids TEXT,
+                suppliers TEXT,
+                outcome TEXT,
+                fingerprint TEXT,
+                resolved_at REAL,
+                outcome_kind TEXT,
+                mail TEXT
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_resolved_issues_key ON resolved_issues (case_key, resolved_at)")
+        if not self._migrated:
+            # Tables created before outcome_kind / mail existed
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(resolved_issues)")}
+            for column in ("outcome_kind", "mail"):
+                if column not in columns:
+                    try:
+                        conn.execute(f"ALTER TABLE resolved_issues ADD COLUMN {column} TEXT")
+                    except sqlite3.OperationalError:  # added by another worker meanwhile
+                        pass
+            self._migrated = True
+        return conn
+
+    def _sync(self):
+        # Called with self._lock held: append cases recorded since the last
+        # sync, by this or any other worker. NumPy is imported on first use.
+        import numpy as np
+
+        if self._tf is None:
+            self._tf = np.zeros((64, SIMILAR_ISSUE_DIMENSIONS), dtype=np.float32)
+            self._df = np.zeros(SIMILAR_ISSUE_DIMENSIONS, dtype=np.float32)
+        with contextlib.closing(self._connect()) as conn:
+            rows = conn.execute(
+                f"SELECT {CASE_COLUMNS} FROM resolved_issues WHERE id > ? ORDER BY id DESC LIMIT ?", (self._last_id, self.max_cases)
+            ).fetchall()
+        for row in reversed(rows):
+            self._append(self._case(row))
+            self._last_id = row[0]
+
+    @staticmethod
+    def _case(row) -> dict:
+        _, key, scenario, ids, suppliers, outcome, fingerprint, resolved_at, outcome_kind, mail = row
+        return {"key": key, "scenario": scenario, "ids": json.loads(ids), "suppliers": json.loads(suppliers),
+                "outcome": outcome, "fingerprint": fingerprint, "resolved_at": resolved_at,
+                "outcome_kind": outcome_kind, "mail": json.loads(mail) if mail else None}
+
+    def _append(self, case: dict):
+        import numpy as np
+
+        n = len(self._cases)
+        if n >= self.max_cases:
+            # Drop the oldest half in one go rather than shifting the matrix per case
+            keep = self.max_cases // 2
+            self._cases = self._cases[n - keep:]
+            self._tf = self._tf[n - keep:n].copy()
+            self._df = (self._tf > 0).sum(axis=0).astype(np.float32)
+            n = keep
+        if n == len(self._tf):
+            self._tf = np.concatenate([self._tf, np.zeros_like(self._tf)])
+        row = self._tf[n]
+        for feature, count in case_features(case["scenario"], case["ids"], case["suppliers"]).items():
+            row[_bucket(feature)] += count
+        np.log1p(row, out=row)  # sublinear term frequency
+        self._df += row > 0
+        self._cases.append(case)
+        self._weighted = None
+
+    def record(self, scenario: str, params: dict, outcome: str, fingerprint=None, suppliers=(), mail=None) -> dict:
+        """
+        Store a finished resolution; returns the stored case.
+
+        mail is the last mail sent to the reporter, (subject, context,
+        details, html_format); its context is the outcome kind.
+        """
+        case = {
+            "key": case_key(scenario, params), "scenario": scenario, "ids": _ids(params),
+            "suppliers": list(suppliers), "outcome": outcome, "fingerprint": fingerprint,
+            "resolved_at": time.time(), "outcome_kind": mail[1] if mail else None,
+            "mail": list(mail) if mail else None,
+        }
+        with contextlib.closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT INTO resolved_issues (case_key, scenario, ids, suppliers, outcome, fingerprint, resolved_at, "
+                "outcome_kind, mail) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (case["key"], scenario, json.dumps(case["ids"]), json.dumps(case["suppliers"]),
+                 outcome, fingerprint, case["resolved_at"], case["outcome_kind"],
+                 json.dumps(case["mail"], default=str) if mail else None),
+            )
+        return case
+
+    def latest(self, scenario: str, params: dict, max_age: float = SIMILAR_ISSUE_REUSE_SECONDS):
+        """
+        Newest closing resolution (outcome kind in REUSABLE_OUTCOMES) of an
+        equivalent ticket within max_age seconds, from any worker, or None.
+        """
+        key = case_key(scenario, params)
+        if key is None or max_age <= 0:
+            return None
+        with contextlib.closing(self._connect()) as conn:
+            row = conn.execute(
+                f"SELECT {CASE_COLUMNS} FROM resolved_issues "
+                f"WHERE case_key = ? AND resolved_at >= ? AND outcome_kind IN ({', '.join('?' * len(REUSABLE_OUTCOMES))}) "
+                "ORDER BY resolved_at DESC LIMIT 1",
+                (key, time.time() - max_age, *REUSABLE_OUTCOMES),
+            ).fetchone()
+        return self._case(row) if row else None
+
+    def similar(self, scenario: str, params: dict, suppliers=(), k: int = SIMILAR_ISSUE_TOP_K,
+                min_score: float = SIMILAR_ISSUE_MIN_SCORE) -> list:
+        """
+        Up to k past cases most similar to this ticket, best first.
+
+        Returns:
+            List of (score, case) with score >= min_score
+        """
+        import numpy as np
+
+        with self._lock:
+            self._sync()
+            n = len(self._cases)
+            if n == 0 or k <= 0:
+                return []
+            idf = np.log((n + 1) / (self._df + 1)) + 1
+            if self._weighted is None:
+                weighted = self._tf[:n] * idf
+                norms = np.linalg.norm(weighted, axis=1, keepdims=True)
+                self._weighted = weighted / np.maximum(norms, 1e-12)
+            matrix, cases = self._weighted, list(self._cases)
+
+        query = np.zeros(SIMILAR_ISSUE_DIMENSIONS, dtype=np.float32)
+        for feature, count in case_features(scenario, params, suppliers).items():
+            query[_bucket(feature)] += count
+        query = np.log1p(query) * idf
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        scores = matrix @ (query / norm)
+        top = np.argsort(-scores)[:k]
+        return [(float(scores[i]), cases[i]) for i in top if scores[i] >= min_score]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_issue_index() -> IssueIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = IssueIndex()
+        return _index
+
+
+# ----------------------------
+# Resolver hooks
+# ----------------------------
+_current_case = contextvars.ContextVar("similar_issue_case", default=None)
+
+
+@contextlib.contextmanager
+def case_scope(scenario: str, params: dict):
+    """Mark the ticket the current workflow is resolving, for similar_cases_note()."""
+    token = _current_case.set((scenario, dict(params)))
+    try:
+        yield
+    finally:
+        _current_case.reset(token)
+
+
+def reusable_outcome(scenario: str, params: dict):
+    """
+    Case of an equivalent ticket closed within SIMILAR_ISSUE_REUSE_SECONDS
+    whose warehouse rows have not changed since, or None.
+    """
+    case = get_issue_index().latest(scenario, params)
+    if case is None:
+        SIMILAR_ISSUE_LOOKUPS.inc(result="miss")
+        return None
+    fingerprint, _ = warehouse_state(params)
+    if fingerprint is None or fingerprint != case["fingerprint"]:
+        SIMILAR_ISSUE_LOOKUPS.inc(result="stale")
+        return None
+    SIMILAR_ISSUE_LOOKUPS.inc(result="reused")
+    return case
+
+
+def record_resolution(scenario: str, params: dict, outcome: str, mail=None):
+    """
+    Store a finished workflow with the state of its warehouse rows after the
+    run. Every outcome is kept for the similar-case list; only those whose
+    reporter mail is in REUSABLE_OUTCOMES are reused.
+    """
+    if case_key(scenario, params) is None:
+        return None
+    fingerprint, suppliers = warehouse_state(params)
+    try:
+        return get_issue_index().record(scenario, params, outcome, fingerprint, suppliers, mail)
+    except sqlite3.Error as e:
+        print(f"⚠️ Could not record resolution: {e}")
+        return None
+
+
+def similar_cases_note(k: int = SIMILAR_ISSUE_TOP_K) -> str:
+    """Plain-text list of past cases similar to the current ticket ("" outside a case_scope or with none)."""
+    current = _current_case.get()
+    if current is None or k <= 0:
+        return ""
+    scenario, params = current
+    try:
+        _, suppliers = warehouse_state(params)
+        matches = get_issue_index().similar(scenario, params, suppliers, k)
+    except Exception as e:
+        print(f"⚠️ Similar-case lookup failed: {e}")
+        return ""
+    if not matches:
+        return ""
+    lines = ["Similar past cases:"]
+    for score, case in matches:
+        when = datetime.fromtimestamp(case["resolved_at"]).strftime("%Y-%m-%d %H:%M")
+        ids = ", ".join(f"{field.split('_')[0].upper()} {value}" for field, value in case["ids"].items())
+        supplier = f" (supplier {', '.join(case['suppliers'])})" if case["suppliers"] else ""
+        lines.append(f"- {when} {case['scenario'].replace('_', ' ')}: {ids}{supplier} -> {case['outcome']} "
+                     f"[similarity {score:.2f}]")
+    return "\n".join(lines)
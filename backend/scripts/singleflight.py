@@ -0,0 +1,59 @@
+# scripts/singleflight.py
+import contextlib
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls with the same key into one execution.
+
+    The first caller for a key (the leader) runs fn; callers arriving while
+    it is still running block and receive the leader's result or exception.
+    Once the leader finishes the key is released, so later calls run fresh.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, wait_scope=contextlib.nullcontext):
+        """Return (result, is_leader); followers block inside wait_scope()."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.followers += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                leader = True
+
+        if not leader:
+            with wait_scope():
+                call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, False
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result, True
+
+    def in_flight(self) -> dict:
+        """Key -> number of attached followers, for diagnostics."""
+        with self._lock:
+            return {key: call.followers for key, call in self._calls.items()}
@@ -0,0 +1,235 @@
+# scripts/usage_tracker.py
+# Token and cost accounting for every LLM call, attributed to the session,
+# user email and scenario it was made for, with optional budgets.
+import contextlib
+import contextvars
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+import requests
+
+from scripts.metrics import Counter
+
+# ---------- CONFIGURATION ----------
+LLM_USAGE_DB_PATH = os.getenv(
+    "LLM_USAGE_DB_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "database", "llm_usage.db"),
+)
+# USD per million tokens (input, output); override with LLM_PRICES='{"model": [in, out]}'
+DEFAULT_PRICES = {
+    "llama3-8b-8192": (0.05, 0.08),
+    "llama3-70b-8192": (0.59, 0.79),
+    "llama-3.1-8b-instant": (0.05, 0.08),
+}
+LLM_PRICES = {**DEFAULT_PRICES, **{k: tuple(v) for k, v in json.loads(os.getenv("LLM_PRICES", "{}")).items()}}
+
+# 0 disables a budget. Over budget, chat replies and emails fall back to templates.
+SESSION_TOKEN_BUDGET = int(os.getenv("LLM_SESSION_TOKEN_BUDGET", "0"))
+SESSION_COST_BUDGET = float(os.getenv("LLM_SESSION_COST_BUDGET", "0"))
+USER_DAILY_COST_BUDGET = float(os.getenv("LLM_USER_DAILY_COST_BUDGET", "0"))
+# Classification is short, stateless and needed to route the issue at all.
+BUDGET_EXEMPT_PURPOSES = {p.strip() for p in os.getenv("LLM_BUDGET_EXEMPT", "classify").split(",") if p.strip()}
+
+GROUP_COLUMNS = ("session_id", "user_email", "scenario", "model", "purpose", "request_id", "day")
+
+LLM_TOKENS = Counter("llm_tokens", "Tokens used by LLM calls.", ("model", "purpose", "type"))
+LLM_COST = Counter("llm_cost_usd", "Estimated LLM spend in USD.", ("model", "purpose"))
+
+
+class BudgetExceeded(requests.exceptions.RequestException):
+    """Raised instead of calling the LLM when a session or user is over budget."""
+
+
+# ----------------------------
+# Attribution context
+# ----------------------------
+# Who the current LLM calls are for. Set per /chat request or per inbox mail.
+_usage_context = contextvars.ContextVar("usage_context", default=None)
+
+
+@contextlib.contextmanager
+def usage_scope(**fields):
+    """Attribute LLM calls in this block to a fresh request (plus session_id, user_email, scenario)."""
+    token = start_usage_context(**fields)
+    try:
+        yield _usage_context.get()
+    finally:
+        _usage_context.reset(token)
+
+
+def start_usage_context(**fields):
+    """Start a fresh attribution context; returns the token for end_usage_context()."""
+    context = {"request_id": uuid.uuid4().hex, "session_id": None, "user_email": None, "scenario": None}
+    context.update(fields)
+    return _usage_context.set(context)
+
+
+def end_usage_context(token):
+    _usage_context.reset(token)
+
+
+def update_usage_context(**fields):
+    """
+    Fill in attribution as it becomes known. Setting the scenario also tags
+    the calls this request already made (e.g. the classification call).
+    """
+    context = _usage_context.get()
+    if context is None:
+        return
+    context.update({k: v for k, v in fields.items() if v is not None})
+    if fields.get("scenario"):
+        get_usage_tracker().tag_scenario(context["request_id"], fields["scenario"])
+
+
+def current_usage_context() -> dict:
+    return dict(_usage_context.get() or {})
+
+
+def cost_for(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    price_in, price_out = LLM_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * price_in + completion_tokens * price_out) / 1_000_000
+
+
+# ----------------------------
+# Store
+# ----------------------------
+class UsageTracker:
+    """One row per LLM call in SQLite; budgets are checked against the same rows."""
+
+    def __init__(self, db_path=LLM_USAGE_DB_PATH):
+        self.db_path = os.path.abspath(db_path)
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_usage (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    timestamp TEXT,
+                    request_id TEXT,
+                    session_id TEXT,
+                    user_email TEXT,
+                    scenario TEXT,
+                    model TEXT,
+                    purpose TEXT,
+                    source TEXT,
+                    prompt_tokens INTEGER,
+                    completion_tokens INTEGER,
+                    total_tokens INTEGER,
+                    cost_usd REAL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_session ON llm_usage (session_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_email ON llm_usage (user_email, timestamp)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_request ON llm_usage (request_id)")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def record(self, model: str, purpose: str, source: str, usage: dict):
+        """Store the `usage` block of one completion under the current context."""
+        usage = usage or {}
+        prompt_tokens = int(usage.get("prompt_tokens") or 0)
+        completion_tokens = int(usage.get("completion_tokens") or 0)
+        total_tokens = int(usage.get("total_tokens") or prompt_tokens + completion_tokens)
+        cost = cost_for(model, prompt_tokens, completion_tokens)
+        context = current_usage_context()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO llm_usage (timestamp, request_id, session_id, user_email, scenario, model, purpose, "
+                "source, prompt_tokens, completion_tokens, total_tokens, cost_usd) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (datetime.now().isoformat(), context.get("request_id"), context.get("session_id"),
+                 context.get("user_email"), context.get("scenario"), model, purpose, source,
+                 prompt_tokens, completion_tokens, total_tokens, cost),
+            )
+        LLM_TOKENS.inc(prompt_tokens, model=model, purpose=purpose, type="prompt")
+        LLM_TOKENS.inc(completion_tokens, model=model, purpose=purpose, type="completion")
+        LLM_COST.inc(cost, model=model, purpose=purpose)
+
+    def tag_scenario(self, request_id: str, scenario: str):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE llm_usage SET scenario = ? WHERE request_id = ? AND scenario IS NULL",
+                (scenario, request_id),
+            )
+
+    def check_budget(self, purpose: str):
+        """Raise BudgetExceeded if the current session or user has used up its budget."""
+        if purpose in BUDGET_EXEMPT_PURPOSES:
+            return
+        if not (SESSION_TOKEN_BUDGET or SESSION_COST_BUDGET or USER_DAILY_COST_BUDGET):
+            return
+        context = current_usage_context()
+        with self._connect() as conn:
+            if context.get("session_id") and (SESSION_TOKEN_BUDGET or SESSION_COST_BUDGET):
+                tokens, cost = conn.execute(
+                    "SELECT COALESCE(SUM(total_tokens), 0), COALESCE(SUM(cost_usd), 0) FROM llm_usage WHERE session_id = ?",
+                    (context["session_id"],),
+                ).fetchone()
+                if SESSION_TOKEN_BUDGET and tokens >= SESSION_TOKEN_BUDGET:
+                    raise BudgetExceeded(f"Session token budget used up ({tokens}/{SESSION_TOKEN_BUDGET})")
+                if SESSION_COST_BUDGET and cost >= SESSION_COST_BUDGET:
+                    raise BudgetExceeded(f"Session cost budget used up (${cost:.4f}/${SESSION_COST_BUDGET})")
+            if context.get("user_email") and USER_DAILY_COST_BUDGET:
+                since = (datetime.now() - timedelta(days=1)).isoformat()
+                cost = conn.execute(
+                    "SELECT COALESCE(SUM(cost_usd), 0) FROM llm_usage WHERE user_email = ? AND timestamp >= ?",
+                    (context["user_email"], since),
+                ).fetchone()[0]
+                if cost >= USER_DAILY_COST_BUDGET:
+                    raise BudgetExceeded(f"Daily cost budget used up for {context['user_email']} (${cost:.4f})")
+
+    def summary(self, group_by: str = "session_id", since: str = None, limit: int = 100, **filters) -> dict:
+        """
+        Aggregate token and cost totals.
+
+        Args:
+            group_by: One of GROUP_COLUMNS
+            since: ISO timestamp lower bound (optional)
+            limit: Maximum number of groups, most expensive first
+            filters: Exact matches on session_id, user_email, scenario, model or purpose
+
+        Returns:
+            Dict with overall totals and one entry per group
+        """
+        if group_by not in GROUP_COLUMNS:
+            raise ValueError(f"group_by must be one of {', '.join(GROUP_COLUMNS)}")
+        group_expr = "substr(timestamp, 1, 10)" if group_by == "day" else group_by
+        clauses, params = [], []
+        if since:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        for column in ("session_id", "user_email", "scenario", "model", "purpose"):
+            if filters.get(column):
+                clauses.append(f"{column} = ?")
+                params.append(filters[column])
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        totals_sql = ("COUNT(*) AS calls, COALESCE(SUM(prompt_tokens), 0) AS prompt_tokens, "
+                      "COALESCE(SUM(completion_tokens), 0) AS completion_tokens, "
+                      "COALESCE(SUM(total_tokens), 0) AS total_tokens, COALESCE(SUM(cost_usd), 0) AS cost_usd")
+        with self._connect() as conn:
+            totals = dict(conn.execute(f"SELECT {totals_sql} FROM llm_usage {where}", params).fetchone())
+            groups = [dict(row) for row in conn.execute(
+                f"SELECT {group_expr} AS {group_by}, {totals_sql} FROM llm_usage {where} "
+                f"GROUP BY {group_expr} ORDER BY cost_usd DESC, total_tokens DESC LIMIT ?",
+                params + [int(limit)],
+            )]
+        for row in [totals] + groups:
+            row["cost_usd"] = round(row["cost_usd"], 6)
+        return {"group_by": group_by, "totals": totals, "groups": groups}
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+def get_usage_tracker() -> UsageTracker:
+    global _tracker
+    with _tracker_lock:
+        if _tracker is None:
+            _tracker = UsageTracker()
+        return _tracker
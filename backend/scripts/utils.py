@@ -1,37 +1,128 @@
 import sqlite3
-from tabulate import tabulate
-import pandas as pd
+from scripts import db
+from scripts.entity_cache import invalidate_entities
+
+# pandas and tabulate are imported inside the functions that use them:
+# they are only needed on SAP Excel and report paths, not to start the app.
 
 # ----------------------------
 # Connect to SQLite DB
 # ----------------------------
 def get_db_connection():
-    conn = sqlite3.connect("D:\genai\inbound receving with full ui\database\warehouse.db")
+    conn = sqlite3.connect(db.DB_PATH)
     conn.row_factory = sqlite3.Row  # enables dict-like row access
     return conn
 
 # ----------------------------
-# Fetch rows from any table
+# Whitelisted identifiers
+# ----------------------------
+# Table and column names cannot be bound as "?" parameters, so every
+# identifier that ends up in a query string must come from this map.
+TABLE_COLUMNS = {
+    "po_header": ("po_id", "status", "last_updated"),
+    "po_line": ("pallet_id", "po_id", "asn_id", "last_updated", "quantity"),
+    "asn_header": ("asn_id", "supplier_reference", "last_updated"),
+    "asn_line": ("pallet_id", "po_id", "asn_id", "supplier_reference", "last_updated", "quantity"),
+}
+
+DEFAULT_CHUNK_SIZE = 1000
+
+def _check_table(table):
+    name = str(table).lower()
+    if name not in TABLE_COLUMNS:
+        raise ValueError(f"Unknown table: {table}")
+    return name
+
+def _check_columns(table, columns):
+    allowed = TABLE_COLUMNS[table]
+    for col in columns:
+        if col not in allowed:
+            raise ValueError(f"Unknown column '{col}' for table {table}")
+    return list(columns)
+
+def build_select(table, columns=None, where=None, limit=None):
+    """
+    Build a parameterised SELECT from whitelisted identifiers.
+
+    Args:
+        table: Table name (must be in TABLE_COLUMNS)
+        columns: Columns to project; None selects every known column
+        where: Dict of column -> value, combined with AND
+        limit: Optional maximum number of rows
+
+    Returns:
+        (query, params) tuple ready for cursor.execute
+    """
+    table = _check_table(table)
+    columns = _check_columns(table, columns) if columns else list(TABLE_COLUMNS[table])
+    where = where or {}
+    filter_cols = _check_columns(table, where.keys())
+
+    query = f"SELECT {', '.join(columns)} FROM {table}"
+    params = [where[col] for col in filter_cols]
+    if filter_cols:
+        query += " WHERE " + " AND ".join(f"{col} = ?" for col in filter_cols)
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(int(limit))
+    return query, tuple(params)
+
 # ----------------------------
-def fetch_rows(table, where_clause="", params=()):
+# Stream rows from any table
+# ----------------------------
+def stream_rows(table, columns=None, where=None, limit=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield sqlite3.Row objects straight from the cursor, chunk_size at a time."""
+    query, params = build_select(table, columns, where, limit)
     conn = get_db_connection()
-    cursor = conn.cursor()
-    query = f"SELECT * FROM {table} {where_clause}"
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
-    columns = [col[0] for col in cursor.description]  # extract column names
-    conn.close()
-    return pd.DataFrame(rows, columns=columns)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        conn.close()
+
+def stream_frames(table, columns=None, where=None, limit=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield DataFrames of at most chunk_size rows so large dumps never sit in memory at once."""
+    import pandas as pd
+
+    query, params = build_select(table, columns, where, limit)
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        names = [col[0] for col in cursor.description]
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield pd.DataFrame([tuple(row) for row in rows], columns=names)
+    finally:
+        conn.close()
+
+# ----------------------------
+# Fetch rows from any table
+# ----------------------------
+def fetch_rows(table, where=None, columns=None, limit=None):
+    import pandas as pd
+
+    frames = list(stream_frames(table, columns, where, limit))
+    if not frames:
+        return pd.DataFrame(columns=columns or list(TABLE_COLUMNS[_check_table(table)]))
+    return pd.concat(frames, ignore_index=True)
 
 
 # ----------------------------
 # Record existence check
 # ----------------------------
 def record_exists(table, where_col, value):
+    query, params = build_select(table, [where_col], {where_col: value}, limit=1)
     conn = get_db_connection()
     cursor = conn.cursor()
-    query = f"SELECT 1 FROM {table} WHERE {where_col} = ? LIMIT 1"
-    cursor.execute(query, (value,))
+    cursor.execute(query, params)
     result = cursor.fetchone()
     conn.close()
     return bool(result)
@@ -42,6 +133,8 @@ def record_exists(table, where_col, value):
 def format_table_snippet(rows, highlight_key=None, highlight_value=None):
     if not rows:
         return "No matching records found."
+    from tabulate import tabulate
+
     table = [dict(row) for row in rows]
     if highlight_key and highlight_value:
         for row in table:
@@ -53,6 +146,8 @@ def format_table_snippet(rows, highlight_key=None, highlight_value=None):
 # HTML snippet for email with highlight
 # ----------------------------
 def generate_html_snippet(data, highlight_column=None, highlight_value=None):
+    import pandas as pd
+
     df = pd.DataFrame(data)
     if highlight_column and highlight_value:
         df[highlight_column] = df[highlight_column].apply(
@@ -64,12 +159,15 @@ def generate_html_snippet(data, highlight_column=None, highlight_value=None):
 # Parse Excel to DataFrame
 # ----------------------------
 def parse_excel_to_df(filepath):
+    import pandas as pd
+
     return pd.read_excel(filepath)
 
 # ----------------------------
 # Insert pallet data from Excel
 # ----------------------------
 def insert_pallets_from_excel(df, po_id, asn_id):
+    """Insert the pallets of an SAP Excel reply and drop cached lookups for their PO, ASN and pallets."""
     conn = get_db_connection()
     cur = conn.cursor()
     for _, row in df.iterrows():
@@ -79,3 +177,4 @@ def insert_pallets_from_excel(df, po_id, asn_id):
         cur.execute("INSERT OR IGNORE INTO asn_line (asn_id, po_id, pallet_id, qty) VALUES (?, ?, ?, ?)", (asn_id, po_id, pallet_id, qty))
     conn.commit()
     conn.close()
+    invalidate_entities(po_id, asn_id, [str(p) for p in df["pallet_id"]])
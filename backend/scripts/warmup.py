@@ -0,0 +1,156 @@
+# scripts/warmup.py
+# Startup warmup: everything the first /chat request would otherwise pay
+# for (warehouse DB connection and page cache, ID index, regexes, session
+# store, LLM client state) runs once before a worker takes traffic.
+# wsgi.py runs it in gunicorn's post_worker_init hook, asgi.py on lifespan
+# startup and app.py before the development server starts.
+#
+#   cd backend
+#   python -m scripts.warmup --report       # import-time report + warmup timings
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+
+# ---------- CONFIGURATION ----------
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") == "1"
+
+SAMPLE_MESSAGE = "ASN 01234 for PO 2123456789 is missing pallet 512345678901234"
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+# ----------------------------
+# Warmup steps
+# ----------------------------
+def _warm_warehouse_db():
+    # First connection + a read of each table's root page, so the OS page cache is warm
+    from contextlib import closing
+    from scripts.id_index import INDEXED_COLUMNS, connect_readonly
+
+    with closing(connect_readonly()) as conn:
+        for table in INDEXED_COLUMNS:
+            conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchall()
+
+
+def _warm_id_index():
+    from scripts.id_index import ID_INDEX_ENABLED, connect_readonly, get_id_index
+
+    if ID_INDEX_ENABLED and not get_id_index().ensure_built(connect_readonly):
+        raise RuntimeError("a warehouse table could not be read")
+
+
+def _warm_regexes():
+    # re caches the patterns compiled on first use, e.g. the ID checks in validate_ids
+    from scripts.extractor import extract_all_ids, extract_ids, validate_ids
+
+    extract_all_ids(SAMPLE_MESSAGE)
+    validate_ids(extract_ids(SAMPLE_MESSAGE))
+
+
+def _warm_session_store():
+    from scripts.session_store import get_session_store, headless_session_id
+
+    get_session_store().load(headless_session_id())
+
+
+def _warm_llm_client():
+    from scripts.llm_client import get_cassette, get_circuit_breaker
+    from scripts.model_router import build_payload
+    from scripts.usage_tracker import get_usage_tracker
+
+    get_circuit_breaker()
+    get_cassette()
+    get_usage_tracker()
+    build_payload("chat", [{"role": "user", "content": SAMPLE_MESSAGE}])
+
+
+WARMUP_STEPS = (
+    ("warehouse_db", _warm_warehouse_db),
+    ("id_index", _warm_id_index),
+    ("regexes", _warm_regexes),
+    ("session_store", _warm_session_store),
+    ("llm_client", _warm_llm_client),
+)
+
+
+def warmup(steps=WARMUP_STEPS) -> dict:
+    """
+    Run every warmup step; a failing step is logged and skipped, so a worker
+    still starts (cold) when e.g. the warehouse DB is unreachable.
+
+    Returns:
+        Dict of step name -> seconds taken (None for a failed step)
+    """
+    if not WARMUP_ENABLED:
+        return {}
+    timings = {}
+    started = time.perf_counter()
+    for name, step in steps:
+        step_started = time.perf_counter()
+        try:
+            step()
+            timings[name] = time.perf_counter() - step_started
+        except Exception as e:
+            print(f"⚠️ Warmup step {name} failed: {e}")
+            timings[name] = None
+    summary = ", ".join(f"{name} {seconds * 1000:.0f} ms" if seconds is not None else f"{name} failed"
+                        for name, seconds in timings.items())
+    print(f"🔥 Warm in {(time.perf_counter() - started) * 1000:.0f} ms ({summary})")
+    return timings
+
+
+# ----------------------------
+# Import-time report
+# ----------------------------
+def import_time_report(module: str = "app", top: int = 15) -> dict:
+    """
+    Import `module` in a fresh interpreter under -X importtime.
+
+    Returns:
+        Dict with total_ms and the `top` slowest modules by cumulative time
+        ({"module", "self_ms", "cumulative_ms"}), outermost imports first on ties
+    """
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, WARMUP_ENABLED="0", ID_INDEX_ENABLED="0")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=backend, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr.strip()[-2000:]}")
+    rows = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append({"module": name, "self_ms": int(self_us) / 1000,
+                         "cumulative_ms": int(cumulative_us) / 1000, "depth": (len(indent) - 1) // 2})
+    total = next((row["cumulative_ms"] for row in rows if row["module"] == module and row["depth"] == 0), None)
+    slowest = sorted(rows, key=lambda row: (-row["cumulative_ms"], row["depth"]))[:top]
+    return {"module": module, "total_ms": total, "slowest": slowest}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Report import time of the app and time the startup warmup.")
+    parser.add_argument("--report", action="store_true", help="print the slowest imports before warming up")
+    parser.add_argument("--module", default="app", help="module to time (default: app)")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args(argv)
+
+    if args.report:
+        report = import_time_report(args.module, args.top)
+        print(f"⏱️ import {report['module']}: {report['total_ms']:.0f} ms")
+        for row in report["slowest"]:
+            print(f"   {row['cumulative_ms']:8.1f} ms  {'  ' * row['depth']}{row['module']}")
+
+    started = time.perf_counter()
+    __import__(args.module)
+    print(f"⏱️ import {args.module} in this process: {(time.perf_counter() - started) * 1000:.0f} ms")
+    timings = warmup()
+    return 0 if all(seconds is not None for seconds in timings.values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
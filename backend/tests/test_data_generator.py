@@ -0,0 +1,46 @@
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+
+from scripts import db
+from scripts.data_generator import generate
+from scripts.id_index import IdIndex, connect_readonly
+
+
+def test_clean_cases_have_no_injected_fault():
+    conn = sqlite3.connect(":memory:")
+    manifest = generate(conn, 200, seed=7, as_of=datetime(2026, 1, 1))
+
+    clean = manifest["cases"]["clean"]
+    assert clean
+    assert "03351" not in {case["asn_id"] for case in clean}
+    for case in clean:
+        shipped = conn.execute("SELECT COUNT(*) FROM ASN_Line WHERE pallet_id = ? AND asn_id = ?",
+                               (case["pallet_id"], case["asn_id"])).fetchone()[0]
+        faults = conn.execute(
+            "SELECT COUNT(*) FROM PO_Line p LEFT JOIN ASN_Line a ON a.pallet_id = p.pallet_id "
+            "WHERE p.asn_id = ? AND (a.pallet_id IS NULL OR a.quantity != p.quantity)",
+            (case["asn_id"],),
+        ).fetchone()[0]
+        assert shipped == 1
+        assert faults == 0
+
+
+def test_appended_rows_reach_a_built_id_index(tmp_path, monkeypatch):
+    path = tmp_path / "bench.db"
+    monkeypatch.setattr(db, "DB_PATH", str(path))
+    with closing(sqlite3.connect(path)) as conn:
+        generate(conn, 20, seed=1, as_of=datetime(2026, 1, 1))
+    index = IdIndex()
+    assert index.rebuild(connect_readonly)
+
+    # Appended with an older --as-of: every row is behind the index watermark.
+    with closing(sqlite3.connect(path)) as conn:
+        manifest = generate(conn, 20, seed=2, as_of=datetime(2025, 1, 1))
+    case = manifest["cases"]["clean"][0]
+    assert not index.might_exist("po_id", case["po_id"])
+
+    index.refresh(connect_readonly)
+    assert index.might_exist("asn_id", case["asn_id"])
+    assert index.might_exist("po_id", case["po_id"])
+    assert index.might_exist("pallet_id", case["pallet_id"])
@@ -0,0 +1,56 @@
+import sqlite3
+
+import pytest
+
+from scripts import db
+from scripts.data_generator import SCHEMA
+from scripts.entity_cache import get_entity_cache
+
+
+@pytest.fixture
+def warehouse_db(tmp_path, monkeypatch):
+    """A warehouse DB in the production schema: PO 2000000001 on ASN 01234, one pallet short."""
+    path = tmp_path / "warehouse.db"
+    conn = sqlite3.connect(path)
+    for statement in SCHEMA:
+        conn.execute(statement)
+    with conn:
+        conn.execute("INSERT INTO PO_Header VALUES ('2000000001', 'inprogress', '2025-01-01 10:00:00')")
+        conn.execute("INSERT INTO ASN_Header VALUES ('01234', 'abc123', '2025-01-01 10:00:00')")
+        conn.executemany("INSERT INTO PO_Line VALUES (?, '2000000001', '01234', '2025-01-01 10:00:00', ?)",
+                         [("500000000000001", 3), ("500000000000002", 4), ("500000000000003", 5)])
+        conn.executemany("INSERT INTO ASN_Line VALUES (?, '2000000001', '01234', 'abc123', '2025-01-01 10:00:00', ?)",
+                         [("500000000000001", 3), ("500000000000002", 2)])
+    conn.close()
+    monkeypatch.setattr(db, "DB_PATH", str(path))
+    get_entity_cache().clear()
+    yield path
+    get_entity_cache().clear()
+
+
+def test_po_vs_asn_qty_summary(warehouse_db):
+    assert db.get_po_vs_asn_qty_summary("2000000001") == {
+        "asn_pallets": 2, "asn_qty": 5, "po_pallets": 3, "po_qty": 12,
+    }
+
+
+def test_po_vs_asn_qty_summary_forasn(warehouse_db):
+    assert db.get_po_vs_asn_qty_summary_forasn("01234") == {
+        "asn_pallets": 2, "asn_qty": 5, "po_pallets": 3, "po_qty": 12,
+    }
+
+
+def test_qty_summaries_for_unknown_ids_are_empty(warehouse_db):
+    assert db.get_po_vs_asn_qty_summary("2999999999") == db.EMPTY_QTY_SUMMARY
+    assert db.get_po_vs_asn_qty_summary_forasn("09999") == db.EMPTY_QTY_SUMMARY
+
+
+def test_not_found_is_not_cached(warehouse_db):
+    assert not db.check_po_exists("2000000002")
+    assert db.get_po_vs_asn_qty_summary("2000000002") == db.EMPTY_QTY_SUMMARY
+
+    # Rows inserted by another process (e.g. SAP), with no invalidation here.
+    with sqlite3.connect(warehouse_db) as conn:
+        conn.execute("INSERT INTO PO_Line VALUES ('500000000000009', '2000000002', '01234', NULL, 6)")
+    assert db.check_po_exists("2000000002")
+    assert db.get_po_vs_asn_qty_summary("2000000002")["po_qty"] == 6
@@ -0,0 +1,53 @@
+import sqlite3
+from contextlib import closing
+
+import pytest
+
+from scripts import db, id_index
+from scripts.data_generator import SCHEMA
+from scripts.entity_cache import get_entity_cache
+from scripts.id_index import IdIndex, connect_readonly, refresh_id_index
+
+
+@pytest.fixture
+def warehouse_db(tmp_path, monkeypatch):
+    """A warehouse DB with PO 2000000001 and one pallet, and a fresh index built over it."""
+    path = tmp_path / "warehouse.db"
+    with closing(sqlite3.connect(path)) as conn, conn:
+        for statement in SCHEMA:
+            conn.execute(statement)
+        conn.execute("INSERT INTO PO_Header VALUES ('2000000001', 'inprogress', '2025-06-01 10:00:00')")
+        conn.execute("INSERT INTO PO_Line VALUES ('500000000000001', '2000000001', '01234', '2025-06-01 10:00:00', 3)")
+    monkeypatch.setattr(db, "DB_PATH", str(path))
+    index = IdIndex()
+    monkeypatch.setattr(id_index, "_index", index)
+    assert index.rebuild(connect_readonly)
+    get_entity_cache().clear()
+    yield path
+    get_entity_cache().clear()
+
+
+def insert_externally(path, *rows):
+    """PO_Line rows (pallet, PO, last_updated) written by another process, e.g. SAP, bypassing mark_ids_present."""
+    with closing(sqlite3.connect(path)) as conn, conn:
+        conn.executemany("INSERT INTO PO_Line VALUES (?, ?, '01234', ?, 2)", rows)
+
+
+def test_refresh_finds_rows_without_a_newer_last_updated(warehouse_db):
+    index = id_index.get_id_index()
+    insert_externally(warehouse_db, ("500000000000002", "2000000001", None),
+                      ("500000000000003", "2000000001", "2000-01-01"))
+    assert not index.might_exist("pallet_id", "500000000000002")
+
+    assert index.refresh(connect_readonly) == 2
+    assert index.might_exist("pallet_id", "500000000000002")
+    assert index.might_exist("pallet_id", "500000000000003")
+    assert not index.might_exist("pallet_id", "500000000000004")
+
+
+def test_recheck_after_external_insert_reads_the_new_row(warehouse_db):
+    assert not db.check_po_exists("2000000002")
+    insert_externally(warehouse_db, ("500000000000002", "2000000002", None))
+
+    refresh_id_index()
+    assert db.check_po_exists("2000000002")
@@ -0,0 +1,13 @@
+from scripts.model_router import DEFAULT_ROUTES, ModelRouter
+
+
+def test_slow_task_does_not_move_other_tasks_off_a_shared_model():
+    router = ModelRouter(routes={task: dict(route) for task, route in DEFAULT_ROUTES.items()}, min_samples=3)
+    model = DEFAULT_ROUTES["classify"]["model"]
+    assert DEFAULT_ROUTES["chat"]["model"] == model
+    for _ in range(5):
+        router.observe("chat", model, 6.0)  # long-context chat calls, over the chat SLO
+        router.observe("classify", model, 0.3)
+
+    assert router.choose_model("classify") == model
+    assert router.choose_model("chat") == DEFAULT_ROUTES["chat"]["fallbacks"][0]
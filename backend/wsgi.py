@@ -0,0 +1,56 @@
+# wsgi.py
+# Production entry point: serves app.py from several worker processes.
+#
+#   python wsgi.py                      # WEB_WORKERS defaults to 2 * cores + 1
+#   gunicorn -c wsgi.py wsgi:app        # same settings through the gunicorn CLI
+#
+# All per-user state lives in the session store (scripts/session_store.py),
+# so any worker can serve any request.
+import multiprocessing
+import os
+
+from app import app, start_worker_threads
+from scripts.warmup import warmup
+
+bind = os.getenv("WEB_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_WORKERS", str(multiprocessing.cpu_count() * 2 + 1)))
+threads = int(os.getenv("WEB_THREADS", "4"))
+timeout = int(os.getenv("WEB_TIMEOUT", "900"))  # SAP waits can take several minutes
+
+
+def post_worker_init(worker):
+    # gunicorn hook: warm each worker before it accepts its first request,
+    # then start its background threads (they do not survive the fork)
+    warmup()
+    start_worker_threads()
+
+
+def worker_exit(server, worker):
+    # gunicorn hook, run in the worker: it leaves through os._exit, so
+    # atexit handlers never write the buffered chat turns
+    from scripts.chat_history import get_chat_history
+
+    get_chat_history().close()
+
+
+def run():
+    from gunicorn.app.base import BaseApplication
+
+    class StandaloneApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", bind)
+            self.cfg.set("workers", workers)
+            self.cfg.set("threads", threads)
+            self.cfg.set("timeout", timeout)
+            self.cfg.set("post_worker_init", post_worker_init)
+            self.cfg.set("worker_exit", worker_exit)
+
+        def load(self):
+            return app
+
+    print(f"Starting {workers} workers x {threads} threads on {bind}")
+    StandaloneApplication().run()
+
+
+if __name__ == '__main__':
+    run()
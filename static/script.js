@@ -96,6 +96,13 @@ class ChatbotUI {
                 }
             }
 
+            // A paused workflow asks for details; the next message answers it
+            if (data.need_input) {
+                this.messageInput.placeholder = data.need_input.prompt;
+            } else if (!this.isEmailPhase) {
+                this.messageInput.placeholder = "Describe your inbound receiving issue...";
+            }
+
             // Display print outputs if available
             if (data.print_outputs && data.print_outputs.length > 0) {
                 data.print_outputs.forEach(output => {